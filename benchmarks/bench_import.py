@@ -0,0 +1,74 @@
+"""
+Cold start of the ``nauta`` command
+
+Usage:
+    python -m benchmarks.bench_import [-n NUMBER] [--max-ms MS] [--allow MODULE] [ARGS ...]
+
+Runs ``nauta ARGS`` (``--version`` by default) in fresh interpreters and
+reports the wall time and the ``-X importtime`` cost of ``nautapy.cli``.
+Exits with an error when the median wall time exceeds ``--max-ms`` or a
+module in ``HEAVY_MODULES`` not explicitly allowed gets imported.
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["requests", "bs4", "sqlite3", "asyncio"]
+
+RUN_CLI = (
+    "import sys\n"
+    "sys.argv = ['nauta'] + sys.argv[1:]\n"
+    "import nautapy.cli\n"
+    "try:\n"
+    "    nautapy.cli.main()\n"
+    "except SystemExit:\n"
+    "    pass\n"
+)
+
+
+def run(args, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", RUN_CLI] + args
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, proc.stderr
+
+
+def parse_importtime(output):
+    """Cumulative import time in microseconds of every top level module"""
+    modules = {}
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            modules[match.group(3)] = int(match.group(1))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if the median wall time is higher")
+    parser.add_argument("--allow", action="append", default=[], help="Heavy module the command may import")
+    parser.add_argument("args", nargs="*", default=["--version"])
+    args = parser.parse_args()
+
+    times = [run(args.args)[0] for _ in range(args.number)]
+    _, output = run(args.args, importtime=True)
+    modules = parse_importtime(output)
+    heavy = [module for module in HEAVY_MODULES if module in modules and module not in args.allow]
+
+    median = statistics.median(times) * 1000
+    print("command:            nauta {}".format(" ".join(args.args)))
+    print("wall time:          p50 {:.1f} ms, min {:.1f} ms".format(median, min(times) * 1000))
+    print("nautapy.cli import: {:.1f} ms".format(modules.get("nautapy.cli", 0) / 1000))
+    print("heavy modules:      {}".format(", ".join(heavy) or "none"))
+
+    if heavy or (args.max_ms is not None and median > args.max_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
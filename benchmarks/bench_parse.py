@@ -0,0 +1,73 @@
+"""
+Parse microbenchmark: :mod:`nautapy.forms` vs BeautifulSoup
+
+Usage:
+    python -m benchmarks.bench_parse [-n NUMBER]
+
+Runs the lookups done by :class:`NautaProtocol` against the saved
+portal pages in ``test/assets``.
+"""
+
+import argparse
+import os
+import timeit
+
+import bs4
+
+from nautapy import forms
+from nautapy.nauta_api import NautaProtocol
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "assets")
+
+
+def read_asset(asset_name):
+    with open(os.path.join(ASSETS_DIR, asset_name)) as fp:
+        return fp.read()
+
+
+LANDING_HTML = read_asset("landing.html")
+LOGIN_HTML = read_asset("login_page.html")
+
+
+def bs4_landing():
+    return NautaProtocol._get_inputs(bs4.BeautifulSoup(LANDING_HTML, "html.parser"))
+
+
+def bs4_login():
+    form_soup = bs4.BeautifulSoup(LOGIN_HTML, "html.parser").find("form", id="formulario")
+    return form_soup["action"], NautaProtocol._get_inputs(form_soup)
+
+
+def extractor_landing():
+    return forms.extract_form(LANDING_HTML)
+
+
+def extractor_login():
+    return forms.extract_form(LOGIN_HTML, form_id="formulario", names=("CSRFHW", "wlanuserip"))
+
+
+CASES = [
+    ("landing.html", bs4_landing, extractor_landing),
+    ("login_page.html", bs4_login, extractor_login),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=500)
+    args = parser.parse_args()
+
+    print("{:<18}{:>14}{:>14}{:>10}".format("page", "bs4 (us)", "forms (us)", "speedup"))
+    for name, baseline, candidate in CASES:
+        t_baseline = min(timeit.repeat(baseline, number=args.number, repeat=3)) / args.number
+        t_candidate = min(timeit.repeat(candidate, number=args.number, repeat=3)) / args.number
+        print("{:<18}{:>14.1f}{:>14.1f}{:>9.1f}x".format(
+            name,
+            t_baseline * 1e6,
+            t_candidate * 1e6,
+            t_baseline / t_candidate
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Login/logout throughput and latency against :class:`MockPortal`
+
+Usage:
+    python -m benchmarks.bench_portal [-n USERS] [-c CONCURRENCY] [-l LATENCY] [-j JITTER]
+                                      [-e ERROR_RATE] [-x DROP_RATE] [--paths sync,threads,async]
+
+Every path logs in all the users with a full handshake and logs them out:
+
+* sync: one :class:`NautaClient` after the other.
+* threads: :class:`SessionManager` with ``CONCURRENCY`` workers.
+* async: :class:`AsyncNautaClient` with ``asyncio.gather``.
+
+``LATENCY`` and ``JITTER`` are added by the portal to every request,
+``ERROR_RATE`` answers 503 and ``DROP_RATE`` closes the connection.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from requests import RequestException
+
+from nautapy import nauta_api, time_cache, traffic, usage
+from nautapy.async_api import AsyncNautaClient, AsyncNautaProtocol
+from nautapy.exceptions import NautaException
+from nautapy.mock_portal import MockPortal
+from nautapy.nauta_api import NautaClient, NautaProtocol
+from nautapy.probe import ContentProbe, ProbeEngine
+from nautapy.session_manager import SessionManager
+
+PATHS = ("sync", "threads", "async")
+
+
+def percentile(values, percent):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Result(object):
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.failures = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        ok = len(self.latencies)
+        print("{:<16}{:>6} ok{:>6} err{:>10.1f}/s{:>10.1f} ms{:>10.1f} ms".format(
+            self.name, ok, self.failures, ok / self.elapsed if self.elapsed else 0,
+            percentile(self.latencies, 50) * 1000, percentile(self.latencies, 99) * 1000
+        ))
+
+
+def timed(result, func):
+    start = time.perf_counter()
+    try:
+        func()
+    except (NautaException, RequestException):
+        result.failures += 1
+        return False
+    result.latencies.append(time.perf_counter() - start)
+    return True
+
+
+def run_sync(accounts, tmp, concurrency):
+    login, logout = Result("sync login"), Result("sync logout")
+    clients = [
+        NautaClient(user, password, fast_login=False, check_connection=False,
+                    session_file=os.path.join(tmp, "sync-" + user))
+        for user, password in accounts
+    ]
+
+    start = time.perf_counter()
+    logged_in = [client for client in clients if timed(login, client.login)]
+    login.elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for client in logged_in:
+        timed(logout, client.logout)
+    logout.elapsed = time.perf_counter() - start
+    return login, logout
+
+
+def run_threads(accounts, tmp, concurrency):
+    login, logout = Result("threads login"), Result("threads logout")
+    manager = SessionManager(accounts, max_workers=concurrency, sessions_dir=os.path.join(tmp, "sessions"))
+
+    for result, operation in [(login, manager.login_all), (logout, manager.logout_all)]:
+        start = time.perf_counter()
+        for pool_result in operation():
+            if pool_result.ok:
+                result.latencies.append(pool_result.latency)
+            else:
+                result.failures += 1
+        result.elapsed = time.perf_counter() - start
+    return login, logout
+
+
+def run_async(accounts, tmp, concurrency):
+    login, logout = Result("async login"), Result("async logout")
+    AsyncNautaProtocol.configure(max_workers=concurrency)
+
+    async def timed_async(result, coro_func):
+        start = time.perf_counter()
+        try:
+            await coro_func()
+        except (NautaException, RequestException):
+            result.failures += 1
+            return False
+        result.latencies.append(time.perf_counter() - start)
+        return True
+
+    async def main():
+        clients = [AsyncNautaClient(user, password) for user, password in accounts]
+
+        start = time.perf_counter()
+        ok = await asyncio.gather(*[timed_async(login, client.login) for client in clients])
+        login.elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            timed_async(logout, client.logout) for client, logged_in in zip(clients, ok) if logged_in
+        ])
+        logout.elapsed = time.perf_counter() - start
+
+    try:
+        asyncio.run(main())
+    finally:
+        AsyncNautaProtocol.shutdown()
+    return login, logout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--users", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-l", "--latency", type=float, default=0.01)
+    parser.add_argument("-j", "--jitter", type=float, default=0.0)
+    parser.add_argument("-e", "--error-rate", type=float, default=0.0)
+    parser.add_argument("-x", "--drop-rate", type=float, default=0.0)
+    parser.add_argument("--paths", default=",".join(PATHS))
+    args = parser.parse_args()
+
+    accounts = [("user{}@nauta.com.cu".format(i), "pass{}".format(i)) for i in range(args.users)]
+    runners = {"sync": run_sync, "threads": run_threads, "async": run_async}
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            MockPortal(dict(accounts), latency=args.latency, jitter=args.jitter,
+                       error_rate=args.error_rate, drop_rate=args.drop_rate) as portal:
+        nauta_api.LOGIN_URL = portal.url
+        nauta_api.CHECK_PAGE = portal.check_url
+        nauta_api.NAUTA_SESSION_FILE = os.path.join(tmp, "nauta-session")
+        nauta_api.NAUTA_LOGIN_CACHE_FILE = os.path.join(tmp, "nauta-login-cache")
+        # The fake accounts stay out of the real caches and stats
+        time_cache.TIME_CACHE_FILE = os.path.join(tmp, "time-cache")
+        traffic.STATS_DB = os.path.join(tmp, "stats.db")
+        usage.USAGE_DB = os.path.join(tmp, "usage.db")
+        NautaProtocol.probe_engine = ProbeEngine([ContentProbe(portal.check_url)])
+
+        print("{} users, concurrency {}, latency {}s, jitter {}s, errors {:.0%}, drops {:.0%}\n".format(
+            args.users, args.concurrency, args.latency, args.jitter, args.error_rate, args.drop_rate
+        ))
+        print("{:<16}{:>9}{:>10}{:>12}{:>13}{:>13}".format("", "", "", "throughput", "p50", "p99"))
+
+        for name in args.paths.split(","):
+            for result in runners[name](accounts, tmp, args.concurrency):
+                result.report()
+            # Users still logged in after a failed logout would fail the next path
+            portal.sessions.clear()
+
+        print("\n{} requests, {} faults injected".format(len(portal.requests), portal.faults))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Throughput and latency of :class:`NautaProxy` against a local echo upstream
+
+Usage:
+    python -m benchmarks.bench_proxy [-c CONNECTIONS] [-s SIZE_MB]
+
+No Nauta session is opened, the proxy uses a fake client.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from nautapy.proxy import NautaProxy
+
+
+class FakeClient(object):
+    user = "bench"
+    is_logged_in = False
+
+    def login(self):
+        self.is_logged_in = True
+
+    def logout(self):
+        self.is_logged_in = False
+
+
+async def echo(reader, writer):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def transfer(proxy_port, upstream_port, payload):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    writer.write("CONNECT 127.0.0.1:{} HTTP/1.1\r\n\r\n".format(upstream_port).encode())
+    await reader.readuntil(b"\r\n\r\n")
+    latency = time.perf_counter() - start
+
+    async def send():
+        writer.write(payload)
+        await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    await reader.readexactly(len(payload))
+    await sender
+    writer.close()
+
+    return latency
+
+
+async def bench(connections, size):
+    upstream = await asyncio.start_server(echo, "127.0.0.1", 0)
+    upstream_port = upstream.sockets[0].getsockname()[1]
+
+    proxy = NautaProxy(FakeClient(), time_unit=60)
+    await proxy.start(port=0)
+
+    payload = b"x" * size
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[
+        transfer(proxy.port, upstream_port, payload)
+        for _ in range(connections)
+    ])
+    elapsed = time.perf_counter() - start
+
+    await proxy.close()
+    upstream.close()
+
+    total = 2 * size * connections
+    print("connections:        {}".format(connections))
+    print("relayed:            {:.1f} MB in {:.2f}s".format(total / 1e6, elapsed))
+    print("throughput:         {:.1f} MB/s".format(total / 1e6 / elapsed))
+    print("connect latency:    p50 {:.2f} ms, max {:.2f} ms".format(
+        statistics.median(latencies) * 1000,
+        max(latencies) * 1000
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--connections", type=int, default=32)
+    parser.add_argument("-s", "--size", type=int, default=8, help="MB sent per connection")
+    args = parser.parse_args()
+
+    asyncio.run(bench(args.connections, args.size * 1024 * 1024))
+
+
+if __name__ == '__main__':
+    main()
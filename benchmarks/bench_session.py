@@ -0,0 +1,89 @@
+"""
+Session persistence: :mod:`nautapy.session_store` vs the old MozillaCookieJar files
+
+Usage:
+    python -m benchmarks.bench_session [-n NUMBER] [-c COOKIES]
+
+The old format wrote the cookies in the Netscape text format plus a JSON
+file with the session fields, without fsync. The store writes a single
+fsynced record, so saving is bounded by the disk, loading is what runs on
+every command.
+"""
+
+import argparse
+import http.cookiejar as cookielib
+import json
+import os
+import tempfile
+import timeit
+
+from requests.cookies import RequestsCookieJar, create_cookie
+
+from nautapy.session_store import dump_cookies, load_cookies, read_record, write_record
+
+SESSION = {
+    "login_action": "https://secure.etecsa.net:8443//LoginServlet",
+    "csrfhw": "0123456789abcdef0123456789abcdef",
+    "wlanuserip": "10.190.20.96",
+    "attribute_uuid": "0123456789ABCDEF0123456789ABCDEF",
+    "username": "pepe@nauta.com.cu",
+}
+
+
+def make_cookies(jar, count):
+    for i in range(count):
+        jar.set_cookie(create_cookie(
+            "cookie{}".format(i), "v" * 32, domain="secure.etecsa.net", path="/", expires=2000000000
+        ))
+    return jar
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    parser.add_argument("-c", "--cookies", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cookie_file = os.path.join(tmp, "cookies.txt")
+        json_file = os.path.join(tmp, "session.json")
+        record_file = os.path.join(tmp, "session")
+
+        mozilla_jar = make_cookies(cookielib.MozillaCookieJar(cookie_file), args.cookies)
+        requests_jar = make_cookies(RequestsCookieJar(), args.cookies)
+
+        def old_save():
+            mozilla_jar.save(ignore_discard=True)
+            with open(json_file, "w") as fp:
+                json.dump(SESSION, fp)
+
+        def old_load():
+            cookielib.MozillaCookieJar(cookie_file).load(ignore_discard=True)
+            with open(json_file) as fp:
+                json.load(fp)
+
+        def new_save():
+            write_record(record_file, dict(SESSION, cookies=dump_cookies(requests_jar)))
+
+        def new_load():
+            record = read_record(record_file)
+            load_cookies(RequestsCookieJar(), record.pop("cookies"))
+
+        old_save()
+        new_save()
+        print("record size:        {} bytes (old: {} bytes in 2 files)".format(
+            os.path.getsize(record_file), os.path.getsize(cookie_file) + os.path.getsize(json_file)
+        ))
+
+        for name, func, number in [
+            ("load, MozillaCookieJar", old_load, args.number),
+            ("load, session_store", new_load, args.number),
+            ("save, MozillaCookieJar", old_save, args.number),
+            ("save, session_store", new_save, max(1, args.number // 10)),
+        ]:
+            elapsed = timeit.timeit(func, number=number)
+            print("{:<24}{:8.1f} us".format(name + ":", elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
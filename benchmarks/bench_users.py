@@ -0,0 +1,84 @@
+"""
+Bulk account import/export and prefix lookups with many stored users
+
+Usage:
+    python -m benchmarks.bench_users [-u USERS] [-n LOOKUPS]
+
+Works on a temporary ``users.db`` filled with synthetic accounts.
+"""
+
+import argparse
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from nautapy.credentials import CredentialStore, read_accounts, write_accounts
+
+
+def synthetic_accounts(count):
+    for i in range(count):
+        yield "user{:06d}@nauta.com.cu".format(i), "pass{}".format(i)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--users", type=int, default=100000)
+    parser.add_argument("-n", "--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CredentialStore(os.path.join(tmp, "users.db"))
+
+        csv_data = io.StringIO()
+        write_accounts(csv_data, synthetic_accounts(args.users), "csv")
+        csv_data.seek(0)
+
+        elapsed, count = timed(lambda: store.import_accounts(read_accounts(csv_data, "csv")))
+        print("import:             {} users in {:.2f}s ({:.0f}/s)".format(count, elapsed, count / elapsed))
+
+        elapsed, _ = timed(lambda: write_accounts(io.StringIO(), store.export_accounts(), "jsonl"))
+        print("export:             {:.2f}s".format(elapsed))
+
+        prefixes = ["user{:06d}".format(random.randrange(args.users)) for _ in range(args.lookups)]
+
+        elapsed, _ = timed(lambda: [store.find(prefix) for prefix in prefixes])
+        print("prefix range query: {:.1f} us/lookup".format(elapsed / args.lookups * 1e6))
+
+        # What a one-shot command pays: open the store and resolve one prefix
+        def one_shot(prefix):
+            other = CredentialStore(store.path)
+            other.find(prefix)
+            other.close()
+
+        scans = prefixes[:max(1, args.lookups // 10)]
+        elapsed, _ = timed(lambda: [one_shot(prefix) for prefix in scans])
+        print("open + lookup:      {:.1f} us/command".format(elapsed / len(scans) * 1e6))
+
+        # Loading every user to resolve prefixes in memory, as a sorted list
+        elapsed, _ = timed(lambda: sorted(rec[0] for rec in store.connection.execute("SELECT user FROM users")))
+        print("load all users:     {:.1f} us".format(elapsed * 1e6))
+
+        # What older versions did: a LIKE scan over an unindexed table
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE users (user TEXT, password TEXT)")
+        conn.executemany("INSERT INTO users VALUES (?, ?)", synthetic_accounts(args.users))
+        elapsed, _ = timed(lambda: [
+            conn.execute("SELECT * FROM users WHERE user LIKE ?", (prefix + "%",)).fetchall()
+            for prefix in scans
+        ])
+        print("LIKE scan:          {:.1f} us/lookup".format(elapsed / len(scans) * 1e6))
+
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,5 +2,10 @@ import os
 
 
 appdata_path = os.path.expanduser("~/.local/share/nautapy")
-os.makedirs(appdata_path, exist_ok=True)
 
+
+def ensure_dir(path):
+    """Creates the directory containing ``path`` before writing to it"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,186 @@
+"""
+Asyncio API for interacting with Nauta Captive Portal
+
+Example:
+    async def connect(user, password):
+        client = AsyncNautaClient(user, password)
+        async with await client.login():
+            # We are connected
+            print(await client.remaining_time)
+
+        # We are disconnected now
+
+    async def main():
+        await asyncio.gather(*[
+            connect(user, password) for user, password in accounts
+        ])
+
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import RequestException
+
+from nautapy.__about__ import __name__ as prog_name
+from nautapy.exceptions import NautaLogoutException
+from nautapy.nauta_api import NautaProtocol, SessionObject
+
+MAX_CONCURRENT_REQUESTS = 128
+
+
+class AsyncNautaProtocol(object):
+    """Protocol Layer (asyncio Interface)
+
+    Mirrors every classmethod of :class:`NautaProtocol` as a coroutine.
+    Blocking calls are dispatched to a bounded thread pool shared by
+    the whole process, so a single event loop can drive hundreds of
+    sessions while no more than ``max_workers`` requests are in flight.
+
+    """
+    _executor = None
+    _max_workers = MAX_CONCURRENT_REQUESTS
+
+    @classmethod
+    def configure(cls, max_workers=MAX_CONCURRENT_REQUESTS):
+        cls.shutdown()
+        cls._max_workers = max_workers
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
+
+    @classmethod
+    def _get_executor(cls):
+        if not cls._executor:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=cls._max_workers,
+                thread_name_prefix=prog_name
+            )
+        return cls._executor
+
+    @classmethod
+    async def _run(cls, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls._get_executor(),
+            functools.partial(func, *args, **kwargs)
+        )
+
+    @classmethod
+    async def is_connected(cls, timeout=3):
+        return await cls._run(NautaProtocol.is_connected, timeout=timeout)
+
+    @classmethod
+    async def create_session(cls, check_connection=True):
+        return await cls._run(NautaProtocol.create_session, check_connection=check_connection)
+
+    @classmethod
+    async def login(cls, session, username, password):
+        return await cls._run(NautaProtocol.login, session, username, password)
+
+    @classmethod
+    async def logout(cls, session, username):
+        return await cls._run(NautaProtocol.logout, session, username)
+
+    @classmethod
+    async def get_user_time(cls, session, username):
+        return await cls._run(NautaProtocol.get_user_time, session, username)
+
+    @classmethod
+    async def get_user_credit(cls, session, username, password):
+        return await cls._run(NautaProtocol.get_user_credit, session, username, password)
+
+
+class AsyncNautaClient(object):
+    """Asyncio counterpart of :class:`NautaClient`
+
+    Sessions are kept in memory only, so many clients can be logged in
+    at the same time without competing for ``NAUTA_SESSION_FILE``.
+
+    """
+    def __init__(self, user, password, check_connection=False):
+        self.user = user
+        self.password = password
+        self.check_connection = check_connection
+        self.session = None
+
+    async def init_session(self):
+        self.session = await AsyncNautaProtocol.create_session(
+            check_connection=self.check_connection
+        )
+
+    @property
+    def is_logged_in(self):
+        return bool(self.session and self.session.attribute_uuid)
+
+    async def login(self):
+        if not self.session:
+            await self.init_session()
+
+        self.session.attribute_uuid = await AsyncNautaProtocol.login(
+            self.session,
+            self.user,
+            self.password
+        )
+
+        return self
+
+    @property
+    def user_credit(self):
+        return self._user_credit()
+
+    async def _user_credit(self):
+        dispose_session = False
+        try:
+            if not self.session:
+                dispose_session = True
+                await self.init_session()
+
+            return await AsyncNautaProtocol.get_user_credit(
+                session=self.session,
+                username=self.user,
+                password=self.password
+            )
+        finally:
+            if self.session and dispose_session:
+                self.session = None
+
+    @property
+    def remaining_time(self):
+        return self._remaining_time()
+
+    async def _remaining_time(self):
+        session = self.session or SessionObject()
+        return await AsyncNautaProtocol.get_user_time(
+            session=session,
+            username=self.user,
+        )
+
+    async def logout(self):
+        # NautaProtocol retries with backoff in the worker thread
+        try:
+            await AsyncNautaProtocol.logout(
+                session=self.session,
+                username=self.user,
+            )
+            self.session = None
+            return
+        except RequestException:
+            pass
+
+        raise NautaLogoutException(
+            "Hay problemas en la red y no se puede cerrar la sessión.\n"
+            "Es posible que ya esté desconectado. Intente con '{} down' "
+            "dentro de unos minutos".format(prog_name)
+        )
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.is_logged_in:
+            await self.logout()
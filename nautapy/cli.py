@@ -1,91 +1,47 @@
 import argparse
+import functools
 import os
 import sys
 import time
-import sqlite3
 from getpass import getpass
 
-from requests import RequestException
-
+# Heavy modules (requests, bs4, sqlite3, asyncio, ...) are imported by the
+# subcommands that need them, so commands like '--version' start fast
 from nautapy.exceptions import NautaException
-from nautapy.nauta_api import NautaClient, NautaProtocol
 from nautapy import utils
 from nautapy.__about__ import __cli__ as prog_name, __version__ as version
-from nautapy import appdata_path
-
-from base64 import b85encode, b85decode
-
-
-USERS_DB = os.path.join(appdata_path, "users.db")
 
 
-def users_db_connect():
-    conn = sqlite3.connect(USERS_DB)
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS users (user TEXT, password TEXT)")
-    cursor.execute("CREATE TABLE IF NOT EXISTS default_user (user TEXT)")
+def _store():
+    from nautapy.credentials import CredentialStore
 
-    conn.commit()
-    return cursor, conn
+    return CredentialStore.default()
 
 
 def _get_default_user():
-    cursor, _ = users_db_connect()
-
-    # Search for explicit default value
-    cursor.execute("SELECT user FROM default_user LIMIT 1")
-    rec = cursor.fetchone()
-    if rec:
-        return rec[0]
-
-    # If no explicit value exists, find the first user
-    cursor.execute("SELECT * FROM users LIMIT 1")
-
-    rec = cursor.fetchone()
-    if rec:
-        return rec[0]
+    return _store().default_user()
 
 
 def _find_credentials(user, default_password=None):
-    cursor, _ = users_db_connect()
-    cursor.execute("SELECT * FROM users WHERE user LIKE ?", (user + '%',))
-
-    rec = cursor.fetchone()
-    if rec:
-        return rec[0], b85decode(rec[1]).decode('utf-8')
-    else:
-        return user, default_password
+    return _store().find(user) or (user, default_password)
 
 
 def add_user(args):
     password = args.password or getpass("Contraseña para {}: ".format(args.user))
 
-    cursor, connection = users_db_connect()
-    cursor.execute("INSERT INTO users VALUES (?, ?)", (args.user, b85encode(password.encode('utf-8'))))
-    connection.commit()
+    _store().add(args.user, password)
 
     print("Usuario guardado: {}".format(args.user))
 
 
 def set_default_user(args):
-    cursor, connection = users_db_connect()
-    cursor.execute("SELECT count(user) FROM default_user")
-    res = cursor.fetchone()
-
-    if res[0]:
-        cursor.execute("UPDATE default_user SET user=?", (args.user,))
-    else:
-        cursor.execute("INSERT INTO default_user VALUES (?)", (args.user,))
-
-    connection.commit()
+    _store().set_default_user(args.user)
 
     print("Usuario predeterminado: {}".format(args.user))
 
 
 def remove_user(args):
-    cursor, connection = users_db_connect()
-    cursor.execute("DELETE FROM users WHERE user=?", (args.user,))
-    connection.commit()
+    _store().remove(args.user)
 
     print("Usuario eliminado: {}".format(args.user))
 
@@ -93,19 +49,117 @@ def remove_user(args):
 def set_password(args):
     password = args.password or getpass("Contraseña para {}: ".format(args.user))
 
-    cursor, connection = users_db_connect()
-    cursor.execute("UPDATE users SET password=? WHERE user=?", (b85encode(password.encode('utf-8')), args.user))
-
-    connection.commit()
+    _store().set_password(args.user, password)
 
     print("Contraseña actualizada: {}".format(args.user))
 
 
 def list_users(args):
-    cursor, _ = users_db_connect()
+    for user in _store().users():
+        print(user)
+
+
+def _accounts_format(args, path):
+    if args.format:
+        return args.format
+    return "jsonl" if path and path.endswith((".jsonl", ".json")) else "csv"
+
+
+def import_users(args):
+    from nautapy.credentials import read_accounts
+
+    fmt = _accounts_format(args, args.file)
+    if args.file == "-":
+        count = _store().import_accounts(read_accounts(sys.stdin, fmt))
+    else:
+        with open(args.file, newline="") as fp:
+            count = _store().import_accounts(read_accounts(fp, fmt))
+
+    print("Usuarios importados: {}".format(count), file=sys.stderr)
+
+
+def export_users(args):
+    from nautapy.credentials import write_accounts
+
+    fmt = _accounts_format(args, args.output)
+    if args.output == "-":
+        write_accounts(sys.stdout, _store().export_accounts(), fmt)
+    else:
+        with open(args.output, "w", newline="") as fp:
+            os.chmod(args.output, 0o600)
+            write_accounts(fp, _store().export_accounts(), fmt)
+
+
+def _get_all_credentials(users=None):
+    return _store().credentials(users)
+
 
-    for rec in cursor.execute("SELECT user FROM users"):
-        print(rec[0])
+def _report_rows(results, credit):
+    for result in results:
+        row = {"user": result.user, "remaining_time": None}
+        if credit:
+            row["credit"] = None
+
+        if result.ok:
+            row.update(result.value)
+        else:
+            row["error"] = (
+                result.error.args[0] if isinstance(result.error, NautaException)
+                else "Hubo un problema en la red"
+            )
+
+        yield row
+
+
+def report_users(args):
+    import csv
+    import json
+    from nautapy.session_manager import SessionManager, MAX_WORKERS
+
+    accounts = _get_all_credentials(args.users)
+    if not accounts:
+        print("No existe ningún usuario", file=sys.stderr)
+        sys.exit(1)
+
+    manager = SessionManager(accounts, max_workers=args.concurrency or MAX_WORKERS)
+    rows = _report_rows(manager.query_all(credit=args.credit), args.credit)
+    columns = ["user", "remaining_time"] + (["credit"] if args.credit else []) + ["error"]
+
+    if args.format == "json":
+        print("[", end="", flush=True)
+        for i, row in enumerate(rows):
+            print("{}\n  {}".format("," if i else "", json.dumps(row, ensure_ascii=False)), end="", flush=True)
+        print("\n]")
+    elif args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            sys.stdout.flush()
+    else:
+        line = "{:<32}{:<16}" + ("{:<16}" if args.credit else "") + "{}"
+        print(line.format("Usuario", "Tiempo", *(["Crédito"] if args.credit else []), ""))
+        for row in rows:
+            print(line.format(*[row.get(column) or "" for column in columns]), flush=True)
+
+        stats = manager.stats.as_dict()
+        if stats["count"]:
+            print("\n{count} usuarios en {elapsed:.2f}s".format(**stats), file=sys.stderr)
+
+
+def rank_users(args):
+    from nautapy.selection import AccountSelector
+
+    candidates = AccountSelector().rank(_get_all_credentials(args.users))
+    line = "{:<40}{:>12}{:>10}{:>12}"
+    print(line.format("Usuario", "Tiempo", "Fallos", "Latencia"))
+    for candidate in candidates:
+        print(line.format(
+            candidate.user,
+            "?" if candidate.remaining is None else utils.seconds2strtime(candidate.remaining),
+            "{:.1f}".format(candidate.failures),
+            "-" if candidate.latency is None else "{:.3f}s".format(candidate.latency)
+        ))
 
 
 def _get_credentials(args):
@@ -125,72 +179,217 @@ def _get_credentials(args):
     return _find_credentials(user=user, default_password=password)
 
 
-def up(args):
-    user, password = _get_credentials(args)
-    client = NautaClient(user=user, password=password)
+def _print_time_saved(args, time_saved):
+    if args.debug and time_saved:
+        print("Tiempo ahorrado: {}".format(
+            ", ".join(
+                "{} {:.3f}s".format(phase, elapsed)
+                for phase, elapsed in time_saved.items()
+            )
+        ))
+
+
+def _session_time(args, remaining_time):
+    """Session duration in seconds, aligned to the billing time unit if given"""
+    from nautapy.scheduler import session_duration
+
+    return session_duration(args.session_time, args.time_unit, remaining_time)
+
+
+def _daemon(args):
+    """Client of the running daemon, ``None`` to do the work in this process"""
+    if args.no_daemon or args.profile or args.trace or args.metrics_port or args.hedge or \
+            args.retries is not None or args.retry_deadline is not None:
+        return None
+
+    from nautapy.daemon import DaemonClient
+
+    daemon = DaemonClient()
+    return daemon if daemon.is_running() else None
+
+
+def _show_session(login_time, session_time):
+    """Shows the connected time until the session ends, ``session_time`` passes or Ctrl+C"""
+    from nautapy.watcher import SessionWatcher
 
     print(
-        "Conectando usuario: {}".format(
-            client.user,
+        "Presione Ctrl+C para desconectarse, o ejecute '{} down' desde otro terminal".format(
+            prog_name
         )
     )
 
+    watcher = SessionWatcher()
+    try:
+        while True:
+            elapsed = int(time.time() - login_time)
+
+            print(
+                "\rTiempo de conexión: {}".format(
+                    utils.seconds2strtime(elapsed)
+                ),
+                end=""
+            )
+
+            if session_time is not None:
+                if session_time < elapsed:
+                    break
+
+                print(
+                    " La sesión se cerrará en {}".format(
+                        utils.seconds2strtime(session_time - elapsed)
+                    ),
+                    end=""
+                )
+
+            # Wake up when the displayed second changes, or as soon as the session is closed
+            if watcher.wait(1 - (time.time() - login_time) % 1):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        print("\n\nCerrando sesión ...")
+
+
+def _print_health(health):
+    if health:
+        print("Caídas de la sesión: {}, reconexiones: {}, tiempo sin conexión: {}".format(
+            health["drops"],
+            health["reconnects"],
+            utils.seconds2strtime(int(health["downtime"]))
+        ))
+
+
+def _daemon_up(args, daemon, result):
+    from nautapy.daemon import DaemonUnavailable
+
+    print("Conectando usuario: {}".format(result["user"]))
+    print("[Sesión iniciada]")
+    _print_time_saved(args, result["time_saved"])
+    print("Tiempo restante: {}".format(result["remaining_time"]))
+    if args.batch:
+        return
+
+    # The daemon closes the session at the deadline even if this process dies
+    deadline = result["deadline"]
+    try:
+        try:
+            _show_session(result["login_time"], None if deadline is None else int(deadline - result["login_time"]))
+        finally:
+            health = daemon.call("down")["health"]
+        remaining_time = daemon.call("remaining-time", user=result["user"])["remaining_time"]
+    except DaemonUnavailable:
+        # The session was opened by the daemon, logging in here would leave it open
+        raise NautaException(
+            "Se perdió la conexión con el daemon y la sesión puede seguir abierta.\n"
+            "Ciérrela con '{} down'".format(prog_name)
+        )
+    print("Tiempo restante: {}".format(remaining_time))
+    print("Sesión cerrada con éxito.")
+    _print_health(health)
+
+
+def _auto_login(args):
+    """Logs in with the best ranked account, see nautapy.selection"""
+    from nautapy.selection import AccountSelector
+
+    def report(candidate, error):
+        if error:
+            print("Cuenta rechazada {}: {}".format(candidate.user, error.args[0]))
+        else:
+            print("Conectando usuario: {}".format(candidate.user))
+
+    return AccountSelector().login(_get_all_credentials(), on_attempt=report, fast_login=not args.full_login)
+
+
+def up(args):
+    daemon = _daemon(args)
+    if daemon:
+        from nautapy.daemon import DaemonUnavailable
+
+        # Only a daemon that can't be reached at all falls back to this process
+        try:
+            result = daemon.call(
+                "up",
+                user=args.user,
+                password=args.password,
+                session_time=args.session_time,
+                time_unit=args.time_unit,
+                full_login=args.full_login,
+                keepalive=args.keepalive_interval if args.keepalive else None,
+                auto=args.auto
+            )
+        except DaemonUnavailable:
+            pass
+        else:
+            return _daemon_up(args, daemon, result)
+
+    from nautapy.nauta_api import NautaClient
+
+    if args.auto:
+        login = functools.partial(_auto_login, args)
+    else:
+        user, password = _get_credentials(args)
+        client = NautaClient(user=user, password=password, fast_login=not args.full_login)
+        login = client.login
+
+        print(
+            "Conectando usuario: {}".format(
+                client.user,
+            )
+        )
+
     if args.batch:
-        client.login()
+        if args.keepalive:
+            print("--keepalive en modo --batch requiere '{} daemon start'".format(prog_name), file=sys.stderr)
+        client = login()
         print("[Sesión iniciada]")
+        _print_time_saved(args, client.time_saved)
         print("Tiempo restante: {}".format(utils.val_or_error(lambda: client.remaining_time)))
     else:
-        with client.login():
-            login_time = int(time.time())
+        client = login()
+        with client:
+            login_time = time.time()
             print("[Sesión iniciada]")
-            print("Tiempo restante: {}".format(utils.val_or_error(lambda: client.remaining_time)))
-            print(
-                "Presione Ctrl+C para desconectarse, o ejecute '{} down' desde otro terminal".format(
-                    prog_name
-                )
-            )
+            _print_time_saved(args, client.time_saved)
+            remaining_time = utils.val_or_error(lambda: client.remaining_time)
+            print("Tiempo restante: {}".format(remaining_time))
+            session_time = _session_time(args, remaining_time)
+
+            monitor = None
+            if args.keepalive:
+                from nautapy.keepalive import SessionMonitor
+
+                monitor = SessionMonitor(client, interval=args.keepalive_interval).start()
 
             try:
-                while True:
-                    if not client.is_logged_in:
-                        break
-
-                    elapsed = int(time.time()) - login_time
-
-                    print(
-                        "\rTiempo de conexión: {}".format(
-                            utils.seconds2strtime(elapsed)
-                        ),
-                        end=""
-                    )
-
-                    if args.session_time:
-                        if args.session_time < elapsed:
-                            break
-
-                        print(
-                            " La sesión se cerrará en {}".format(
-                                utils.seconds2strtime(args.session_time - elapsed)
-                            ),
-                            end=""
-                        )
-
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                pass
+                _show_session(login_time, session_time)
             finally:
-                print("\n\nCerrando sesión ...")
+                if monitor:
+                    monitor.stop()
                 print("Tiempo restante: {}".format(utils.val_or_error(lambda: client.remaining_time)))
 
-
-            
         print("Sesión cerrada con éxito.")
+        _print_health(monitor and monitor.stats.as_dict())
         #print("Crédito: {}".format(
         #    utils.val_or_error(lambda: client.user_credit)
         #))
 
 
 def down(args):
+    daemon = _daemon(args)
+    if daemon:
+        from nautapy.daemon import DaemonUnavailable
+
+        try:
+            result = daemon.call("down")
+            print("Sesión cerrada con éxito" if result["user"] else "No hay ninguna sesión activa")
+            return
+        except DaemonUnavailable:
+            pass
+
+    from nautapy.nauta_api import NautaClient
+
     client = NautaClient(user=None, password=None)
 
     if client.is_logged_in:
@@ -203,6 +402,8 @@ def down(args):
 
 
 def is_logged_in(args):
+    from nautapy.nauta_api import NautaClient
+
     client = NautaClient(user=None, password=None)
 
     print("Sesión activa: {}".format(
@@ -212,31 +413,160 @@ def is_logged_in(args):
 
 
 def is_online(args):
+    from nautapy.nauta_api import NautaProtocol
+
     print("Online: {}".format(
         "Sí" if NautaProtocol.is_connected()
         else "No"
     ))
 
+    if args.debug:
+        result = NautaProtocol.get_probe_engine().last_result
+        if result:
+            print("Sonda: {} ({:.0f} ms, {} bytes)".format(result.url, result.latency * 1000, result.bytes))
+        else:
+            print("Sonda: ninguna respuesta")
+
 
 def info(args):
+    daemon = _daemon(args)
+    if daemon:
+        from nautapy.daemon import DaemonUnavailable
+
+        try:
+            result = daemon.call(
+                "remaining-time", user=args.user, password=args.password, refresh=args.refresh, ttl=args.ttl
+            )
+            print("Usuario Nauta: {}".format(result["user"]))
+            print("Tiempo restante: {}".format(result["remaining_time"]))
+            return
+        except DaemonUnavailable:
+            pass
+
+    from nautapy.nauta_api import NautaClient
+
     user, password = _get_credentials(args)
     client = NautaClient(user, password)
+    if args.ttl is not None:
+        client.time_cache.ttl = args.ttl
 
     if client.is_logged_in:
         client.load_last_session()
 
     print("Usuario Nauta: {}".format(user))
     print("Tiempo restante: {}".format(
-        utils.val_or_error(lambda: client.remaining_time)
+        utils.val_or_error(lambda: client.get_remaining_time(refresh=args.refresh))
     ))
     #print("Crédito: {}".format(
     #    utils.val_or_error(lambda: client.user_credit)
     #))
 
 
+def stats(args):
+    from nautapy.traffic import TrafficStore, format_bytes
+
+    user = _find_credentials(args.user)[0] if args.user else None
+    store = TrafficStore()
+    try:
+        rows = store.summary(by=args.by, user=user, time_unit=args.time_unit, limit=args.limit)
+    finally:
+        store.close()
+
+    if not rows:
+        print("No hay sesiones registradas")
+        return
+
+    line = "{:<40}{:>9}{:>11}{:>11}{:>12}{:>12}{:>14}"
+    print(line.format(
+        {"user": "Usuario", "command": "Comando", "session": "Sesión"}[args.by],
+        "Sesiones", "Tiempo", "Facturado", "Recibido", "Enviado", "Por minuto"
+    ))
+    for row in rows:
+        key = row.key if len(row.key) <= 38 else row.key[:37] + "…"
+        print(line.format(
+            key,
+            row.sessions,
+            utils.seconds2strtime(int(row.duration)),
+            utils.seconds2strtime(int(row.billed)),
+            format_bytes(row.received),
+            format_bytes(row.sent),
+            format_bytes(row.bytes_per_minute)
+        ))
+
+
+def _print_usage(report):
+    print("Usuario Nauta: {}".format(report["user"]))
+    print("Consumido hoy: {}".format(utils.seconds2strtime(int(report["today"]))))
+    print("Consumido este mes: {}".format(utils.seconds2strtime(int(report["month"]))))
+    print("Consumo medio: {} por día".format(utils.seconds2strtime(int(report["burn_rate"]))))
+
+    if report["remaining"] is not None:
+        print("Tiempo restante: {} (estimado)".format(utils.seconds2strtime(report["remaining"])))
+    if report["depletion"] is not None:
+        print("Se agotará: {} (en {:.1f} días)".format(
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(report["depletion"])),
+            (report["depletion"] - time.time()) / 86400
+        ))
+
+
+def usage(args):
+    from nautapy.usage import UsageLedger
+
+    ledger = UsageLedger.default()
+    if args.all:
+        users = ledger.users()
+    else:
+        user = args.user or _get_default_user()
+        users = [_find_credentials(user)[0]] if user else []
+
+    reports = [report for report in (ledger.usage(user, days=args.days) for user in users) if report]
+    if not reports:
+        print("No hay consumo registrado")
+        return
+
+    for i, report in enumerate(reports):
+        if i:
+            print()
+        _print_usage(report)
+
+
 def run_connected(args):
+    from nautapy.nauta_api import NautaClient, NautaProtocol
+
+    if args.enqueue:
+        from nautapy.job_queue import JobQueue
+
+        job_id = JobQueue().enqueue(" ".join(args.cmd), cwd=os.getcwd())
+        print("Comando encolado: #{}".format(job_id))
+        return
+
+    daemon = _daemon(args)
+    if daemon:
+        from nautapy.daemon import DaemonUnavailable
+
+        def write_output(method, params):
+            sys.stdout.write(params["data"])
+            sys.stdout.flush()
+
+        try:
+            daemon.call(
+                "run-connected",
+                on_notification=write_output,
+                cmd=" ".join(args.cmd),
+                cwd=os.getcwd(),
+                env=dict(os.environ),
+                user=args.user,
+                password=args.password,
+                reuse_connection=args.reuse_connection
+            )
+            return
+        except DaemonUnavailable:
+            pass
+
+    from nautapy.traffic import TrafficMeter
+
     user, password = _get_credentials(args)
-    client = NautaClient(user, password)
+    client = NautaClient(user, password, traffic=TrafficMeter(command=" ".join(args.cmd)))
 
     if not NautaProtocol.is_connected():
         with client.login():
@@ -254,6 +584,293 @@ def run_connected(args):
         print("ya hay una conexión activa a internet, si aún así desea usar -run-connected agregue el flag --reuse-connection")
 
 
+def queue_run(args):
+    from nautapy.job_queue import JobQueue, QueueRunner
+    from nautapy.nauta_api import NautaClient
+
+    user, password = _get_credentials(args)
+    client = NautaClient(user, password)
+
+    queue = JobQueue()
+    if not queue.pending():
+        print("No hay comandos en la cola")
+        return
+
+    runner = QueueRunner(queue, client, time_unit=args.time_unit, jobs=args.jobs)
+    try:
+        stats = runner.run()
+    except KeyboardInterrupt:
+        stats = runner.stats
+
+    print("\nComandos terminados: {done}, fallidos: {failed}, sesiones: {sessions}, en {elapsed:.2f}s".format(
+        **stats.as_dict()
+    ))
+    if stats.failed:
+        sys.exit(1)
+
+
+def queue_list(args):
+    from nautapy.job_queue import JobQueue, PENDING, RUNNING
+
+    states = None if args.all else [PENDING, RUNNING]
+    for job in JobQueue().jobs(states):
+        print("#{:<6}{:<10}{:<6}{}".format(
+            job.id, job.state, "" if job.exit_code is None else job.exit_code, job.cmd
+        ))
+
+
+def queue_clear(args):
+    from nautapy.job_queue import JobQueue, PENDING, DONE, FAILED
+
+    states = [PENDING, DONE, FAILED] if args.all else [DONE, FAILED]
+    print("Comandos eliminados: {}".format(JobQueue().clear(states)))
+
+
+def _pool_manager(args):
+    from nautapy.session_manager import SessionManager, MAX_WORKERS
+
+    accounts = _get_all_credentials(args.users)
+    if not accounts:
+        print("No hay usuarios en el pool", file=sys.stderr)
+        sys.exit(1)
+
+    return SessionManager(accounts, max_workers=args.concurrency or MAX_WORKERS)
+
+
+def _print_pool_results(results, success_message):
+    for result in results:
+        if result.ok:
+            print("{}: {} ({:.2f}s)".format(result.user, success_message, result.latency))
+        elif isinstance(result.error, NautaException):
+            print("{}: {}".format(result.user, result.error.args[0]), file=sys.stderr)
+        else:
+            print("{}: Hubo un problema en la red".format(result.user), file=sys.stderr)
+
+
+def _print_pool_stats(manager):
+    stats = manager.stats.as_dict()
+    if not stats["count"]:
+        return
+
+    print(
+        "\n{successes}/{count} en {elapsed:.2f}s ({throughput:.1f}/s), "
+        "latencia p50 {p50:.2f}s, p95 {p95:.2f}s, máx {max:.2f}s".format(**stats)
+    )
+
+
+def pool_up(args):
+    manager = _pool_manager(args)
+    _print_pool_results(manager.login_all(), "Sesión iniciada")
+    _print_pool_stats(manager)
+
+
+def pool_down(args):
+    manager = _pool_manager(args)
+    _print_pool_results(manager.logout_all(), "Sesión cerrada")
+    _print_pool_stats(manager)
+
+
+def pool_status(args):
+    manager = _pool_manager(args)
+    for user, logged_in in manager.status().items():
+        print("{}: {}".format(user, "Sí" if logged_in else "No"))
+
+
+def proxy(args):
+    import asyncio
+    import logging
+    from nautapy.nauta_api import NautaClient
+    from nautapy.proxy import NautaProxy, DEFAULT_PORT
+
+    user, password = _get_credentials(args)
+    port = args.port or DEFAULT_PORT
+    client = NautaClient(user, password)
+
+    logging.basicConfig(
+        stream=sys.stdout if args.log == "-" else None,
+        filename=None if args.log == "-" else args.log,
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(asctime)s %(message)s"
+    )
+
+    nauta_proxy = NautaProxy(
+        client,
+        time_unit=args.time_unit,
+        max_conn=args.max_conn,
+        whitelist=args.whitelist,
+        blacklist=args.blacklist
+    )
+
+    async def serve():
+        await nauta_proxy.start(host=args.bind, port=port)
+        print("Proxy escuchando en {}:{}, usuario: {}".format(args.bind, port, user))
+        try:
+            await nauta_proxy.serve_forever()
+        finally:
+            await nauta_proxy.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+    stats = nauta_proxy.stats
+    print("\nConexiones: {}, sesiones: {}, enviados: {} bytes, recibidos: {} bytes".format(
+        stats.connections, stats.sessions, stats.bytes_up, stats.bytes_down
+    ))
+
+
+def broker(args):
+    import signal
+    from nautapy.connection_pool import BrokerServer, ConnectionPool, POOL_MAXSIZE
+
+    ConnectionPool.configure(pool_maxsize=args.pool_size or POOL_MAXSIZE)
+    server = BrokerServer()
+
+    print("Broker escuchando en {}".format(server.socket_path))
+    print("Presione Ctrl+C para detenerlo")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\nConexiones reutilizadas: {}".format(server.relayed))
+
+
+def _configure_retries(args):
+    from nautapy.nauta_api import NautaProtocol
+
+    policy = NautaProtocol.get_retry_policy()
+    if args.retries is not None:
+        # Applies to every operation, logout included
+        policy.retries = args.retries
+        policy.operations = {}
+    if args.retry_deadline is not None:
+        policy.deadline = args.retry_deadline
+
+
+def _print_retry_stats():
+    nauta_api = sys.modules.get("nautapy.nauta_api")
+    policy = nauta_api and nauta_api.NautaProtocol.retry_policy
+    if not policy:
+        return
+
+    for operation, stats in policy.stats.as_dict().items():
+        print(
+            "{}: {calls} llamadas, {retries} reintentos, {failures} fallos, "
+            "latencia media {mean_latency:.3f}s, máx {max_latency:.3f}s".format(operation, **stats),
+            file=sys.stderr
+        )
+
+
+def daemon(args):
+    from nautapy.daemon import DaemonClient, DaemonUnavailable
+
+    if args.action == "start":
+        import logging
+        import signal
+        from nautapy.daemon import serve, DAEMON_SOCKET
+
+        logging.basicConfig(
+            stream=sys.stdout,
+            level=logging.DEBUG if args.debug else logging.INFO,
+            format="%(asctime)s %(message)s"
+        )
+
+        def terminate(signum, frame):
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, terminate)
+        try:
+            serve(ready=lambda server: print("Daemon escuchando en {}".format(DAEMON_SOCKET), flush=True))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    try:
+        result = DaemonClient().call(args.action)
+    except DaemonUnavailable:
+        print("El daemon no está en ejecución")
+        return
+
+    if args.action == "stop":
+        print("Daemon detenido (pid {})".format(result["pid"]))
+        return
+
+    print("Daemon: pid {pid}, en ejecución desde hace {uptime}, {calls} llamadas".format(
+        pid=result["pid"], uptime=utils.seconds2strtime(int(result["uptime"])), calls=result["calls"]
+    ))
+    print("Sesión activa: {}".format(result["user"] if result["logged_in"] else "No"))
+    if result["deadline"]:
+        print("La sesión se cerrará en {}".format(
+            utils.seconds2strtime(max(0, int(result["deadline"] - time.time())))
+        ))
+    _print_health(result["health"])
+
+
+def _print_hedge_stats():
+    nauta_api = sys.modules.get("nautapy.nauta_api")
+    hedger = nauta_api and nauta_api.NautaProtocol.hedger
+    if not hedger:
+        return
+
+    for endpoint, stats in hedger.stats.items():
+        print(
+            "{}: {calls} llamadas, {hedged} duplicadas, {hedge_wins} ganadas por el duplicado, "
+            "espera antes de duplicar {delay:.3f}s".format(endpoint, delay=hedger.delay(endpoint), **stats.as_dict()),
+            file=sys.stderr
+        )
+
+
+def _configure_tracer(args):
+    from nautapy.instrument import Tracer, LogSink, JsonSink, PrometheusSink
+    from nautapy.nauta_api import NautaProtocol
+
+    sinks = []
+    if args.trace == "log":
+        import logging
+
+        logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO)
+        sinks.append(LogSink())
+    elif args.trace:
+        sinks.append(JsonSink(args.trace))
+    if args.metrics_port:
+        sinks.append(PrometheusSink(args.metrics_port))
+
+    NautaProtocol.tracer = Tracer(sinks)
+    return NautaProtocol.tracer
+
+
+def _print_profile(tracer):
+    summary = tracer.summary()
+    if not summary:
+        return
+
+    line = "{:<24}{:>12}{:>12}{:>12}{:>12}"
+    print(line.format("Fase", "Tiempo", "Enviado", "Recibido", "Reintentos"), file=sys.stderr)
+    for name, stats in summary.items():
+        print(line.format(
+            "  " * stats["depth"] + name + (" x{}".format(stats["count"]) if stats["count"] > 1 else ""),
+            "{:.1f} ms".format(stats["duration"] * 1000),
+            "-" if stats["bytes_sent"] is None else "{} B".format(stats["bytes_sent"]),
+            "-" if stats["bytes_received"] is None else "{} B".format(stats["bytes_received"]),
+            stats["retries"],
+        ), file=sys.stderr)
+
+
+def _save_latencies():
+    nauta_api = sys.modules.get("nautapy.nauta_api")
+    hedger = nauta_api and nauta_api.NautaProtocol.hedger
+    if hedger and hedger.histograms:
+        try:
+            hedger.save()
+        except OSError:
+            pass
+
+
 def create_user_subparsers(subparsers):
     users_parser = subparsers.add_parser("users")
     user_subparsers = users_parser.add_subparsers()
@@ -283,22 +900,123 @@ def create_user_subparsers(subparsers):
     user_list_parser = user_subparsers.add_parser("list")
     user_list_parser.set_defaults(func=list_users)
 
+    # Import and export users
+    user_import_parser = user_subparsers.add_parser("import")
+    user_import_parser.set_defaults(func=import_users)
+    user_import_parser.add_argument("-f", "--format", choices=["csv", "jsonl"], default=None,
+                                    help="Formato del fichero, por defecto según la extensión")
+    user_import_parser.add_argument("file", help="Fichero CSV (columnas user,password) o JSONL, '-' para "
+                                                 "la entrada estándar")
+
+    user_export_parser = user_subparsers.add_parser("export")
+    user_export_parser.set_defaults(func=export_users)
+    user_export_parser.add_argument("-f", "--format", choices=["csv", "jsonl"], default=None,
+                                    help="Formato del fichero, por defecto según la extensión")
+    user_export_parser.add_argument("-o", "--output", default="-",
+                                    help="Fichero de salida, por defecto la salida estándar")
+
+    # Report remaining time of every user
+    user_report_parser = user_subparsers.add_parser("report")
+    user_report_parser.set_defaults(func=report_users)
+    user_report_parser.add_argument("-f", "--format", choices=["table", "json", "csv"], default="table",
+                                    help="Formato de salida")
+    user_report_parser.add_argument("-c", "--concurrency", action="store", default=None, type=int,
+                                    help="Máximo de consultas simultáneas")
+    user_report_parser.add_argument("--credit", action="store_true", default=False,
+                                    help="Consultar también el crédito (solo sin conexión)")
+    user_report_parser.add_argument("users", nargs="*", help="Usuarios Nauta, por defecto todos")
+
+    # Order in which 'up --auto' tries the users
+    user_rank_parser = user_subparsers.add_parser("rank")
+    user_rank_parser.set_defaults(func=rank_users)
+    user_rank_parser.add_argument("users", nargs="*", help="Usuarios Nauta, por defecto todos")
+
+
+def create_pool_subparsers(subparsers):
+    pool_parser = subparsers.add_parser("pool")
+    pool_subparsers = pool_parser.add_subparsers()
+
+    for name, func, help in [
+        ("up", pool_up, "Iniciar sesión con todos los usuarios"),
+        ("down", pool_down, "Cerrar la sesión de todos los usuarios"),
+        ("status", pool_status, "Mostrar los usuarios con sesión activa"),
+    ]:
+        parser = pool_subparsers.add_parser(name, help=help)
+        parser.set_defaults(func=func)
+        parser.add_argument("-c", "--concurrency", action="store", default=None, type=int,
+                            help="Máximo de operaciones simultáneas")
+        parser.add_argument("users", nargs="*", help="Usuarios Nauta, por defecto todos")
+
+
+def create_queue_subparsers(subparsers):
+    queue_parser = subparsers.add_parser("queue")
+    queue_subparsers = queue_parser.add_subparsers()
+
+    queue_run_parser = queue_subparsers.add_parser("run", help="Ejecutar los comandos encolados en una sesión")
+    queue_run_parser.set_defaults(func=queue_run)
+    queue_run_parser.add_argument("-j", "--jobs", action="store", default=1, type=int,
+                                  help="Comandos ejecutados simultáneamente")
+    queue_run_parser.add_argument("-t", "--time-unit", action="store", default=None, type=int,
+                                  help="Unidad de tarificación en segundos, la sesión se mantiene hasta el final "
+                                       "de la unidad pagada por si se encolan más comandos")
+    queue_run_parser.add_argument("-u", "--user", required=False, help="Usuario Nauta")
+    queue_run_parser.add_argument("-p", "--password", required=False, help="Password del usuario Nauta")
+
+    queue_list_parser = queue_subparsers.add_parser("list", help="Mostrar los comandos pendientes")
+    queue_list_parser.set_defaults(func=queue_list)
+    queue_list_parser.add_argument("-a", "--all", action="store_true", default=False,
+                                   help="Mostrar también los terminados")
+
+    queue_clear_parser = queue_subparsers.add_parser("clear", help="Eliminar los comandos terminados")
+    queue_clear_parser.set_defaults(func=queue_clear)
+    queue_clear_parser.add_argument("-a", "--all", action="store_true", default=False,
+                                    help="Eliminar también los pendientes")
+
 
 def main():
     parser = argparse.ArgumentParser(prog=prog_name)
     parser.add_argument("--version", action="version", version="{} v{}".format(prog_name, version))
     parser.add_argument("-d", "--debug", action="store_true", help="show debug info")
+    parser.add_argument("--retries", action="store", default=None, type=int,
+                        help="Reintentos de cada petición al portal si falla la red")
+    parser.add_argument("--retry-deadline", action="store", default=None, type=float,
+                        help="Tiempo máximo en segundos para cada operación, reintentos incluidos")
+    parser.add_argument("--profile", action="store_true", default=False,
+                        help="Mostrar el tiempo, los bytes y los reintentos de cada fase al terminar")
+    parser.add_argument("--trace", action="store", default=None, metavar="FILE",
+                        help="Guardar cada fase como una línea JSON en FILE, 'log' para escribirlas en el log")
+    parser.add_argument("--metrics-port", action="store", default=None, type=int,
+                        help="Servir las métricas de las fases en formato Prometheus en este puerto local")
+    parser.add_argument("--no-daemon", action="store_true", default=False,
+                        help="No usar 'nauta daemon' aunque esté en ejecución")
+    parser.add_argument("--hedge", action="store_true", default=False,
+                        help="Duplicar las peticiones de cierre de sesión y tiempo restante cuando el portal "
+                             "tarda en responder")
 
     subparsers = parser.add_subparsers()
 
     # Create user subparsers in another function
     create_user_subparsers(subparsers)
+    create_pool_subparsers(subparsers)
+    create_queue_subparsers(subparsers)
 
     # loggin parser
     up_parser = subparsers.add_parser("up")
     up_parser.set_defaults(func=up)
     up_parser.add_argument("-t", "--session-time", action="store", default=None, type=int, help="Tiempo de desconexión en segundos")
+    up_parser.add_argument("--time-unit", action="store", default=None, type=int,
+                           help="Unidad de tarificación en segundos, la sesión se cierra justo antes de que "
+                                "termine la unidad ya pagada")
     up_parser.add_argument("-b", "--batch", action="store_true", default=False, help="Ejecutar en modo no interactivo")
+    up_parser.add_argument("-F", "--full-login", action="store_true", default=False,
+                           help="No reutilizar el formulario de la sesión anterior")
+    up_parser.add_argument("-a", "--auto", action="store_true", default=False,
+                           help="Elegir la cuenta con más tiempo y menos fallos recientes, y probar la "
+                                "siguiente si el portal la rechaza")
+    up_parser.add_argument("-k", "--keepalive", action="store_true", default=False,
+                           help="Comprobar la sesión periódicamente y reconectar si el portal la cierra")
+    up_parser.add_argument("--keepalive-interval", action="store", default=60, type=int,
+                           help="Segundos entre comprobaciones de --keepalive (60 por defecto)")
     up_parser.add_argument("user", nargs="?", help="Usuario Nauta")
     up_parser.add_argument("password", nargs="?", help="Password del usuario Nauta")
 
@@ -317,9 +1035,33 @@ def main():
     # User information parser
     info_parser = subparsers.add_parser("info")
     info_parser.set_defaults(func=info)
+    info_parser.add_argument("-r", "--refresh", action="store_true", default=False,
+                             help="Consultar el tiempo restante al portal aunque haya un valor reciente")
+    info_parser.add_argument("--ttl", action="store", default=None, type=int,
+                             help="Segundos que se reutiliza el tiempo restante antes de consultarlo de nuevo")
     info_parser.add_argument("user", nargs="?", help="Usuario Nauta")
     info_parser.add_argument("password", nargs="?", help="Password del usuario Nauta")
 
+    # Traffic stats parser
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.set_defaults(func=stats)
+    stats_parser.add_argument("--by", choices=["user", "command", "session"], default="user",
+                              help="Agrupar el tráfico por usuario, comando de run-connected o sesión")
+    stats_parser.add_argument("-t", "--time-unit", action="store", default=60, type=int,
+                              help="Unidad de tarificación en segundos (60 por defecto)")
+    stats_parser.add_argument("-n", "--limit", action="store", default=None, type=int,
+                              help="Mostrar solo las primeras filas")
+    stats_parser.add_argument("user", nargs="?", help="Usuario Nauta")
+
+    # Usage parser
+    usage_parser = subparsers.add_parser("usage")
+    usage_parser.set_defaults(func=usage)
+    usage_parser.add_argument("-a", "--all", action="store_true", default=False,
+                              help="Mostrar el consumo de todos los usuarios")
+    usage_parser.add_argument("--days", action="store", default=30, type=int,
+                              help="Días usados para calcular el consumo medio (30 por defecto)")
+    usage_parser.add_argument("user", nargs="?", help="Usuario Nauta")
+
     # Run connected parser
     run_connected_parser = subparsers.add_parser("run-connected")
     run_connected_parser.set_defaults(func=run_connected)
@@ -328,17 +1070,76 @@ def main():
     run_connected_parser.add_argument("-rc", "--reuse-connection", action="store_true", required=False, 
                                       help="ejecuta el comando incluso si hay una conexión activa, luego cierra "
                                       "la sesión si es posible")
+    run_connected_parser.add_argument("-e", "--enqueue", action="store_true", required=False,
+                                      help="Guardar el comando en la cola para ejecutarlo luego con "
+                                           "'queue run'")
     run_connected_parser.add_argument("cmd", nargs=argparse.REMAINDER, help="The command line to run")
 
+    # Proxy parser
+    proxy_parser = subparsers.add_parser("proxy")
+    proxy_parser.set_defaults(func=proxy)
+    proxy_parser.add_argument("-p", "--port", action="store", default=None, type=int,
+                              help="Puerto del proxy")
+    proxy_parser.add_argument("-b", "--bind", action="store", default="127.0.0.1",
+                              help="Dirección en la que escucha el proxy")
+    proxy_parser.add_argument("-t", "--time-unit", action="store", required=True, type=int,
+                              help="Unidad de tarificación en segundos, por ejemplo 120 para Nauta Hogar")
+    proxy_parser.add_argument("-u", "--user", required=False, help="Usuario Nauta")
+    proxy_parser.add_argument("--password", required=False, help="Password del usuario Nauta")
+    proxy_parser.add_argument("-m", "--max-conn", action="store", default=None, type=int,
+                              help="Máximo de conexiones simultáneas")
+    proxy_parser.add_argument("-w", "--whitelist", action="append", default=[], metavar="DOMAIN",
+                              help="Permitir solo este dominio (se puede repetir)")
+    proxy_parser.add_argument("-x", "--blacklist", action="append", default=[], metavar="DOMAIN",
+                              help="Bloquear este dominio (se puede repetir)")
+    proxy_parser.add_argument("-l", "--log", action="store", default="-",
+                              help="Fichero de logs, '-' para la salida estándar")
+
+    # Connection broker parser
+    broker_parser = subparsers.add_parser("broker")
+    broker_parser.set_defaults(func=broker)
+    broker_parser.add_argument("-s", "--pool-size", action="store", default=None, type=int,
+                               help="Máximo de conexiones abiertas con el portal")
+
+    # Daemon parser
+    daemon_parser = subparsers.add_parser("daemon")
+    daemon_parser.set_defaults(func=daemon)
+    daemon_parser.add_argument("action", nargs="?", choices=["start", "stop", "status"], default="start",
+                               help="Iniciar el daemon en primer plano (por defecto), detenerlo o ver su estado")
+
     args = parser.parse_args()
     if "func" not in args:
         parser.print_help()
         sys.exit(1)
 
+    if args.retries is not None or args.retry_deadline is not None:
+        _configure_retries(args)
+
+    if args.hedge:
+        from nautapy.nauta_api import NautaProtocol
+        NautaProtocol.hedging = True
+
+    tracer = None
+    if args.profile or args.trace or args.metrics_port:
+        tracer = _configure_tracer(args)
+
     try:
         args.func(args)
+        if args.debug:
+            _print_retry_stats()
+            _print_hedge_stats()
     except NautaException as ex:
         print(ex.args[0], file=sys.stderr)
-    except RequestException:
+    except Exception as ex:
+        # requests is only loaded by the commands that use the network
+        requests = sys.modules.get("requests")
+        if not requests or not isinstance(ex, requests.RequestException):
+            raise
         print("Hubo un problema en la red, por favor revise su conexión", file=sys.stderr)
+    finally:
+        _save_latencies()
+        if tracer:
+            if args.profile:
+                _print_profile(tracer)
+            tracer.close()
 
@@ -0,0 +1,213 @@
+"""
+Shared HTTP connection pool for talking with the portal
+
+Every :class:`SessionObject` mounts the same transport adapter, so the
+TCP and TLS connections to ``LOGIN_URL`` are kept alive and reused by all
+the sessions of the process.
+
+Short lived processes (``nauta info``, ``nauta down``) can also borrow
+the warm connections of a broker process (``nauta broker``). While the
+broker listens on ``BROKER_SOCKET``, portal requests are relayed through
+it instead of opening new connections.
+
+"""
+
+import base64
+import http.client
+import os
+import socketserver
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from nautapy import appdata_path, unix_socket
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+
+BROKER_SOCKET = os.path.join(appdata_path, "broker.sock")
+
+# Headers describing the wire encoding, which the broker already undid
+_HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+class ConnectionPool(object):
+    _adapter = None
+    _options = dict(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+
+    use_broker = True
+
+    @classmethod
+    def configure(cls, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False,
+                  use_broker=True):
+        cls.close()
+        cls._options = dict(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        cls.use_broker = use_broker
+
+    @classmethod
+    def close(cls):
+        if cls._adapter:
+            cls._adapter.close()
+            cls._adapter = None
+
+    @classmethod
+    def get_adapter(cls):
+        if not cls._adapter:
+            cls._adapter = HTTPAdapter(**cls._options)
+        return cls._adapter
+
+    @classmethod
+    def mount(cls, requests_session):
+        if cls.use_broker and os.path.exists(BROKER_SOCKET):
+            adapter = BrokerAdapter(BROKER_SOCKET, fallback=cls.get_adapter())
+        else:
+            adapter = cls.get_adapter()
+
+        requests_session.mount("https://", adapter)
+        requests_session.mount("http://", adapter)
+        return requests_session
+
+
+class _BrokerRawResponse(object):
+    """Stand-in for ``urllib3.HTTPResponse`` so requests can read cookies"""
+    def __init__(self, headers):
+        self._original_response = self
+        self.msg = http.client.HTTPMessage()
+        for name, value in headers:
+            self.msg[name] = value
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class BrokerAdapter(BaseAdapter):
+    """Transport adapter relaying requests through a :class:`BrokerServer`
+
+    Falls back to ``fallback`` when the broker is not reachable. Once the
+    request was handed to the broker it's never sent again, a broker lost
+    before answering is a :class:`requests.ConnectionError` like a portal
+    that drops the connection.
+
+    """
+    def __init__(self, socket_path, fallback=None):
+        super().__init__()
+        self.socket_path = socket_path
+        self.fallback = fallback
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        message = {
+            "method": request.method,
+            "url": request.url,
+            "headers": list(request.headers.items()),
+            "body": base64.b64encode(
+                request.body.encode("utf-8") if isinstance(request.body, str) else request.body or b""
+            ).decode("ascii"),
+            "timeout": timeout,
+            "verify": verify,
+            "cert": cert,
+            "proxies": proxies,
+        }
+
+        try:
+            sock = unix_socket.connect(self.socket_path, None if isinstance(timeout, tuple) else timeout)
+        except OSError:
+            if not self.fallback:
+                raise requests.ConnectionError("No se pudo contactar el broker", request=request)
+            return self.fallback.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                      proxies=proxies)
+
+        try:
+            with sock:
+                unix_socket.send_message(sock, message)
+                with sock.makefile("rb") as fp:
+                    reply = unix_socket.recv_message(fp)
+        except TimeoutError:
+            raise requests.ReadTimeout("El broker no respondió a tiempo", request=request)
+        except (OSError, ValueError):
+            raise requests.ConnectionError("Se perdió la conexión con el broker", request=request)
+
+        if "error" in reply:
+            raise requests.ConnectionError(reply["error"], request=request)
+
+        return self.build_response(request, reply)
+
+    def build_response(self, request, reply):
+        response = requests.Response()
+        response.status_code = reply["status"]
+        response.reason = reply["reason"]
+        response.url = request.url
+        response.headers = CaseInsensitiveDict(reply["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _BrokerRawResponse(reply["headers"])
+        response.request = request
+        response.connection = self
+        response._content = base64.b64decode(reply["body"])
+        response._content_consumed = True
+
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self):
+        pass
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = unix_socket.recv_message(self.rfile)
+        except (ConnectionError, ValueError):
+            return
+
+        unix_socket.send_message(self.connection, self.server.relay(message))
+
+
+class BrokerServer(unix_socket.UnixSocketServer):
+    """Keeps warm connections to the portal and relays requests from other processes"""
+    def __init__(self, socket_path=None):
+        self.adapter = HTTPAdapter(**ConnectionPool._options)
+        self.relayed = 0
+
+        super().__init__(socket_path or BROKER_SOCKET, _BrokerHandler)
+
+    def relay(self, message):
+        timeout = message.get("timeout")
+        request = requests.Request(
+            method=message["method"],
+            url=message["url"],
+            headers=dict(message["headers"]),
+            data=base64.b64decode(message["body"]) or None
+        ).prepare()
+
+        cert = message.get("cert")
+        try:
+            response = self.adapter.send(
+                request,
+                timeout=tuple(timeout) if isinstance(timeout, list) else timeout,
+                verify=message.get("verify", True),
+                cert=tuple(cert) if isinstance(cert, list) else cert,
+                proxies=message.get("proxies")
+            )
+            content = response.content
+        except requests.RequestException as ex:
+            return {"error": str(ex)}
+
+        self.relayed += 1
+        return {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": [
+                (name, value)
+                for name, value in response.raw._original_response.msg.items()
+                if name.lower() not in _HOP_HEADERS
+            ],
+            "body": base64.b64encode(content).decode("ascii"),
+        }
+
+    def server_close(self):
+        super().server_close()
+        self.adapter.close()
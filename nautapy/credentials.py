@@ -0,0 +1,237 @@
+"""
+Stored Nauta accounts
+
+Accounts live in ``users.db``. :class:`CredentialStore` keeps a single
+connection per process, and the schema is only created or migrated when
+``PRAGMA user_version`` is behind ``SCHEMA_VERSION`` (see nautapy.migrations),
+so commands don't run any DDL once the database is up to date. Statements are constants, the
+``sqlite3`` statement cache of the shared connection prepares them once.
+
+Partial user names are resolved with a range query over an index of the
+users without case (the ``LIKE`` of older versions ignored it too), and
+ambiguous prefixes are rejected.
+
+Example:
+    store = CredentialStore.default()
+    store.add("pepe@nauta.com.cu", "pepepass")
+    user, password = store.find("pepe")
+
+    with open("users.csv") as fp:
+        store.import_accounts(read_accounts(fp, "csv"))
+
+"""
+
+import csv
+import json
+import os
+import sqlite3
+from base64 import b85encode, b85decode
+from itertools import islice
+
+from nautapy import appdata_path, ensure_dir, migrations
+from nautapy.exceptions import NautaUserException
+
+USERS_DB = os.path.join(appdata_path, "users.db")
+IMPORT_BATCH_SIZE = 1000
+
+
+def _create_tables(conn):
+    # Same layout as the tables created by older versions
+    conn.execute("CREATE TABLE IF NOT EXISTS users (user TEXT, password TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS default_user (user TEXT)")
+
+
+def _unique_users(conn):
+    # Older versions allowed duplicated users, the first one was the one used
+    conn.execute("DELETE FROM users WHERE rowid NOT IN (SELECT min(rowid) FROM users GROUP BY user)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_user ON users (user)")
+
+
+def _nocase_index(conn):
+    # Prefix lookups ignore the case
+    conn.execute("CREATE INDEX IF NOT EXISTS users_user_nocase ON users (user COLLATE NOCASE)")
+
+
+MIGRATIONS = [_create_tables, _unique_users, _nocase_index]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_SELECT_DEFAULT_USER = "SELECT user FROM default_user LIMIT 1"
+_SELECT_FIRST_USER = "SELECT user FROM users ORDER BY rowid LIMIT 1"
+_SELECT_USER = "SELECT user, password FROM users WHERE user=?"
+_SELECT_PREFIX = (
+    "SELECT user FROM users WHERE user >= ? COLLATE NOCASE AND user < ? COLLATE NOCASE "
+    "ORDER BY user COLLATE NOCASE LIMIT ?"
+)
+_SELECT_USERS = "SELECT user FROM users ORDER BY rowid"
+_SELECT_CREDENTIALS = "SELECT user, password FROM users ORDER BY rowid"
+_UPSERT_USER = "INSERT INTO users VALUES (?, ?) ON CONFLICT (user) DO UPDATE SET password=excluded.password"
+_UPDATE_PASSWORD = "UPDATE users SET password=? WHERE user=?"
+_DELETE_USER = "DELETE FROM users WHERE user=?"
+_DELETE_DEFAULT_USER = "DELETE FROM default_user"
+_INSERT_DEFAULT_USER = "INSERT INTO default_user VALUES (?)"
+
+
+def encode_password(password):
+    return b85encode(password.encode('utf-8'))
+
+
+def decode_password(password):
+    return b85decode(password).decode('utf-8')
+
+
+def _json_rows(fp):
+    for number, line in enumerate(fp, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise NautaUserException("JSON incorrecto en la línea {}: {}".format(number, line.strip()))
+        yield number, row
+
+
+def _csv_rows(fp):
+    reader = csv.DictReader(fp)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_accounts(fp, fmt):
+    """Yields ``(user, password)`` from a CSV (``user,password`` header) or JSON lines file"""
+    for number, row in _csv_rows(fp) if fmt == "csv" else _json_rows(fp):
+        user, password = (row.get("user"), row.get("password")) if isinstance(row, dict) else (None, None)
+        if not isinstance(user, str) or not user.strip() or not isinstance(password, str):
+            raise NautaUserException("Registro incorrecto en la línea {}: {}".format(number, row))
+        yield user.strip(), password
+
+
+def write_accounts(fp, accounts, fmt):
+    if fmt == "csv":
+        writer = csv.writer(fp)
+        writer.writerow(["user", "password"])
+        writer.writerows(accounts)
+    else:
+        for user, password in accounts:
+            fp.write(json.dumps({"user": user, "password": password}, ensure_ascii=False) + "\n")
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class CredentialStore(object):
+    _default = None
+
+    def __init__(self, path=USERS_DB):
+        self.path = path
+        self._conn = None
+
+    @classmethod
+    def default(cls):
+        """The store for ``USERS_DB``, shared by the whole process"""
+        if not cls._default or cls._default.path != USERS_DB:
+            cls._default = cls(USERS_DB)
+        return cls._default
+
+    @property
+    def connection(self):
+        if not self._conn:
+            ensure_dir(self.path)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self.migrate()
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def migrate(self):
+        return migrations.migrate(self._conn, MIGRATIONS)
+
+    def default_user(self):
+        """The explicit default user, or the first one added"""
+        conn = self.connection
+        rec = conn.execute(_SELECT_DEFAULT_USER).fetchone() or conn.execute(_SELECT_FIRST_USER).fetchone()
+        return rec[0] if rec else None
+
+    def set_default_user(self, user):
+        with self.connection as conn:
+            conn.execute(_DELETE_DEFAULT_USER)
+            conn.execute(_INSERT_DEFAULT_USER, (user,))
+
+    def matches(self, prefix, limit=None):
+        """Users starting with ``prefix``, ignoring the case"""
+        # NOCASE only folds ASCII letters, the upper bound must be folded the same way
+        prefix = "".join(char.lower() if char.isascii() else char for char in prefix)
+        return [
+            rec[0] for rec in self.connection.execute(
+                _SELECT_PREFIX, (prefix, prefix_upper_bound(prefix), -1 if limit is None else limit)
+            )
+        ]
+
+    def find(self, user):
+        """``(user, password)`` for ``user`` or the only user starting with it, ``None`` if there isn't any
+
+        Raises :class:`NautaUserException` if several users start with ``user``.
+        """
+        conn = self.connection
+        rec = conn.execute(_SELECT_USER, (user,)).fetchone()
+        if not rec and user:
+            matches = self.matches(user, limit=2)
+            # The user itself, in another case, sorts before the longer ones
+            if len(matches) > 1 and matches[0].lower() != user.lower():
+                raise NautaUserException(
+                    "Hay varios usuarios que comienzan con '{}': {}".format(
+                        user, ", ".join(self.matches(user, limit=5))
+                    )
+                )
+            rec = matches and conn.execute(_SELECT_USER, (matches[0],)).fetchone()
+
+        return (rec[0], decode_password(rec[1])) if rec else None
+
+    def add(self, user, password):
+        """Adds ``user``, replacing the password if it already exists"""
+        with self.connection as conn:
+            conn.execute(_UPSERT_USER, (user, encode_password(password)))
+
+    def import_accounts(self, accounts, batch_size=IMPORT_BATCH_SIZE):
+        """Adds or updates every ``(user, password)``, committing in batches. Returns the count"""
+        conn = self.connection
+        accounts = iter(accounts)
+        count = 0
+
+        while True:
+            batch = [(user, encode_password(password)) for user, password in islice(accounts, batch_size)]
+            if not batch:
+                return count
+
+            with conn:
+                conn.executemany(_UPSERT_USER, batch)
+            count += len(batch)
+
+    def export_accounts(self):
+        """Yields every ``(user, password)`` without loading them all"""
+        for user, password in self.connection.execute(_SELECT_CREDENTIALS):
+            yield user, decode_password(password)
+
+    def set_password(self, user, password):
+        with self.connection as conn:
+            return conn.execute(_UPDATE_PASSWORD, (encode_password(password), user)).rowcount
+
+    def remove(self, user):
+        with self.connection as conn:
+            count = conn.execute(_DELETE_USER, (user,)).rowcount
+        return count
+
+    def users(self):
+        return [rec[0] for rec in self.connection.execute(_SELECT_USERS)]
+
+    def credentials(self, users=None):
+        users = set(users) if users else None
+        return [
+            (rec[0], decode_password(rec[1]))
+            for rec in self.connection.execute(_SELECT_CREDENTIALS)
+            if not users or rec[0] in users
+        ]
@@ -0,0 +1,437 @@
+"""
+Resident daemon owning the Nauta session
+
+``nauta daemon`` keeps the :class:`NautaClient`, the open session, the
+credential store and the warm connections to the portal in a single
+long running process, and serves them through a JSON-RPC 2.0 API on the
+UNIX socket ``DAEMON_SOCKET``, one JSON message per line. The other
+``nauta`` commands become thin clients of the daemon while it runs, so
+they don't pay for importing the HTTP stack, opening SQLite or a new TLS
+connection.
+
+Methods:
+    up(user, password, session_time, time_unit, full_login, keepalive, auto)
+    down()
+    status()
+    remaining-time(user, password, refresh, ttl)
+    run-connected(cmd, cwd, env, user, password, reuse_connection)
+    stop()
+
+``run-connected`` runs the command in the daemon and streams its output
+as ``output`` notifications before the result. ``up`` with ``keepalive``
+checks the session every ``keepalive`` seconds and logs in again if the
+portal drops it, ``status`` reports the reconnections.
+
+Example:
+    daemon = DaemonClient()
+    print(daemon.call("up", user="pepe")["remaining_time"])
+    daemon.call("run-connected", cmd="git push", on_notification=print)
+
+"""
+
+import codecs
+import inspect
+import logging
+import os
+import socketserver
+import subprocess
+import threading
+import time
+
+from nautapy import appdata_path, unix_socket
+from nautapy.__about__ import __name__ as prog_name
+from nautapy.exceptions import NautaException, NautaPreLoginException
+
+DAEMON_SOCKET = os.path.join(appdata_path, "daemon.sock")
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+NAUTA_ERROR = 1
+NETWORK_ERROR = 2
+
+NETWORK_ERROR_MESSAGE = "Hubo un problema en la red, por favor revise su conexión"
+
+logger = logging.getLogger(__name__)
+
+
+class DaemonUnavailable(OSError):
+    """The daemon is not running, nothing was sent to it"""
+
+
+class DaemonClient(object):
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or DAEMON_SOCKET
+        self.timeout = timeout
+        self._ids = 0
+
+    def is_running(self):
+        return os.path.exists(self.socket_path)
+
+    def call(self, method, on_notification=None, **params):
+        """Result of ``method``, raises :class:`NautaException` with the error message of the daemon
+
+        Raises :class:`DaemonUnavailable` if the daemon can't be reached.
+
+        """
+        try:
+            sock = unix_socket.connect(self.socket_path, self.timeout)
+        except OSError as ex:
+            raise DaemonUnavailable(*ex.args)
+
+        self._ids += 1
+        with sock, sock.makefile("rb") as fp:
+            try:
+                unix_socket.send_message(sock, {"jsonrpc": "2.0", "id": self._ids, "method": method, "params": params})
+                while True:
+                    message = unix_socket.recv_message(fp)
+                    if "id" not in message:
+                        if on_notification:
+                            on_notification(message["method"], message.get("params", {}))
+                        continue
+
+                    if "error" in message:
+                        raise NautaException(message["error"]["message"])
+                    return message["result"]
+            except (OSError, ValueError):
+                raise NautaException("Se perdió la conexión con el daemon")
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = unix_socket.decode_message(line)
+            except ValueError:
+                self._reply(None, error=(PARSE_ERROR, "Parse error"))
+                continue
+
+            if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+                self._reply(message.get("id") if isinstance(message, dict) else None,
+                            error=(INVALID_REQUEST, "Invalid Request"))
+                continue
+
+            result, error = self.server.daemon.dispatch(
+                message["method"], message.get("params") or {}, self._notify
+            )
+            if "id" in message:
+                self._reply(message["id"], result, error)
+
+    def _notify(self, method, **params):
+        unix_socket.send_message(self.connection, {"jsonrpc": "2.0", "method": method, "params": params})
+
+    def _reply(self, id, result=None, error=None):
+        message = {"jsonrpc": "2.0", "id": id}
+        if error:
+            message["error"] = {"code": error[0], "message": error[1]}
+        else:
+            message["result"] = result
+
+        try:
+            unix_socket.send_message(self.connection, message)
+        except OSError:
+            pass
+
+
+class DaemonServer(unix_socket.UnixSocketServer):
+    def __init__(self, daemon, socket_path=None):
+        self.daemon = daemon
+        super().__init__(socket_path or DAEMON_SOCKET, _DaemonHandler)
+
+
+class NautaDaemon(object):
+    """State and methods served by :class:`DaemonServer`
+
+    The session and the credential store are only touched from a single
+    owner thread, the connection threads just wait for it.
+
+    """
+    def __init__(self, session_file=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.session_file = session_file
+        self.client = None
+        self.login_time = None
+        self.deadline = None
+        self.started = time.time()
+        self.calls = 0
+        self.server = None
+
+        self._timer = None
+        self._monitor = None
+        self._owner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="{}-daemon".format(prog_name))
+        self._methods = {
+            "up": self.up,
+            "down": self.down,
+            "status": self.status,
+            "remaining-time": self.remaining_time,
+            "stop": self.stop,
+        }
+
+    def warm_up(self):
+        """Loads everything the first command would otherwise wait for"""
+        def load():
+            from nautapy.credentials import CredentialStore
+            from nautapy.nauta_api import NautaProtocol
+            from nautapy.connection_pool import ConnectionPool
+
+            CredentialStore.default().users()
+            NautaProtocol.get_retry_policy()
+            ConnectionPool.get_adapter()
+
+        self._owner.submit(load).result()
+
+    def dispatch(self, method, params, notify):
+        """``(result, error)`` of calling ``method``, ``error`` is a ``(code, message)`` tuple"""
+        from requests import RequestException
+
+        self.calls += 1
+        if method == "run-connected":
+            func, call = self.run_connected, self.run_connected
+            params = dict(params, notify=notify) if isinstance(params, dict) else params
+        elif method in self._methods:
+            func = self._methods[method]
+            call = self._owned(func)
+        else:
+            return None, (METHOD_NOT_FOUND, "Method not found: {}".format(method))
+
+        try:
+            inspect.signature(func).bind(**params)
+        except TypeError as ex:
+            return None, (INVALID_PARAMS, "Invalid params: {}".format(ex))
+
+        logger.info("%s", method)
+        try:
+            return call(**params), None
+        except NautaException as ex:
+            logger.info("%s: %s", method, ex.args[0])
+            return None, (NAUTA_ERROR, ex.args[0])
+        except RequestException as ex:
+            logger.info("%s: %s", method, ex)
+            return None, (NETWORK_ERROR, NETWORK_ERROR_MESSAGE)
+        except Exception as ex:
+            logger.exception("%s failed", method)
+            return None, (INTERNAL_ERROR, "{}: {}".format(type(ex).__name__, ex))
+
+    def _owned(self, func):
+        def call(**params):
+            return self._owner.submit(func, **params).result()
+        return call
+
+    def _credentials(self, user=None, password=None):
+        from nautapy.credentials import CredentialStore
+
+        store = CredentialStore.default()
+        user = user or store.default_user()
+        if not user:
+            raise NautaException(
+                "No existe ningún usuario. Debe crear uno. "
+                "Ejecute '{} --help' para más ayuda".format(prog_name)
+            )
+        return store.find(user) or (user, password)
+
+    def _session_client(self):
+        """Client of the open session, opened by the daemon or by another process"""
+        from nautapy.nauta_api import NautaClient
+
+        if self.client and self.client.session:
+            return self.client
+
+        client = NautaClient(None, None, session_file=self.session_file)
+        if not client.is_logged_in:
+            return None
+
+        client.load_last_session()
+        client.user = client.session.__dict__.get("username")
+        return client
+
+    def _schedule_logout(self, duration):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self.deadline = None
+
+        if duration is not None:
+            self.deadline = self.login_time + duration
+            self._timer = threading.Timer(duration, self._owned(self._timed_logout))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_logout(self):
+        if self.client and self.client.session:
+            logger.info("Session time is over, logging out %s", self.client.user)
+            try:
+                self._logout(self.client)
+            except Exception:
+                logger.exception("Timed logout failed")
+
+    def _keepalive(self, client, interval):
+        from nautapy.keepalive import SessionMonitor
+
+        # Checks and logins go through the owner thread like any other call
+        self._monitor = SessionMonitor(
+            client, interval=interval, execute=lambda func: self._owner.submit(func).result()
+        ).start()
+
+    def _logout(self, client):
+        self._schedule_logout(None)
+        if self._monitor:
+            self._monitor.stop(wait=False)
+        try:
+            client.logout()
+        finally:
+            if client is self.client and not client.session:
+                self.client = None
+                self.login_time = None
+
+    def up(self, user=None, password=None, session_time=None, time_unit=None, full_login=False, keepalive=None,
+           auto=False):
+        return self._up(user, password, session_time, time_unit, full_login, keepalive, auto)
+
+    def _up(self, user, password, session_time=None, time_unit=None, full_login=False, keepalive=None,
+            auto=False, command=None):
+        from nautapy import utils
+        from nautapy.nauta_api import NautaClient
+        from nautapy.scheduler import session_duration
+        from nautapy.traffic import TrafficMeter
+
+        if self._session_client():
+            raise NautaPreLoginException("Hay una sessión abierta")
+
+        client_kwargs = dict(
+            fast_login=not full_login, session_file=self.session_file, traffic=TrafficMeter(command=command)
+        )
+        if auto:
+            from nautapy.credentials import CredentialStore
+            from nautapy.selection import AccountSelector
+
+            client = AccountSelector().login(CredentialStore.default().credentials(), **client_kwargs)
+            user = client.user
+        else:
+            user, password = self._credentials(user, password)
+            client = NautaClient(user, password, **client_kwargs)
+            client.login()
+        self.client = client
+        self.login_time = time.time()
+        self._monitor = None
+        if keepalive:
+            self._keepalive(client, keepalive)
+
+        remaining_time = utils.val_or_error(lambda: client.remaining_time)
+        self._schedule_logout(session_duration(session_time, time_unit, remaining_time))
+
+        return {
+            "user": user,
+            "remaining_time": remaining_time,
+            "login_time": self.login_time,
+            "deadline": self.deadline,
+            "time_saved": client.time_saved,
+        }
+
+    def down(self):
+        client = self._session_client()
+        if not client:
+            return {"user": None, "health": None}
+
+        monitor = self._monitor if client is self.client else None
+        self._logout(client)
+        return {"user": client.user, "health": monitor.stats.as_dict() if monitor else None}
+
+    def status(self):
+        client = self._session_client()
+        return {
+            "logged_in": bool(client),
+            "user": client.user if client else None,
+            "login_time": self.login_time if client is self.client else None,
+            "deadline": self.deadline,
+            "health": self._monitor.stats.as_dict() if self._monitor and client is self.client else None,
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started,
+            "calls": self.calls,
+        }
+
+    def remaining_time(self, user=None, password=None, refresh=False, ttl=None):
+        from nautapy import utils
+        from nautapy.nauta_api import NautaClient
+
+        user, password = self._credentials(user, password)
+        client = self._session_client()
+        if not client or client.user != user:
+            client = NautaClient(user, password, session_file=self.session_file)
+            if client.is_logged_in:
+                client.load_last_session()
+        if ttl is not None:
+            client.time_cache.ttl = ttl
+
+        return {
+            "user": user,
+            "remaining_time": utils.val_or_error(lambda: client.get_remaining_time(refresh=refresh)),
+        }
+
+    def run_connected(self, cmd, notify, cwd=None, env=None, user=None, password=None, reuse_connection=False):
+        from nautapy.nauta_api import NautaProtocol
+
+        open_session = self._owned(self._session_client)()
+        if open_session or self._owned(NautaProtocol.is_connected)():
+            if not reuse_connection:
+                raise NautaException(
+                    "ya hay una conexión activa a internet, si aún así desea usar -run-connected "
+                    "agregue el flag --reuse-connection"
+                )
+        else:
+            self._owned(self._up)(user=user, password=password, command=cmd)
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            proc = subprocess.Popen(
+                cmd, shell=True, cwd=cwd, env=env,
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            with proc.stdout:
+                try:
+                    for chunk in iter(lambda: os.read(proc.stdout.fileno(), 65536), b""):
+                        notify("output", data=decoder.decode(chunk))
+                except OSError:
+                    # The client went away, let the command finish anyway
+                    pass
+                exit_code = proc.wait()
+        finally:
+            self._owned(self.down)()
+
+        return {"exit_code": exit_code}
+
+    def stop(self):
+        if self.server:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {"pid": os.getpid()}
+
+    def close(self):
+        if self._timer:
+            self._timer.cancel()
+        if self._monitor:
+            self._monitor.stop(wait=False)
+        self._owner.shutdown(wait=True)
+
+
+def serve(socket_path=None, session_file=None, ready=None):
+    """Runs the daemon until ``stop`` is called"""
+    daemon = NautaDaemon(session_file=session_file)
+    try:
+        server = DaemonServer(daemon, socket_path)
+    except BaseException:
+        daemon.close()
+        raise
+    daemon.server = server
+    daemon.warm_up()
+
+    if ready:
+        ready(server)
+
+    try:
+        server.serve_forever(0.2)
+    finally:
+        server.server_close()
+        daemon.close()
@@ -14,6 +14,18 @@ class NautaLoginException(NautaException):
     pass
 
 
+class NautaSessionExpiredException(NautaLoginException):
+    """The portal rejected the login form, not the credentials"""
+    pass
+
+
 class NautaLogoutException(NautaException):
     pass
 
+
+class NautaUserException(NautaException):
+    pass
+
+
+class NautaCircuitOpenException(NautaException):
+    pass
@@ -0,0 +1,204 @@
+"""
+Lightweight extraction of the few values needed from portal pages
+
+Builds no document tree: pages are scanned with :class:`html.parser.HTMLParser`
+events (or a compiled regex) and parsing stops as soon as the requested
+fields are found. Every function returns ``None`` when it can't find what
+it's looking for, so callers can fall back to a full parser.
+
+"""
+
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+Form = namedtuple("Form", ["action", "inputs"])
+
+_re_script = re.compile(r'<script[^>]*>(?P<text>.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+_re_alert = re.compile(r'alert\(\"(?P<reason>[^\"]*?)\"\)')
+
+_VOID_ELEMENTS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+])
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _StreamingParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+
+    def feed(self, data):
+        if self.done:
+            return
+
+        try:
+            super().feed(data)
+        except _StopParsing:
+            self.done = True
+
+    def stop(self):
+        raise _StopParsing()
+
+
+class FormExtractor(_StreamingParser):
+    """Collects the ``input[name]`` values of a form
+
+    If ``form_id`` is ``None`` every input of the document is collected.
+    If ``names`` is given, parsing stops once all of them are found.
+
+    """
+    def __init__(self, form_id=None, names=None):
+        super().__init__()
+        self.form_id = form_id
+        self.names = set(names or ())
+        self.action = None
+        self.inputs = {}
+        self.found = form_id is None
+        self._inside = form_id is None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "form" and self.form_id is not None:
+            attrs = dict(attrs)
+            if attrs.get("id") == self.form_id:
+                self.found = self._inside = True
+                self.action = attrs.get("action")
+        elif tag == "form" and self.action is None:
+            self.action = dict(attrs).get("action")
+        elif tag == "input" and self._inside:
+            attrs = dict(attrs)
+            if "name" in attrs:
+                self.inputs[attrs["name"]] = attrs.get("value")
+                if self.names and self.names.issubset(self.inputs):
+                    self.stop()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "form" and self._inside and self.form_id is not None:
+            self.stop()
+
+    @property
+    def form(self):
+        if not self.found or (self.names and not self.names.issubset(self.inputs)):
+            return None
+        return Form(self.action, self.inputs)
+
+
+class CellExtractor(_StreamingParser):
+    """Collects the text of ``#table_id tr:nth-child(row) > td:nth-child(col)``
+
+    As in the selector, ``col`` counts every element child of the row
+    (``th`` cells included) and the cell found must be a ``td``.
+
+    """
+    def __init__(self, table_id, row, col):
+        super().__init__()
+        self.table_id = table_id
+        self.row = row
+        self.col = col
+        self.text = None
+        self._depth = 0
+        self._rows = 0
+        self._cols = 0
+        # Open elements inside the current cell of the row
+        self._level = 0
+
+    def _in_row(self):
+        return self._depth == 1 and self._rows == self.row
+
+    def _start_child(self, tag, void=False):
+        if tag in ("td", "th"):
+            # A new cell closes the previous one when its end tag was omitted
+            if self.text is not None:
+                self.stop()
+            self._level = 0
+        if self._level:
+            if not void:
+                self._level += 1
+            return
+
+        self._cols += 1
+        if self._cols == self.col and tag == "td":
+            self.text = ""
+        elif self._cols >= self.col:
+            self.stop()
+        if not void:
+            self._level = 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self._depth or dict(attrs).get("id") == self.table_id:
+                self._depth += 1
+        elif self._depth == 1 and tag == "tr":
+            if self.text is not None:
+                self.stop()
+            self._rows += 1
+            self._cols = 0
+            self._level = 0
+        elif self._in_row():
+            self._start_child(tag, void=tag in _VOID_ELEMENTS)
+
+    def handle_startendtag(self, tag, attrs):
+        if self._in_row() and tag != "table":
+            self._start_child(tag, void=True)
+        else:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._depth:
+            self._depth -= 1
+            if not self._depth:
+                self.stop()
+        elif self._depth == 1 and tag == "tr":
+            if self.text is not None:
+                self.stop()
+            self._level = 0
+        elif self._in_row() and self._level and tag not in _VOID_ELEMENTS:
+            self._level -= 1
+            if not self._level and self.text is not None:
+                self.stop()
+
+    def handle_data(self, data):
+        if self.text is not None:
+            self.text += data
+
+
+def _feed(parser, source):
+    chunks = [source] if isinstance(source, str) else source
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser
+
+
+def extract_form(source, form_id=None, names=None):
+    """Action and inputs of a form, from a string or an iterable of chunks"""
+    return _feed(FormExtractor(form_id=form_id, names=names), source).form
+
+
+def extract_cell(source, table_id, row, col):
+    text = _feed(CellExtractor(table_id, row, col), source).text
+    return text.strip() if text is not None else None
+
+
+def find_alert(script):
+    """Message of the ``alert("...")`` call in the text of a script"""
+    match = _re_alert.search(script)
+    return match and match.group("reason")
+
+
+def extract_alert(html):
+    """Message of the ``alert("...")`` call in the last script of the page"""
+    scripts = _re_script.findall(html)
+    if not scripts:
+        return None
+
+    return find_alert(scripts[-1])
@@ -0,0 +1,182 @@
+"""
+Hedged requests to the portal
+
+When an idempotent request has not been answered after the usual latency
+of its endpoint, :class:`Hedger` sends a duplicate, which takes another
+connection of the pool, and returns whichever response arrives first. A
+single stuck ``LogoutServlet`` POST then costs a percentile of the
+latency instead of the whole timeout, which matters when every second
+connected is billed.
+
+The latencies are kept per endpoint in a :class:`LatencyHistogram` of
+the last ``WINDOW`` responses, and stored in ``LATENCY_FILE`` so short
+lived commands like ``nauta down`` learn from the previous ones.
+
+Example:
+    hedger = Hedger(percentile=95)
+    response = hedger.call("logout", session.post, url, timeout=10)
+    hedger.save()
+
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+from nautapy import appdata_path, session_store
+
+LATENCY_FILE = os.path.join(appdata_path, "latency")
+
+HEDGED_OPERATIONS = ("logout", "get_user_time")
+
+PERCENTILE = 95
+WINDOW = 200
+MIN_SAMPLES = 10
+# Hedge delay while an endpoint has too few samples
+DEFAULT_DELAY = 2.0
+MIN_DELAY = 0.05
+
+
+class LatencyHistogram(object):
+    """Latencies of the last ``window`` responses, kept sorted for the percentiles"""
+    def __init__(self, window=WINDOW, samples=()):
+        self.window = window
+        self._recent = deque()
+        self._sorted = []
+        for sample in samples:
+            self.add(sample)
+
+    def __len__(self):
+        return len(self._recent)
+
+    def add(self, latency):
+        self._recent.append(latency)
+        bisect.insort(self._sorted, latency)
+        if len(self._recent) > self.window:
+            oldest = self._recent.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+
+    def percentile(self, p):
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, int(len(self._sorted) * p / 100))
+        return self._sorted[index]
+
+    def samples(self):
+        return list(self._recent)
+
+
+class HedgeStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def as_dict(self):
+        return {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+def _start(func, args, kwargs, on_success):
+    # Daemon threads, a loser stuck until its timeout must not keep the process alive
+    future = Future()
+
+    def run():
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as ex:
+            future.set_exception(ex)
+        else:
+            on_success(time.monotonic() - start)
+            future.set_result(result)
+
+    future.set_running_or_notify_cancel()
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class Hedger(object):
+    def __init__(self, percentile=PERCENTILE, window=WINDOW, min_samples=MIN_SAMPLES,
+                 default_delay=DEFAULT_DELAY, path=None):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.path = path
+
+        self.histograms = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            record = session_store.read_record(self.path)
+        except (OSError, ValueError):
+            return
+
+        for endpoint, samples in record.items():
+            self.histograms[endpoint] = LatencyHistogram(self.window, samples)
+
+    def save(self):
+        with self._lock:
+            record = {endpoint: histogram.samples() for endpoint, histogram in self.histograms.items()}
+        session_store.write_record(self.path, record)
+
+    def record(self, endpoint, latency):
+        with self._lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                histogram = self.histograms[endpoint] = LatencyHistogram(self.window)
+            histogram.add(latency)
+
+    def delay(self, endpoint):
+        """Seconds to wait for a response of ``endpoint`` before hedging"""
+        with self._lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None or len(histogram) < self.min_samples:
+                return self.default_delay
+            return max(MIN_DELAY, histogram.percentile(self.percentile))
+
+    def call(self, endpoint, func, *args, accept=None, **kwargs):
+        """Calls ``func``, and a duplicate if it is slow, returning the first successful result
+
+        A result rejected by ``accept`` only wins if the other request fails
+        too, e.g. the duplicate of a logout that the portal already processed.
+
+        """
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, HedgeStats())
+            stats.calls += 1
+
+        def on_success(latency):
+            self.record(endpoint, latency)
+
+        primary = _start(func, args, kwargs, on_success)
+        done, _ = wait([primary], timeout=self.delay(endpoint))
+        if done:
+            return primary.result()
+
+        hedge = _start(func, args, kwargs, on_success)
+        with self._lock:
+            stats.hedged += 1
+
+        pending = {primary, hedge}
+        fallback = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and (accept is None or accept(future.result())):
+                    if future is hedge:
+                        with self._lock:
+                            stats.hedge_wins += 1
+                    return future.result()
+                if fallback is None or fallback.exception() is not None:
+                    fallback = future
+
+        return fallback.result()
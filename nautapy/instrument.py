@@ -0,0 +1,299 @@
+"""
+Instrumentation of the conversations with the portal
+
+While ``NautaProtocol.tracer`` is set, every phase of the protocol
+(probe, landing page, login form, login POST, ``online.do`` parse, ...)
+is recorded as a :class:`Span` with its duration, the bytes sent and
+received and the retries it took. Bytes are only known for the spans
+that send requests through the tracked session, they are ``None`` for the
+others (the connectivity probes, the parsing, ...). Finished spans are
+added to the totals of the :class:`Tracer`, which only keeps the last
+``MAX_SPANS``, and handed to its sinks:
+
+* :class:`LogSink` writes a log line per span.
+* :class:`JsonSink` appends a JSON line per span to a file.
+* :class:`PrometheusSink` aggregates them and serves the Prometheus text
+  exposition format on a local port.
+
+Example:
+    NautaProtocol.tracer = Tracer([JsonSink("spans.jsonl")])
+    client.login()
+    for name, stats in NautaProtocol.tracer.summary().items():
+        print(name, stats["duration"])
+
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nautapy import ensure_dir
+
+METRICS_HOST = "127.0.0.1"
+MAX_SPANS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _message_size(start_line, headers, body):
+    size = len(start_line) + 2
+    for name, value in headers.items():
+        size += len(name) + len(str(value)) + 4
+    size += 2
+
+    if body is None:
+        return size
+    return size + (len(body.encode("utf-8")) if isinstance(body, str) else len(body))
+
+
+def request_size(request):
+    """Approximate bytes on the wire of a ``requests.PreparedRequest``"""
+    return _message_size("{} {} HTTP/1.1".format(request.method, request.path_url), request.headers, request.body)
+
+
+def response_size(response):
+    """Approximate bytes on the wire of a ``requests.Response``"""
+    return _message_size("HTTP/1.1 {} {}".format(response.status_code, response.reason or ""),
+                         response.headers, response.content)
+
+
+class Span(object):
+    def __init__(self, name, depth=0, **attrs):
+        self.name = name
+        self.depth = depth
+        self.attrs = attrs
+
+        self.start = time.time()
+        self.duration = None
+        # Set by track(), the bytes of a span without requests are unknown
+        self.bytes_sent = None
+        self.bytes_received = None
+        self.attempts = 0
+        self.error = None
+
+        self._lock = threading.Lock()
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    def track(self, send):
+        """Wraps ``send``, a ``requests.Session.request`` alike, counting attempts and bytes"""
+        with self._lock:
+            self.bytes_sent = self.bytes_sent or 0
+            self.bytes_received = self.bytes_received or 0
+
+        def tracked(*args, **kwargs):
+            with self._lock:
+                self.attempts += 1
+
+            response = send(*args, **kwargs)
+
+            sent = received = 0
+            for r in response.history + [response]:
+                sent += request_size(r.request)
+                received += response_size(r)
+
+            with self._lock:
+                self.bytes_sent += sent
+                self.bytes_received += received
+            return response
+
+        return tracked
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "retries": self.retries,
+            "error": self.error,
+            **self.attrs
+        }
+
+
+def _add(total, value):
+    return total if value is None else (total or 0) + value
+
+
+class Tracer(object):
+    def __init__(self, sinks=(), max_spans=MAX_SPANS):
+        self.sinks = list(sinks)
+        self.spans = deque(maxlen=max_spans)
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        depth = getattr(self._local, "depth", 0)
+        span = Span(name, depth, **attrs)
+
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as ex:
+            span.error = type(ex).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self._local.depth = depth
+            self.finish(span)
+
+    def finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+            stats = self._totals.get(span.name)
+            if stats is None:
+                stats = self._totals[span.name] = {
+                    "start": span.start, "depth": span.depth, "count": 0, "duration": 0.0,
+                    "bytes_sent": None, "bytes_received": None, "retries": 0, "errors": 0,
+                }
+            stats["start"] = min(stats["start"], span.start)
+            stats["count"] += 1
+            stats["duration"] += span.duration
+            stats["bytes_sent"] = _add(stats["bytes_sent"], span.bytes_sent)
+            stats["bytes_received"] = _add(stats["bytes_received"], span.bytes_received)
+            stats["retries"] += span.retries
+            stats["errors"] += 1 if span.error else 0
+
+        for sink in self.sinks:
+            try:
+                sink.emit(span)
+            except Exception:
+                # A broken sink must never break a login
+                logger.exception("Sink %r failed", sink)
+
+    def summary(self):
+        """Totals per span name of every finished span, in the order they were first started"""
+        with self._lock:
+            totals = sorted(self._totals.items(), key=lambda item: item[1]["start"])
+            return {
+                name: {key: value for key, value in stats.items() if key != "start"}
+                for name, stats in totals
+            }
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class LogSink(object):
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def emit(self, span):
+        self.logger.log(
+            self.level, "%s %.3fs%s retries=%d%s",
+            span.name, span.duration,
+            "" if span.bytes_sent is None else " sent={}B received={}B".format(span.bytes_sent, span.bytes_received),
+            span.retries,
+            " error={}".format(span.error) if span.error else ""
+        )
+
+    def close(self):
+        pass
+
+
+class JsonSink(object):
+    def __init__(self, path):
+        self.path = path
+        ensure_dir(path)
+        self._fp = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        line = json.dumps(span.as_dict(), ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._fp.write(line + "\n")
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
+class PrometheusSink(object):
+    """Serves the aggregated spans in ``/metrics`` while the process runs"""
+    # Name, type, help and position in the aggregated values of a phase:
+    # count, seconds, bytes sent, bytes received, retries, errors
+    METRICS = [
+        ("nauta_phase_seconds", "summary", "Time spent in each phase of the protocol", 1),
+        ("nauta_phase_bytes_sent_total", "counter", "Bytes sent to the portal", 2),
+        ("nauta_phase_bytes_received_total", "counter", "Bytes received from the portal", 3),
+        ("nauta_phase_retries_total", "counter", "Retried requests", 4),
+        ("nauta_phase_errors_total", "counter", "Phases that ended with an error", 5),
+    ]
+
+    def __init__(self, port, host=METRICS_HOST):
+        self._phases = {}
+        self._lock = threading.Lock()
+
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                payload = sink.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def emit(self, span):
+        with self._lock:
+            phase = self._phases.setdefault(span.name, [0, 0.0, None, None, 0, 0])
+            phase[0] += 1
+            phase[1] += span.duration
+            phase[2] = _add(phase[2], span.bytes_sent)
+            phase[3] = _add(phase[3], span.bytes_received)
+            phase[4] += span.retries
+            phase[5] += 1 if span.error else 0
+
+    def exposition(self):
+        with self._lock:
+            phases = {name: list(values) for name, values in self._phases.items()}
+
+        lines = []
+        for metric, kind, help_text, index in self.METRICS:
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} {}".format(metric, kind))
+            for name, values in sorted(phases.items()):
+                if values[index] is None:
+                    # No bytes measured for this phase
+                    continue
+                label = '{{phase="{}"}}'.format(name.replace("\\", "\\\\").replace('"', '\\"'))
+                if kind == "summary":
+                    lines.append("{}_sum{} {}".format(metric, label, values[index]))
+                    lines.append("{}_count{} {}".format(metric, label, values[0]))
+                else:
+                    lines.append("{}{} {}".format(metric, label, values[index]))
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,286 @@
+"""
+Persistent queue for ``nauta run-connected``
+
+Commands are stored in ``jobs.db``, next to ``users.db``, with
+``nauta run-connected --enqueue``. :class:`QueueRunner` opens a single
+session, runs the queued commands in a pool of subprocesses streaming
+their output, and logs out when the queue drains (or at the end of the
+billed time unit, see :mod:`nautapy.scheduler`).
+
+Example:
+    queue = JobQueue()
+    queue.enqueue("rsync -a backup/ server:backup/")
+
+    runner = QueueRunner(queue, client, time_unit=60, jobs=4)
+    runner.run()
+
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import wait
+
+from nautapy import appdata_path, ensure_dir, migrations
+from nautapy.scheduler import BillingScheduler, LOGOUT_MARGIN
+
+JOBS_DB = os.path.join(appdata_path, "jobs.db")
+POLL_INTERVAL = 0.5
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _create_tables(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "cmd TEXT NOT NULL, "
+        "cwd TEXT, "
+        "state TEXT NOT NULL DEFAULT 'pending', "
+        "exit_code INTEGER, "
+        "created REAL NOT NULL, "
+        "started REAL, "
+        "finished REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+
+def _job_owner(conn):
+    # Pid of the runner executing the job
+    conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+
+
+MIGRATIONS = [_create_tables, _job_owner]
+
+Job = namedtuple("Job", ["id", "cmd", "cwd", "state", "exit_code", "created", "started", "finished", "owner"])
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, owned by another user
+        return True
+    return True
+
+
+class JobQueue(object):
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        ensure_dir(path)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        migrations.migrate(self._conn, MIGRATIONS)
+
+    def close(self):
+        self._conn.close()
+
+    def enqueue(self, cmd, cwd=None):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (cmd, cwd, created) VALUES (?, ?, ?)",
+                (cmd, cwd, time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit=1):
+        """Marks up to ``limit`` pending jobs as running and returns them, oldest first"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                jobs = [
+                    Job(*row) for row in self._conn.execute(
+                        "SELECT * FROM jobs WHERE state=? ORDER BY id LIMIT ?", (PENDING, limit)
+                    )
+                ]
+                now = time.time()
+                owner = os.getpid()
+                self._conn.executemany(
+                    "UPDATE jobs SET state=?, started=?, owner=? WHERE id=?",
+                    [(RUNNING, now, owner, job.id) for job in jobs]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [job._replace(state=RUNNING, started=now, owner=owner) for job in jobs]
+
+    def finish(self, job_id, exit_code):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state=?, exit_code=?, finished=? WHERE id=?",
+                (DONE if exit_code == 0 else FAILED, exit_code, time.time(), job_id)
+            )
+
+    def requeue_running(self):
+        """Returns to the queue the jobs left running by a runner that died
+
+        The jobs of a runner still alive are left alone, another
+        ``nauta queue run`` would run them twice.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                owners = [
+                    row[0] for row in self._conn.execute("SELECT DISTINCT owner FROM jobs WHERE state=?", (RUNNING,))
+                ]
+                # Jobs claimed before the owner was recorded have none
+                orphaned = [(PENDING, RUNNING, owner) for owner in owners if owner is None or not process_alive(owner)]
+                count = 0
+                for params in orphaned:
+                    count += self._conn.execute(
+                        "UPDATE jobs SET state=?, started=NULL, owner=NULL WHERE state=? AND owner IS ?", params
+                    ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return count
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM jobs WHERE state=?", (PENDING,)).fetchone()[0]
+
+    def jobs(self, states=None):
+        query = "SELECT * FROM jobs"
+        params = ()
+        if states:
+            query += " WHERE state IN ({})".format(", ".join("?" * len(states)))
+            params = tuple(states)
+
+        with self._lock:
+            return [Job(*row) for row in self._conn.execute(query + " ORDER BY id", params)]
+
+    def clear(self, states=(DONE, FAILED)):
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE state IN ({})".format(", ".join("?" * len(states))),
+                tuple(states)
+            ).rowcount
+
+
+class RunnerStats(object):
+    def __init__(self):
+        self.done = 0
+        self.failed = 0
+        self.sessions = 0
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "sessions": self.sessions,
+            "elapsed": self.elapsed,
+        }
+
+
+class QueueRunner(object):
+    def __init__(self, queue, client, time_unit=None, jobs=1, logout_margin=LOGOUT_MARGIN,
+                 output=None, poll_interval=POLL_INTERVAL):
+        self.queue = queue
+        self.client = client
+        self.time_unit = time_unit
+        self.jobs = jobs
+        self.logout_margin = logout_margin
+        self.output = output or sys.stdout
+        self.poll_interval = poll_interval
+
+        self.stats = RunnerStats()
+        self._output_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _write(self, job, line):
+        if self.jobs > 1:
+            line = "[{}] {}".format(job.id, line)
+
+        with self._output_lock:
+            self.output.write(line)
+            self.output.flush()
+
+    def _run_job(self, job):
+        try:
+            process = subprocess.Popen(
+                job.cmd,
+                shell=True,
+                cwd=job.cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                universal_newlines=True,
+                errors="replace"
+            )
+        except OSError as ex:
+            self._write(job, "{}\n".format(ex))
+            exit_code = None
+        else:
+            with process:
+                for line in process.stdout:
+                    self._write(job, line)
+            exit_code = process.returncode
+
+        self.queue.finish(job.id, exit_code)
+        with self._output_lock:
+            if exit_code == 0:
+                self.stats.done += 1
+            else:
+                self.stats.failed += 1
+
+    def _worker(self):
+        # Each worker keeps pulling jobs, so the session is held until the
+        # queue is really empty and not just between two jobs
+        while not self._stop.is_set():
+            jobs = self.queue.claim()
+            if not jobs:
+                return
+            self._run_job(jobs[0])
+
+    def _drain(self, scheduler):
+        futures = [scheduler.submit(self._worker) for _ in range(self.jobs)]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def run(self):
+        """Runs queued jobs until the queue is empty and the session is closed"""
+        start = time.perf_counter()
+        self.queue.requeue_running()
+
+        scheduler = BillingScheduler(
+            self.client,
+            self.time_unit,
+            logout_margin=self.logout_margin,
+            max_workers=self.jobs
+        )
+        try:
+            while True:
+                if self.queue.pending():
+                    self._drain(scheduler)
+                elif not scheduler.logged_in:
+                    break
+                else:
+                    # Jobs enqueued before the paid time unit ends reuse the session
+                    time.sleep(self.poll_interval)
+        except BaseException:
+            # Let running jobs finish but don't start new ones
+            self._stop.set()
+            raise
+        finally:
+            scheduler.close()
+            self.stats.sessions = scheduler.stats.sessions
+            self.stats.elapsed = time.perf_counter() - start
+
+        if scheduler.logout_error:
+            raise scheduler.logout_error
+
+        return self.stats
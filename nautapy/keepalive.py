@@ -0,0 +1,192 @@
+"""
+Health monitor of an open session
+
+Nothing tells when the portal drops a session: the session file stays
+and the loss is only noticed when the traffic fails. :class:`SessionMonitor`
+probes the connection every ``interval`` seconds in a background thread.
+When the probe fails the portal is asked for the remaining time of the
+session, a time means the session is alive and the outage is upstream,
+an error means it was dropped and the monitor logs in again reusing the
+cached login form (see ``NautaClient.login``).
+
+Example:
+    client.login()
+    with SessionMonitor(client, interval=30) as monitor:
+        transfer()
+    print(monitor.stats.as_dict())
+
+"""
+
+import logging
+import threading
+import time
+
+from nautapy import utils
+from nautapy.exceptions import NautaException
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = 60
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 120
+
+ALIVE = "alive"
+DROPPED = "dropped"
+UNREACHABLE = "unreachable"
+CLOSED = "closed"
+
+
+class HealthStats(object):
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.checks = 0
+        self.drops = 0
+        self.reconnects = 0
+        self.failed_reconnects = 0
+        self.downtime = 0.0
+        self.down_since = None
+
+    def as_dict(self):
+        downtime = self.downtime
+        if self.down_since is not None:
+            downtime += self.clock() - self.down_since
+
+        return {
+            "checks": self.checks,
+            "drops": self.drops,
+            "reconnects": self.reconnects,
+            "failed_reconnects": self.failed_reconnects,
+            "downtime": downtime,
+            "down": self.down_since is not None,
+        }
+
+
+class SessionMonitor(object):
+    """Watches the session of ``client`` and logs in again when it's dropped
+
+    ``execute(func)`` runs the checks and logins, it allows the owner of
+    the client to serialize them with its own calls.
+    """
+    def __init__(self, client, interval=INTERVAL, retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY,
+                 execute=None, clock=time.monotonic):
+        self.client = client
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.execute = execute or (lambda func: func())
+        self.clock = clock
+        self.stats = HealthStats(clock)
+
+        self._dropped = False
+        self._failures = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """State of the session: ``ALIVE``, ``DROPPED``, ``UNREACHABLE`` or ``CLOSED``"""
+        from requests import RequestException
+        from nautapy.nauta_api import NautaProtocol
+
+        if not self.client.is_logged_in:
+            return CLOSED
+
+        self.stats.checks += 1
+        if self._dropped:
+            # Known to be dead until a login succeeds
+            return DROPPED
+        if NautaProtocol.is_connected(use_cache=False):
+            return ALIVE
+
+        try:
+            utils.strtime2seconds(self.client.get_remaining_time(refresh=True))
+        except RequestException:
+            return UNREACHABLE
+        except NautaException:
+            return DROPPED
+        return ALIVE
+
+    def reconnect(self):
+        from requests import RequestException
+
+        previous = self.client.session
+        try:
+            self.client.login(reconnect=True)
+        except (NautaException, RequestException) as ex:
+            self.client.session = previous
+            self.stats.failed_reconnects += 1
+            logger.warning("Reconnect of %s failed: %s", self.client.user, ex)
+            return False
+
+        self.stats.reconnects += 1
+        logger.info("Session of %s restored", self.client.user)
+        return True
+
+    def _up(self):
+        if self.stats.down_since is not None:
+            self.stats.downtime += self.clock() - self.stats.down_since
+            self.stats.down_since = None
+        self._dropped = False
+        self._failures = 0
+
+    def _down(self):
+        if self.stats.down_since is None:
+            self.stats.down_since = self.clock()
+        self._failures += 1
+        return min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1))
+
+    def step(self):
+        """Checks the session once, returns the seconds to wait for the next check or ``None`` to stop"""
+        if self._stopped.is_set():
+            return None
+
+        state = self.check()
+        if state == CLOSED:
+            return None
+        if state == ALIVE:
+            self._up()
+            return self.interval
+
+        if state == UNREACHABLE:
+            logger.info("The portal can't be reached, session state unknown")
+            return self._down()
+
+        if not self._dropped:
+            self._dropped = True
+            self.stats.drops += 1
+            logger.warning("Session of %s was dropped by the portal", self.client.user)
+
+        delay = self._down()
+        if self.reconnect():
+            self._up()
+            return self.interval
+        return delay
+
+    def _run(self):
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            try:
+                delay = self.execute(self.step)
+            except Exception:
+                logger.exception("Session check failed")
+                delay = self.interval
+            if delay is None:
+                break
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="nauta-keepalive", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        """Stops the checks, ``wait=False`` when called from ``execute``"""
+        self._stopped.set()
+        if wait and self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self.stats.down_since is not None:
+            self._up()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
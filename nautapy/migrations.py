@@ -0,0 +1,42 @@
+"""
+Versioned schema of the sqlite databases
+
+The schema of each database is a list of migrations, functions taking the
+connection. ``PRAGMA user_version`` counts the ones applied, so opening a
+database that is up to date reads a single pragma and runs no DDL.
+
+Example:
+    def _create_tables(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, cmd TEXT)")
+
+    migrate(sqlite3.connect(path), [_create_tables])
+
+"""
+
+import time
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations):
+    """Applies the pending ``migrations``, returns whether any was"""
+    if schema_version(conn) >= len(migrations):
+        return False
+
+    # Persistent, readers don't block the writer of other processes
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # Another process may have migrated it while waiting for the lock
+        version = schema_version(conn)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, applied REAL)"
+        )
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            migration(conn)
+            conn.execute("INSERT OR REPLACE INTO schema_migrations VALUES (?, ?)", (number, time.time()))
+
+        conn.execute("PRAGMA user_version={:d}".format(len(migrations)))
+    return version < len(migrations)
@@ -0,0 +1,325 @@
+"""
+Local imitation of the Nauta Captive Portal
+
+Serves the same sequence of pages as ``secure.etecsa.net:8443`` from
+``127.0.0.1`` so the protocol layer can be exercised, and load tested,
+without a real account. Point ``nauta_api.LOGIN_URL`` to
+:attr:`MockPortal.url` and ``nauta_api.CHECK_PAGE`` to
+:attr:`MockPortal.check_url`.
+
+Slow or flaky portals are imitated with ``latency`` (seconds, or a dict
+of seconds per path), ``jitter``, ``error_rate`` (answer
+``error_status``) and ``drop_rate`` (close the connection without
+answering), optionally limited to ``fault_paths``.
+
+Example:
+    with MockPortal(accounts={"pepe@nauta.com.cu": "pepepass"}, latency=0.05, error_rate=0.01) as portal:
+        nauta_api.LOGIN_URL = portal.url
+        NautaClient("pepe@nauta.com.cu", "pepepass", check_connection=False).login()
+
+It can also run standalone, e.g. for ``nauta`` or external load tests:
+    python -m nautapy.mock_portal --port 8443 --users 100 --latency 0.05
+
+"""
+
+import argparse
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+LANDING_TEMPLATE = """<html><body><form name="CMCCWLANFORM" method="post" action="{url}">
+<input type="hidden" name="wlanuserip" value="{wlanuserip}">
+<input type="hidden" name="wlanparameter" value="546f8eae1194e0ab79c9398c170129ec12734f9518ee324a">
+</form><script language='javascript'>    CMCCWLANFORM.submit();</script></body></html>"""
+
+LOGIN_TEMPLATE = """<html><body>
+<form id="changelang" action="#" method="post">
+<input type="hidden" value="" id="lang" name="lang"/>
+<input type='hidden' name='CSRFHW' value='{csrfhw}' /></form>
+<form class="form" action="{url}//LoginServlet" method="post" id="formulario">
+<input type="hidden" name="wlanuserip" id="wlanuserip" value="{wlanuserip}"/>
+<input type="hidden" name="lang" id="lang" value="es_ES" />
+<input name="username" id="username" maxlength="253" class="input_text cred" type="text">
+<input name="password" id="password" class="input_text cred" value="" type="password" autocomplete="off">
+<input type='hidden' name='CSRFHW' value='{csrfhw}' /></form>
+</body></html>"""
+
+ONLINE_TEMPLATE = """<html><body><script type="text/javascript">
+var urlParam = "ATTRIBUTE_UUID={attribute_uuid}&CSRFHW={csrfhw}&wlanuserip={wlanuserip}";
+</script></body></html>"""
+
+LOGIN_ERROR_TEMPLATE = """<html><body>
+<script type="text/javascript">var x = 1;</script>
+<script type="text/javascript">alert("{reason}");</script>
+</body></html>"""
+
+CREDIT_TEMPLATE = """<html><body><table id="sessioninfo"><tbody>
+<tr><td>Estado de la cuenta:</td><td>Activa</td></tr>
+<tr><td>Crédito:</td><td>
+  {credit}
+</td></tr>
+</tbody></table></body></html>"""
+
+OFFLINE_CHECK_PAGE = """<html><head><meta http-equiv="refresh" content="0;url=https://secure.etecsa.net:8443"></head></html>"""
+ONLINE_CHECK_PAGE = """<html><body>Cubadebate</body></html>"""
+
+
+class MockPortal(object):
+    def __init__(self, accounts=None, latency=0, remaining_time="01:00:00", credit="1.00 CUC", jitter=0,
+                 error_rate=0, error_status=503, drop_rate=0, fault_paths=None, seed=None,
+                 host="127.0.0.1", port=0):
+        self.accounts = dict(accounts or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.remaining_time = remaining_time
+        self.credit = credit
+        self.wlanuserip = "10.190.20.96"
+
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.fault_paths = fault_paths
+
+        self.csrf_tokens = set()
+        self.sessions = {}
+        self.requests = []
+        self.faults = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def delay(self, path):
+        latency = self.latency.get(path, 0) if isinstance(self.latency, dict) else self.latency
+        if self.jitter:
+            with self.lock:
+                latency += self._random.uniform(0, self.jitter)
+        return latency
+
+    def fault(self, path):
+        """``"drop"``, ``"error"`` or ``None`` for the next request to ``path``"""
+        if self.fault_paths is not None and path not in self.fault_paths:
+            return None
+        if not (self.drop_rate or self.error_rate):
+            return None
+
+        with self.lock:
+            roll = self._random.random()
+            if roll < self.drop_rate:
+                fault = "drop"
+            elif roll < self.drop_rate + self.error_rate:
+                fault = "error"
+            else:
+                return None
+            self.faults += 1
+        return fault
+
+    @property
+    def url(self):
+        host = self._server.server_address[0]
+        return "http://{}:{}".format("127.0.0.1" if host == "0.0.0.0" else host, self._server.server_port)
+
+    @property
+    def check_url(self):
+        return self.url + "/check"
+
+    @property
+    def generate_204_url(self):
+        return self.url + "/generate_204"
+
+    @property
+    def online(self):
+        return bool(self.sessions)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _make_handler(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, don't wait for the delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _form(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                query = urlparse(self.path).query
+                data = {k: v[0] for k, v in parse_qs(query).items()}
+                data.update({k: v[0] for k, v in parse_qs(body).items()})
+                return data
+
+            def _send(self, text, status=200, headers=None):
+                payload = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _dispatch(self, method):
+                path = urlparse(self.path).path
+                with portal.lock:
+                    portal.requests.append((method, path))
+
+                delay = portal.delay(path)
+                if delay:
+                    time.sleep(delay)
+
+                fault = portal.fault(path)
+                if fault == "drop":
+                    # Unread request body included, the client sees the connection closed
+                    self.close_connection = True
+                    return
+                if fault == "error":
+                    self._send("Service Unavailable", status=portal.error_status, headers={"Connection": "close"})
+                    self.close_connection = True
+                    return
+
+                handler = getattr(self, "{}_{}".format(method, path.strip("/").replace(".", "_").replace("/", "_") or "root"), None)
+                if not handler:
+                    self._send("Not Found", status=404)
+                else:
+                    handler()
+
+            def do_GET(self):
+                self._dispatch("get")
+
+            def do_POST(self):
+                self._dispatch("post")
+
+            def do_HEAD(self):
+                self._dispatch("head")
+
+            def head_generate_204(self):
+                if portal.online:
+                    self.send_response(204)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self.send_response(302)
+                    self.send_header("Location", "https://secure.etecsa.net:8443")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+
+            def get_check(self):
+                self._send(ONLINE_CHECK_PAGE if portal.online else OFFLINE_CHECK_PAGE)
+
+            def get_root(self):
+                self._send(LANDING_TEMPLATE.format(url=portal.url, wlanuserip=portal.wlanuserip))
+
+            def post_root(self):
+                self._form()
+                csrfhw = uuid.uuid4().hex
+                with portal.lock:
+                    portal.csrf_tokens.add(csrfhw)
+                self._send(
+                    LOGIN_TEMPLATE.format(url=portal.url, csrfhw=csrfhw, wlanuserip=portal.wlanuserip),
+                    headers={"Set-Cookie": "JSESSIONID={}; Path=/".format(csrfhw.upper())}
+                )
+
+            def post_LoginServlet(self):
+                data = self._form()
+                username = data.get("username")
+
+                if data.get("CSRFHW") not in portal.csrf_tokens:
+                    self._send(LOGIN_ERROR_TEMPLATE.format(reason="Su sesión ha expirado"))
+                elif username not in portal.accounts or portal.accounts[username] != data.get("password"):
+                    self._send(LOGIN_ERROR_TEMPLATE.format(reason="Usuario o contraseña incorrectos"))
+                elif username in portal.sessions:
+                    self._send(LOGIN_ERROR_TEMPLATE.format(reason="El usuario ya está conectado"))
+                else:
+                    attribute_uuid = uuid.uuid4().hex.upper()
+                    with portal.lock:
+                        portal.sessions[username] = attribute_uuid
+                    self._send("", status=302, headers={
+                        "Location": "/online.do?CSRFHW={}&username={}".format(data["CSRFHW"], username)
+                    })
+
+            def get_online_do(self):
+                data = self._form()
+                self._send(ONLINE_TEMPLATE.format(
+                    attribute_uuid=portal.sessions.get(data.get("username"), ""),
+                    csrfhw=data.get("CSRFHW"),
+                    wlanuserip=portal.wlanuserip
+                ))
+
+            def post_LogoutServlet(self):
+                data = self._form()
+                username = data.get("username")
+
+                with portal.lock:
+                    if username in portal.sessions and portal.sessions[username] == data.get("ATTRIBUTE_UUID"):
+                        portal.sessions.pop(username)
+                        result = "SUCCESS"
+                    else:
+                        result = "FAILURE"
+
+                self._send("logoutcallback('{}');".format(result))
+
+            def post_EtecsaQueryServlet(self):
+                data = self._form()
+                if data.get("op") == "getLeftTime":
+                    attribute_uuid = data.get("ATTRIBUTE_UUID")
+                    if attribute_uuid and portal.sessions.get(data.get("username")) != attribute_uuid:
+                        # The session was closed or dropped
+                        self._send("errorop")
+                    else:
+                        self._send(portal.remaining_time)
+                elif portal.accounts.get(data.get("username")) == data.get("password"):
+                    self._send(CREDIT_TEMPLATE.format(credit=portal.credit))
+                else:
+                    self._send(LOGIN_ERROR_TEMPLATE.format(reason="Usuario o contraseña incorrectos"))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m nautapy.mock_portal")
+    parser.add_argument("-H", "--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8443)
+    parser.add_argument("-u", "--users", type=int, default=10,
+                        help="Accounts user0@nauta.com.cu ... with passwords pass0 ...")
+    parser.add_argument("-l", "--latency", type=float, default=0)
+    parser.add_argument("-j", "--jitter", type=float, default=0)
+    parser.add_argument("-e", "--error-rate", type=float, default=0)
+    parser.add_argument("-x", "--drop-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    accounts = {"user{}@nauta.com.cu".format(i): "pass{}".format(i) for i in range(args.users)}
+    portal = MockPortal(accounts, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        drop_rate=args.drop_rate, host=args.host, port=args.port)
+    print("Portal: {}\nCheck page: {}".format(portal.url, portal.check_url))
+    try:
+        portal._server.serve_forever(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        portal._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -20,77 +20,150 @@ Example:
 
 """
 
-import json
+import contextlib
+import functools
 import re
 import os
 import time
-import http.cookiejar as cookielib
+from urllib.parse import urlparse
 
-import bs4
-import requests
-from requests import RequestException
-
-from nautapy import appdata_path
+from nautapy import appdata_path, forms, session_store, utils, watcher
 from nautapy.__about__ import __name__ as prog_name
-from nautapy.exceptions import NautaLoginException, NautaLogoutException, NautaException, NautaPreLoginException
+from nautapy.exceptions import NautaLoginException, NautaLogoutException, NautaException, NautaPreLoginException, \
+    NautaSessionExpiredException
+from nautapy.time_cache import RemainingTimeCache
+from nautapy.traffic import TrafficMeter
+from nautapy.usage import UsageLedger
+
+# requests and the modules built on it are imported on first use, checking
+# the session file must not pay for loading the HTTP stack
 
 MAX_DISCONNECT_ATTEMPTS = 10
 
 CHECK_PAGE = "http://www.cubadebate.cu/"
+GENERATE_204_URL = "http://www.gstatic.com/generate_204"
 LOGIN_DOMAIN = b"secure.etecsa.net"
 LOGIN_URL = "https://secure.etecsa.net:8443"
+LOGOUT_PATH = "/LogoutServlet"
+QUERY_PATH = "/EtecsaQueryServlet"
 
 NAUTA_SESSION_FILE = os.path.join(appdata_path, "nauta-session")
+NAUTA_LOGIN_CACHE_FILE = os.path.join(appdata_path, "nauta-login-cache")
 
 
 class SessionObject(object):
-    def __init__(self, login_action=None, csrfhw=None, wlanuserip=None, attribute_uuid=None):
+    def __init__(self, login_action=None, csrfhw=None, wlanuserip=None, attribute_uuid=None, session_file=None):
+        self.session_file = session_file or NAUTA_SESSION_FILE
         self.requests_session = self.__class__._create_requests_session()
 
         self.login_action = login_action
         self.csrfhw = csrfhw
         self.wlanuserip = wlanuserip
         self.attribute_uuid = attribute_uuid
+        # Interface counters at login, see nautapy.traffic
+        self.traffic = None
 
     @classmethod
     def _create_requests_session(cls):
-        requests_session = requests.Session()
-        requests_session.cookies = cookielib.MozillaCookieJar(NAUTA_SESSION_FILE)
-        return requests_session
+        import requests
+        from nautapy.connection_pool import ConnectionPool
 
-    def save(self, username=None):
-        self.requests_session.cookies.save()
+        return ConnectionPool.mount(requests.Session())
 
+    def save(self, username=None):
         data = {**self.__dict__}
         data.pop("requests_session")
+        data.pop("session_file")
         data["username"] = username
+        data["cookies"] = session_store.dump_cookies(self.requests_session.cookies)
 
-        with open(NAUTA_SESSION_FILE, "w") as fp:
-            json.dump(data, fp)
+        session_store.write_record(self.session_file, data)
 
     @classmethod
-    def load(cls):
+    def load(cls, session_file=None):
         inst = object.__new__(cls)
+        inst.session_file = session_file or NAUTA_SESSION_FILE
         inst.requests_session = cls._create_requests_session()
 
-        with open(NAUTA_SESSION_FILE, 'r') as fp:
-            inst.__dict__.update(
-                json.load(fp)
-            )
+        data = session_store.read_record(inst.session_file)
+        session_store.load_cookies(inst.requests_session.cookies, data.pop("cookies", []))
+        inst.__dict__.update(data)
 
         return inst
 
     def dispose(self):
         self.requests_session.cookies.clear()
-        self.requests_session.cookies.save()
+        session_store.remove_record(self.session_file)
+
+    @classmethod
+    def is_logged_in(cls, session_file=None):
+        return os.path.exists(session_file or NAUTA_SESSION_FILE)
+
+
+class LoginCache(object):
+    """Login form and cookies from the last successful login
+
+    Allows skipping the ``CHECK_PAGE`` probe and the landing page
+    round trips on reconnect. ``phases`` holds the durations of the last
+    full handshake, ``saved`` accumulates them for every fast login.
+
+    """
+    def __init__(self, login_action=None, csrfhw=None, wlanuserip=None, cookies=None, phases=None, saved=None,
+                 hits=0):
+        self.login_action = login_action
+        self.csrfhw = csrfhw
+        self.wlanuserip = wlanuserip
+        self.cookies = cookies or {}
+        self.phases = phases or {}
+        self.saved = saved or {}
+        self.hits = hits
+
+    def save(self):
+        session_store.write_record(NAUTA_LOGIN_CACHE_FILE, self.__dict__)
+
+    @classmethod
+    def load(cls):
         try:
-            os.remove(NAUTA_SESSION_FILE)
-        except:
-            pass
+            return cls(**session_store.read_record(NAUTA_LOGIN_CACHE_FILE))
+        except (OSError, ValueError, TypeError):
+            return None
 
     @classmethod
-    def is_logged_in(cls):
-        return os.path.exists(NAUTA_SESSION_FILE)
+    def clear(cls):
+        try:
+            os.remove(NAUTA_LOGIN_CACHE_FILE)
+        except OSError:
+            pass
+
+    def update(self, session, phases=None):
+        self.login_action = session.login_action
+        self.csrfhw = session.csrfhw
+        self.wlanuserip = session.wlanuserip
+        from requests.utils import dict_from_cookiejar
+
+        self.cookies = dict_from_cookiejar(session.requests_session.cookies)
+        if phases:
+            self.phases = phases
+
+    def create_session(self, session_file=None):
+        if not (self.login_action and self.csrfhw and self.wlanuserip):
+            return None
+
+        session = SessionObject(
+            login_action=self.login_action,
+            csrfhw=self.csrfhw,
+            wlanuserip=self.wlanuserip,
+            session_file=session_file
+        )
+        from requests.utils import add_dict_to_cookiejar
+
+        add_dict_to_cookiejar(session.requests_session.cookies, self.cookies)
+        return session
+
+    def record_hit(self):
+        self.hits += 1
+        for phase, elapsed in self.phases.items():
+            self.saved[phase] = self.saved.get(phase, 0) + elapsed
 
 
 class NautaProtocol(object):
@@ -101,6 +174,16 @@ class NautaProtocol(object):
     use this instead of directly talk with nauta server
 
     """
+    probe_engine = None
+    retry_policy = None
+    hedger = None
+
+    # Records the phases of every request when set, see nautapy.instrument
+    tracer = None
+
+    # Duplicate slow logout and time queries, see nautapy.hedging
+    hedging = False
+
     @classmethod
     def _get_inputs(cls, form_soup):
         return {
@@ -109,58 +192,155 @@ class NautaProtocol(object):
         }
 
     @classmethod
-    def is_connected(cls, timeout=3):
-        try:
-            r = requests.get(CHECK_PAGE, timeout=timeout)
-            return LOGIN_DOMAIN not in r.content;
-        except (requests.ConnectionError, requests.Timeout) as exception:
-            return False;
-        #return LOGIN_DOMAIN not in r.content
+    def _get_form(cls, html, form_id=None, names=None):
+        form = forms.extract_form(html, form_id=form_id, names=names)
+        if form:
+            return form
+
+        # Fallback to a full parse, bs4 is slow to import so only load it here
+        import bs4
+
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        form_soup = soup.find("form", id=form_id) if form_id else soup
+        if not form_soup:
+            raise NautaPreLoginException("No se encontró el formulario de inicio de sesión")
+
+        return forms.Form(form_soup.get("action"), cls._get_inputs(form_soup))
+
+    @classmethod
+    def _get_alert(cls, html):
+        alert = forms.extract_alert(html)
+        if alert is not None:
+            return alert
+
+        # Fallback to a full parse
+        import bs4
+
+        scripts = bs4.BeautifulSoup(html, "html.parser").find_all("script")
+        return forms.find_alert(scripts[-1].get_text()) if scripts else None
+
+    @classmethod
+    def get_probe_engine(cls):
+        if not cls.probe_engine:
+            from nautapy.probe import ProbeEngine, ContentProbe, StatusProbe, PROBE_TTL
+
+            cls.probe_engine = ProbeEngine(
+                [
+                    ContentProbe(CHECK_PAGE, login_domain=LOGIN_DOMAIN),
+                    StatusProbe(GENERATE_204_URL, login_domain=LOGIN_DOMAIN),
+                ],
+                ttl=PROBE_TTL
+            )
+        return cls.probe_engine
+
+    @classmethod
+    def get_retry_policy(cls):
+        if not cls.retry_policy:
+            from nautapy.retry import RetryPolicy
+
+            # The logout of a billed session is tried even while the portal seems down
+            cls.retry_policy = RetryPolicy(
+                operations={"logout": {"retries": MAX_DISCONNECT_ATTEMPTS - 1, "use_breaker": False}}
+            )
+        return cls.retry_policy
+
+    @classmethod
+    def get_hedger(cls):
+        if not cls.hedger:
+            from nautapy.hedging import Hedger, LATENCY_FILE
+
+            cls.hedger = Hedger(path=LATENCY_FILE)
+        return cls.hedger
+
+    @classmethod
+    def span(cls, name, **attrs):
+        return cls.tracer.span(name, **attrs) if cls.tracer else contextlib.nullcontext()
 
     @classmethod
-    def create_session(cls):
-        if cls.is_connected():
-            if SessionObject.is_logged_in():
+    def _request(cls, operation, session, method, url, data=None, idempotent=True, accept=None):
+        with cls.span(operation) as span:
+            func = session.requests_session.request
+            if span:
+                func = span.track(func)
+
+            if cls.hedging and idempotent:
+                from nautapy.hedging import HEDGED_OPERATIONS
+
+                if operation in HEDGED_OPERATIONS:
+                    func = functools.partial(cls.get_hedger().call, operation, func, accept=accept)
+
+            return cls.get_retry_policy().call(
+                operation,
+                func,
+                method,
+                url,
+                data=data,
+                idempotent=idempotent
+            )
+
+    @classmethod
+    def is_connected(cls, timeout=3, use_cache=True):
+        return cls.get_probe_engine().is_connected(timeout=timeout, use_cache=use_cache)
+
+    @classmethod
+    def create_session(cls, check_connection=True, phases=None, session_file=None):
+        phases = {} if phases is None else phases
+
+        start = time.perf_counter()
+        with cls.span("probe"):
+            connected = check_connection and cls.is_connected()
+        if connected:
+            if SessionObject.is_logged_in(session_file):
                 raise NautaPreLoginException("Hay una sessión abierta")
             else:
                 raise NautaPreLoginException("Hay una conexión activa")
+        phases["probe"] = time.perf_counter() - start
 
-        session = SessionObject()
-        resp = session.requests_session.get(LOGIN_URL)
+        start = time.perf_counter()
+        session = SessionObject(session_file=session_file)
+        resp = cls._request("landing", session, "GET", LOGIN_URL)
         if not resp.ok:
             raise NautaPreLoginException("Failed to create session")
 
-        soup = bs4.BeautifulSoup(resp.text, 'html.parser')
         action = LOGIN_URL
-        data = cls._get_inputs(soup)
+        with cls.span("landing.parse"):
+            data = cls._get_form(resp.text).inputs
+        phases["landing"] = time.perf_counter() - start
 
         # Now go to the login page
-        resp = session.requests_session.post(action, data)
-        soup = bs4.BeautifulSoup(resp.text, 'html.parser')
-        form_soup = soup.find("form", id="formulario")
+        start = time.perf_counter()
+        resp = cls._request("form", session, "POST", action, data)
+        with cls.span("form.parse"):
+            form = cls._get_form(resp.text, form_id="formulario", names=("CSRFHW", "wlanuserip"))
 
-        session.login_action = form_soup["action"]
-        data = cls._get_inputs(form_soup)
+        session.login_action = form.action
+        data = form.inputs
 
         session.csrfhw = data['CSRFHW']
         session.wlanuserip = data['wlanuserip']
+        phases["form"] = time.perf_counter() - start
 
         return session
 
     @classmethod
     def login(cls, session, username, password):
-        r = session.requests_session.post(
+        r = cls._request(
+            "login",
+            session,
+            "POST",
             session.login_action,
             {
                 "CSRFHW": session.csrfhw,
                 "wlanuserip": session.wlanuserip,
                 "username": username,
                 "password": password
-            }
+            },
+            idempotent=False
         )
+        cls.get_probe_engine().invalidate()
 
         if not r.ok:
-            raise NautaLoginException(
+            raise NautaSessionExpiredException(
                 "Falló el inicio de sesión: {} - {}".format(
                     r.status_code,
                     r.reason
@@ -168,16 +348,18 @@ class NautaProtocol(object):
             )
 
         if not "online.do" in r.url:
-            soup = bs4.BeautifulSoup(r.text, "html.parser")
-            script_text = soup.find_all("script")[-1].get_text()
-            match = re.search(r'alert\(\"(?P<reason>[^\"]*?)\"\)', script_text)
-            raise NautaLoginException(
+            alert = cls._get_alert(r.text)
+            # Without a message about the credentials, the form is what was rejected
+            rejected_form = not alert or "expirad" in alert.lower()
+            exception = NautaSessionExpiredException if rejected_form else NautaLoginException
+            raise exception(
                 "Falló el inicio de sesión: {}".format(
-                    match and match.groupdict().get("reason")
+                    alert
                 )
             )
 
-        m = re.search(r'ATTRIBUTE_UUID=(\w+)&CSRFHW=', r.text)
+        with cls.span("online.do"):
+            m = re.search(r'ATTRIBUTE_UUID=(\w+)&CSRFHW=', r.text)
 
         return m.group(1) if m \
             else None
@@ -186,7 +368,7 @@ class NautaProtocol(object):
     def logout(cls, session, username):
         logout_url = \
             (
-                "https://secure.etecsa.net:8443/LogoutServlet?" +
+                LOGIN_URL + LOGOUT_PATH + "?" +
                 "CSRFHW={}&" +
                 "username={}&" +
                 "ATTRIBUTE_UUID={}&" +
@@ -198,7 +380,11 @@ class NautaProtocol(object):
                 session.wlanuserip
             )
 
-        response = session.requests_session.post(logout_url)
+        response = cls._request(
+            "logout", session, "POST", logout_url,
+            accept=lambda r: r.ok and "SUCCESS" in r.text.upper()
+        )
+        cls.get_probe_engine().invalidate()
         if not response.ok:
             raise NautaLogoutException(
                 "Fallo al cerrar la sesión: {} - {}".format(
@@ -217,8 +403,11 @@ class NautaProtocol(object):
     @classmethod
     def get_user_time(cls, session, username):
 
-        r = session.requests_session.post(
-            "https://secure.etecsa.net:8443/EtecsaQueryServlet",
+        r = cls._request(
+            "get_user_time",
+            session,
+            "POST",
+            LOGIN_URL + QUERY_PATH,
             {
                 "op": "getLeftTime",
                 "ATTRIBUTE_UUID": session.attribute_uuid,
@@ -233,8 +422,11 @@ class NautaProtocol(object):
     @classmethod
     def get_user_credit(cls, session, username, password):
 
-        r = session.requests_session.post(
-            "https://secure.etecsa.net:8443/EtecsaQueryServlet",
+        r = cls._request(
+            "get_user_credit",
+            session,
+            "POST",
+            LOGIN_URL + QUERY_PATH,
             {
                 "CSRFHW": session.csrfhw,
                 "wlanuserip": session.wlanuserip,
@@ -251,11 +443,18 @@ class NautaProtocol(object):
                 )
             )
 
-        if "secure.etecsa.net" not in r.url:
+        if urlparse(LOGIN_URL).hostname not in r.url:
             raise NautaException(
                 "No se puede obtener el crédito del usuario mientras está online"
             )
 
+        credit = forms.extract_cell(r.text, "sessioninfo", row=2, col=2)
+        if credit is not None:
+            return credit
+
+        # Fallback to a full parse
+        import bs4
+
         soup = bs4.BeautifulSoup(r.text, "html.parser")
         credit_tag = soup.select_one("#sessioninfo > tbody:nth-child(1) > tr:nth-child(2) > td:nth-child(2)")
 
@@ -268,30 +467,107 @@ class NautaProtocol(object):
 
 
 class NautaClient(object):
-    def __init__(self, user, password):
+    def __init__(self, user, password, fast_login=True, check_connection=True, session_file=None,
+                 time_cache=None, traffic=None, ledger=None):
         self.user = user
         self.password = password
+        self.fast_login = fast_login
+        self.check_connection = check_connection
+        self.session_file = session_file
+        self.time_cache = time_cache or RemainingTimeCache()
+        self.traffic = traffic or TrafficMeter()
+        self.ledger = ledger or UsageLedger.default()
         self.session = None
-
-    def init_session(self):
-        self.session = NautaProtocol.create_session()
-        self.session.save()
+        self.time_saved = {}
+        self._phases = {}
+
+    def init_session(self, save=True):
+        self._phases = {}
+        self.session = NautaProtocol.create_session(
+            check_connection=self.check_connection,
+            phases=self._phases,
+            session_file=self.session_file
+        )
+        if save:
+            self.session.save()
 
     @property
     def is_logged_in(self):
-        return SessionObject.is_logged_in()
+        return SessionObject.is_logged_in(self.session_file)
+
+    def _fast_login(self, cache, reconnect=False):
+        """Login reusing the form and cookies of the last session
 
-    def login(self):
+        Returns ``False`` when the portal rejects the cached form, in which
+        case the full handshake must be done. A rejection of the credentials
+        is raised, sending them again would only count another failed
+        attempt.
+
+        """
+        from requests import RequestException
+
+        if not reconnect and SessionObject.is_logged_in(self.session_file):
+            return False
+
+        self.session = cache.create_session(self.session_file)
         if not self.session:
-            self.init_session()
+            return False
 
-        self.session.attribute_uuid = NautaProtocol.login(
-            self.session,
-            self.user,
-            self.password
-        )
+        try:
+            self.session.attribute_uuid = NautaProtocol.login(
+                self.session,
+                self.user,
+                self.password
+            )
+        except (NautaSessionExpiredException, RequestException):
+            self.session = None
+            return False
+
+        cache.record_hit()
+        self.time_saved = dict(cache.phases)
+        return True
+
+    def login(self, reconnect=False):
+        """Opens a session, ``reconnect`` replaces a session dropped by the portal
+
+        On reconnect the session file is only overwritten once the login
+        succeeds, so the watchers of the session (see nautapy.watcher) keep
+        waiting and a failed attempt leaves the dropped session to close.
+        """
+        with NautaProtocol.span("client.login") as span:
+            # A restored session is accounted from its first login, see nautapy.traffic
+            reading = getattr(self.session, "traffic", None) if reconnect else None
+            if reconnect:
+                self.session = None
+            cache = (LoginCache.load() or LoginCache()) if self.fast_login else None
+
+            if self.session or not (cache and self._fast_login(cache, reconnect)):
+                if not self.session:
+                    self.init_session(save=not reconnect)
+
+                self.session.attribute_uuid = NautaProtocol.login(
+                    self.session,
+                    self.user,
+                    self.password
+                )
+                self.time_saved = {}
+
+            if span:
+                span.attrs["fast_login"] = bool(self.time_saved)
+                if reconnect:
+                    span.attrs["reconnect"] = True
 
-        self.session.save(self.user)
+            with NautaProtocol.span("save"):
+                self.session.traffic = reading or self.traffic.start()
+                self.session.save(self.user)
+
+                if cache:
+                    cache.update(self.session, self._phases)
+                    cache.save()
+
+            self.time_cache.start(self.user)
+            if not reconnect:
+                self.ledger.login(self.user)
 
         return self
 
@@ -315,13 +591,23 @@ class NautaClient(object):
 
     @property
     def remaining_time(self):
+        return self.get_remaining_time()
+
+    def get_remaining_time(self, refresh=False):
+        """Remaining time counted down from the last answer of the portal, see nautapy.time_cache"""
+        active = self.is_logged_in
+        if not refresh:
+            seconds = self.time_cache.get(self.user, active)
+            if seconds is not None:
+                return utils.seconds2strtime(seconds)
+
         dispose_session = False
         try:
             if not self.session:
                 dispose_session = True
-                self.session = SessionObject()
+                self.session = SessionObject(session_file=self.session_file)
 
-            return NautaProtocol.get_user_time(
+            remaining_time = NautaProtocol.get_user_time(
                 session=self.session,
                 username=self.user,
             )
@@ -330,32 +616,49 @@ class NautaClient(object):
                 self.session.dispose()
                 self.session = None
 
+        try:
+            seconds = utils.strtime2seconds(remaining_time)
+        except NautaException:
+            # Not a time, the portal answered with an error message
+            return remaining_time
+
+        self.time_cache.update(self.user, seconds, active)
+        self.ledger.remaining(self.user, seconds)
+
+        return remaining_time
+
     def logout(self):
-        for i in range(0, MAX_DISCONNECT_ATTEMPTS):
-            try:
+        from requests import RequestException
+
+        # NautaProtocol retries with backoff, see nautapy.retry
+        try:
+            with NautaProtocol.span("client.logout"):
                 NautaProtocol.logout(
                     session=self.session,
                     username=self.user,
                 )
-                self.session.dispose()
-                self.session = None
+        except RequestException:
+            raise NautaLogoutException(
+                "Hay problemas en la red y no se puede cerrar la sessión.\n"
+                "Es posible que ya esté desconectado. Intente con '{} down' "
+                "dentro de unos minutos".format(prog_name)
+            )
 
-                return
-            except RequestException:
-                time.sleep(1)
+        self.traffic.stop(self.user, getattr(self.session, "traffic", None))
+        self.session.dispose()
+        self.session = None
+        self.time_cache.stop(self.user)
+        self.ledger.logout(self.user)
 
-        raise NautaLogoutException(
-            "Hay problemas en la red y no se puede cerrar la sessión.\n"
-            "Es posible que ya esté desconectado. Intente con '{} down' "
-            "dentro de unos minutos".format(prog_name)
-        )
+        # Wake up any 'nauta up' waiting on this session
+        watcher.notify(self.session_file or NAUTA_SESSION_FILE)
 
     def load_last_session(self):
-        self.session = SessionObject.load()
+        self.session = SessionObject.load(self.session_file)
 
     def __enter__(self):
         pass
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if SessionObject.is_logged_in():
+        if SessionObject.is_logged_in(self.session_file):
             self.logout()
@@ -0,0 +1,182 @@
+"""
+Connectivity probes
+
+A probe answers whether internet is reachable or the captive portal is
+intercepting the traffic, reading as few bytes as possible.
+:class:`ProbeEngine` races several probes, the first one that answers
+wins, and caches the answer for a few seconds.
+
+"""
+
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+
+import requests
+
+PROBE_TTL = 2
+PROBE_MAX_BYTES = 2048
+
+ProbeResult = namedtuple("ProbeResult", ["connected", "url", "latency", "bytes"])
+
+
+class ProbeStats(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.bytes = 0
+
+    @property
+    def mean_latency(self):
+        return self.latency / self.count if self.count else None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_latency": self.mean_latency,
+            "bytes": self.bytes,
+        }
+
+
+def _headers_size(response):
+    return sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+
+
+class Probe(object):
+    """Base probe, subclasses implement :meth:`check`"""
+    method = "GET"
+
+    def __init__(self, url, login_domain=b"secure.etecsa.net"):
+        self.url = url
+        self.login_domain = login_domain
+        self.stats = ProbeStats()
+        self._lock = threading.Lock()
+
+    def _redirects_to_portal(self, response):
+        location = response.headers.get("Location", "")
+        return self.login_domain.decode() in location
+
+    def check(self, response):
+        """Returns ``(connected, body_bytes_read)``"""
+        raise NotImplementedError()
+
+    def run(self, timeout=3):
+        start = time.perf_counter()
+        try:
+            with requests.request(self.method, self.url, stream=True, allow_redirects=False,
+                                  timeout=timeout) as response:
+                connected, body_size = self.check(response)
+                size = body_size + _headers_size(response)
+        except Exception:
+            # urllib3 errors raised while streaming are not wrapped by requests
+            with self._lock:
+                self.stats.errors += 1
+            raise
+
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.stats.count += 1
+            self.stats.latency += latency
+            self.stats.bytes += size
+
+        return ProbeResult(connected, self.url, latency, size)
+
+
+class StatusProbe(Probe):
+    """Connected if the endpoint answers with ``expected_status``
+
+    Meant for tiny endpoints like ``generate_204``, checked with ``HEAD``.
+
+    """
+    method = "HEAD"
+
+    def __init__(self, url, expected_status=204, login_domain=b"secure.etecsa.net"):
+        super().__init__(url, login_domain=login_domain)
+        self.expected_status = expected_status
+
+    def check(self, response):
+        return response.status_code == self.expected_status and not self._redirects_to_portal(response), 0
+
+
+class ContentProbe(Probe):
+    """Connected unless the portal shows up in a redirect or in the first bytes of the page"""
+    def __init__(self, url, max_bytes=PROBE_MAX_BYTES, login_domain=b"secure.etecsa.net"):
+        super().__init__(url, login_domain=login_domain)
+        self.max_bytes = max_bytes
+
+    def check(self, response):
+        if response.is_redirect:
+            return not self._redirects_to_portal(response), 0
+
+        content = response.raw.read(self.max_bytes, decode_content=True)
+        return self.login_domain not in content, len(content)
+
+
+class ProbeEngine(object):
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, probes, ttl=PROBE_TTL):
+        self.probes = list(probes)
+        self.ttl = ttl
+
+        self.checks = 0
+        self.cache_hits = 0
+        self.last_result = None
+        self._cached_at = None
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._executor_lock:
+            if not cls._executor:
+                cls._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="probe")
+            return cls._executor
+
+    def invalidate(self):
+        self._cached_at = None
+
+    def _race(self, timeout):
+        executor = self._get_executor()
+        futures = [executor.submit(probe.run, timeout) for probe in self.probes]
+
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                try:
+                    return future.result()
+                except Exception:
+                    # A failed probe just doesn't answer
+                    continue
+        except TimeoutError:
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return None
+
+    def probe(self, timeout=3, use_cache=True):
+        """Returns the :class:`ProbeResult` of the fastest probe, ``None`` if none answered"""
+        if use_cache and self._cached_at is not None and time.monotonic() - self._cached_at < self.ttl:
+            self.cache_hits += 1
+            return self.last_result
+
+        self.checks += 1
+        self.last_result = self._race(timeout)
+        self._cached_at = time.monotonic()
+
+        return self.last_result
+
+    def is_connected(self, timeout=3, use_cache=True):
+        result = self.probe(timeout=timeout, use_cache=use_cache)
+        return bool(result and result.connected)
+
+    @property
+    def stats(self):
+        return {
+            "checks": self.checks,
+            "cache_hits": self.cache_hits,
+            "probes": {probe.url: probe.stats.as_dict() for probe in self.probes},
+        }
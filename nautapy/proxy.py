@@ -0,0 +1,362 @@
+"""
+Proxy that opens the Nauta session transparently
+
+The session is opened when the first client connection arrives, as long
+as there is no other active session, and closed when no connections are
+left. Since ETECSA bills whole time units, the logout is deferred to the
+end of the time unit already paid for, and cancelled if a new connection
+arrives before that.
+
+Supports ``CONNECT`` tunnels (HTTPS) and plain HTTP requests. Once the
+upstream connection is established bytes are relayed between transports
+from a preallocated buffer, without going through streams.
+
+See ``PROXY_GUIDE.md``.
+
+"""
+
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+from nautapy import utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 3128
+LOGOUT_MARGIN = 5
+BUFFER_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+
+_HOP_HEADERS = {b"proxy-connection", b"proxy-authorization", b"connection", b"keep-alive"}
+
+
+def domain_matches(host, domains):
+    host = host.lower().rstrip(".")
+    return any(
+        host == domain or host.endswith("." + domain)
+        for domain in domains
+    )
+
+
+class ProxyStats(object):
+    def __init__(self):
+        self.connections = 0
+        self.rejected = 0
+        self.failed = 0
+        self.active = 0
+        self.max_active = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.sessions = 0
+        self.connect_latency = 0.0
+
+    @property
+    def mean_connect_latency(self):
+        established = self.connections - self.failed
+        return self.connect_latency / established if established > 0 else None
+
+    def as_dict(self):
+        return {
+            "connections": self.connections,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "active": self.active,
+            "max_active": self.max_active,
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+            "sessions": self.sessions,
+            "mean_connect_latency": self.mean_connect_latency,
+        }
+
+
+class _RelayProtocol(asyncio.BufferedProtocol):
+    """Forwards everything read from its transport to ``peer``
+
+    Data is received into a preallocated buffer and written to the peer
+    transport from it. Only when the peer can't take it all at once the
+    buffer is handed to the transport and a new one is allocated.
+
+    """
+    def __init__(self, on_data=None, on_close=None):
+        self.transport = None
+        self.peer = None
+        self.on_data = on_data
+        self.on_close = on_close
+        self.eof = False
+        self._new_buffer()
+
+    def _new_buffer(self):
+        self._buffer = memoryview(bytearray(BUFFER_SIZE))
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self._buffer
+
+    def buffer_updated(self, nbytes):
+        peer_transport = self.peer.transport
+        peer_transport.write(self._buffer[:nbytes])
+        if peer_transport.get_write_buffer_size():
+            self._new_buffer()
+
+        if self.on_data:
+            self.on_data(nbytes)
+
+    def eof_received(self):
+        self.eof = True
+        if self.peer.eof or not self.peer.transport.can_write_eof():
+            # Both halves are done
+            return False
+
+        self.peer.transport.write_eof()
+        return True
+
+    def pause_writing(self):
+        # Our transport is full: stop reading from the peer
+        self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        if self.peer and self.peer.transport:
+            self.peer.transport.close()
+        if self.on_close:
+            on_close, self.on_close = self.on_close, None
+            on_close()
+
+
+class _ClientProtocol(asyncio.Protocol):
+    """Reads the request head of a client connection and hands it to the proxy"""
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.transport = None
+        self.data = bytearray()
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.data.extend(data)
+        end = self.data.find(b"\r\n\r\n")
+
+        if end >= 0:
+            self.transport.pause_reading()
+            head, rest = bytes(self.data[:end + 4]), bytes(self.data[end + 4:])
+            self.task = asyncio.ensure_future(self.proxy._handle_request(self.transport, head, rest))
+        elif len(self.data) > MAX_HEADER_SIZE:
+            self.proxy._reply(self.transport, 431, "Request Header Fields Too Large")
+
+
+class NautaProxy(object):
+    def __init__(self, client, time_unit, max_conn=None, whitelist=None, blacklist=None, logout_margin=LOGOUT_MARGIN):
+        self.client = client
+        self.time_unit = time_unit
+        self.max_conn = max_conn
+        self.whitelist = [domain.lower() for domain in whitelist or []]
+        self.blacklist = [domain.lower() for domain in blacklist or []]
+        self.logout_margin = logout_margin
+
+        self.stats = ProxyStats()
+        self.owns_session = False
+        self.login_time = None
+
+        self._server = None
+        self._session_lock = None
+        self._logout_handle = None
+        self._logout_task = None
+
+    @property
+    def active(self):
+        return self.stats.active
+
+    def is_allowed(self, host):
+        if self.whitelist and not domain_matches(host, self.whitelist):
+            return False
+        return not domain_matches(host, self.blacklist)
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        self._session_lock = asyncio.Lock()
+        self._server = await loop.create_server(lambda: _ClientProtocol(self), host, port)
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+        self._cancel_logout()
+        if self.owns_session:
+            await self._logout()
+
+    # Nauta session
+
+    async def _run(self, func):
+        return await asyncio.get_running_loop().run_in_executor(None, func)
+
+    async def _ensure_session(self):
+        async with self._session_lock:
+            self._cancel_logout()
+            if self._logout_task:
+                await self._logout_task
+
+            if self.owns_session or self.client.is_logged_in:
+                return
+
+            logger.info("Iniciando sesión: %s", self.client.user)
+            await self._run(self.client.login)
+            self.owns_session = True
+            self.login_time = time.monotonic()
+            self.stats.sessions += 1
+
+    async def _logout(self):
+        self.owns_session = False
+        logger.info("Cerrando sesión: %s", self.client.user)
+        try:
+            await self._run(self.client.logout)
+        except Exception as ex:
+            logger.error("No se pudo cerrar la sesión: %s", ex)
+
+    def _start_logout(self):
+        self._logout_handle = None
+        if self.stats.active or not self.owns_session:
+            return
+
+        self._logout_task = asyncio.ensure_future(self._logout())
+
+    def _cancel_logout(self):
+        if self._logout_handle:
+            self._logout_handle.cancel()
+            self._logout_handle = None
+
+    def _schedule_logout(self):
+        if not self.owns_session or self._logout_handle:
+            return
+
+        now = time.monotonic()
+        boundary = utils.next_billing_boundary(self.login_time, now, self.time_unit)
+        delay = max(0, boundary - self.logout_margin - now)
+
+        logger.info("Sin conexiones, cerrando sesión en %.1fs", delay)
+        self._logout_handle = asyncio.get_running_loop().call_later(delay, self._start_logout)
+
+    # Connections
+
+    def _reply(self, transport, status, reason):
+        transport.write("HTTP/1.1 {} {}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".format(
+            status, reason
+        ).encode("ascii"))
+        transport.close()
+
+    def _release(self):
+        self.stats.active -= 1
+        if not self.stats.active:
+            self._schedule_logout()
+
+    def _parse_head(self, head):
+        lines = head.split(b"\r\n")
+        method, target, version = lines[0].decode("latin-1").split(" ", 2)
+
+        if method == "CONNECT":
+            host, _, port = target.rpartition(":")
+            return method, host.strip("[]"), int(port), None
+
+        url = urlsplit(target)
+        if url.scheme != "http" or not url.hostname:
+            raise ValueError("Unsupported target: {}".format(target))
+
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+
+        headers = [
+            line for line in lines[1:]
+            if line and line.split(b":", 1)[0].strip().lower() not in _HOP_HEADERS
+        ]
+        head = b"\r\n".join(
+            ["{} {} {}".format(method, path, version).encode("latin-1")] +
+            headers +
+            [b"Connection: close", b"", b""]
+        )
+        return method, url.hostname, url.port or 80, head
+
+    async def _handle_request(self, transport, head, rest):
+        try:
+            method, host, port, upstream_head = self._parse_head(head)
+        except ValueError:
+            self._reply(transport, 400, "Bad Request")
+            return
+
+        if not self.is_allowed(host):
+            logger.info("Dominio bloqueado: %s", host)
+            self.stats.rejected += 1
+            self._reply(transport, 403, "Forbidden")
+            return
+
+        if self.max_conn and self.stats.active >= self.max_conn:
+            self.stats.rejected += 1
+            self._reply(transport, 503, "Service Unavailable")
+            return
+
+        self.stats.connections += 1
+        self.stats.active += 1
+        self.stats.max_active = max(self.stats.max_active, self.stats.active)
+
+        start = time.perf_counter()
+        try:
+            await self._ensure_session()
+            upstream_transport, upstream = await asyncio.get_running_loop().create_connection(
+                lambda: _RelayProtocol(on_data=self._count_down),
+                host,
+                port
+            )
+        except Exception as ex:
+            logger.error("No se pudo conectar con %s:%s: %s", host, port, ex)
+            self.stats.failed += 1
+            self._reply(transport, 502, "Bad Gateway")
+            self._release()
+            return
+
+        self.stats.connect_latency += time.perf_counter() - start
+
+        client = _RelayProtocol(on_data=self._count_up, on_close=self._release)
+        client.peer, upstream.peer = upstream, client
+        client.connection_made(transport)
+        transport.set_protocol(client)
+
+        if transport.is_closing():
+            # Released here, connection_lost may still be delivered to the new protocol
+            client.on_close = None
+            upstream_transport.close()
+            self._release()
+            return
+
+        if method == "CONNECT":
+            transport.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        else:
+            upstream_transport.write(upstream_head)
+
+        if rest:
+            upstream_transport.write(rest)
+            self._count_up(len(rest))
+
+        transport.resume_reading()
+
+    def _count_up(self, nbytes):
+        self.stats.bytes_up += nbytes
+
+    def _count_down(self, nbytes):
+        self.stats.bytes_down += nbytes
@@ -0,0 +1,216 @@
+"""
+Retries for the requests sent to the portal
+
+:class:`RetryPolicy` retries network errors with exponential backoff and
+full jitter, within an overall deadline per operation, so a congested
+portal is neither given up on too early nor hammered. A shared
+:class:`CircuitBreaker` stops sending requests for a while after too many
+consecutive failures. The operations set to ``use_breaker: False``, like
+the logout of a billed session, are always sent.
+
+Requests that are not idempotent, like the login POST, are only retried
+when the connection could not be established, so they are never sent
+twice.
+
+Example:
+    policy = RetryPolicy(retries=5, deadline=20)
+    response = policy.call("get_user_time", session.post, url, data)
+
+"""
+
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError, ConnectTimeout, RequestException, Timeout
+from urllib3.exceptions import NewConnectionError
+
+from nautapy.exceptions import NautaCircuitOpenException
+
+RETRIES = 3
+BASE_DELAY = 0.5
+MAX_DELAY = 8
+DEADLINE = 30
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+def request_not_sent(ex):
+    """Whether the connection failed before anything was sent"""
+    if isinstance(ex, ConnectTimeout):
+        return True
+    reason = getattr(ex.args[0], "reason", None) if ex.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def is_retryable(ex, idempotent=True):
+    if not idempotent:
+        return request_not_sent(ex)
+    return isinstance(ex, (ConnectionError, Timeout))
+
+
+class CircuitBreaker(object):
+    """Opens after ``threshold`` consecutive failed operations, lets one through after ``reset_timeout``"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            wait = self.opened_at + self.reset_timeout - self.clock()
+            if self.state == self.OPEN and wait <= 0:
+                # Let a single request check if the portal is back
+                self.state = self.HALF_OPEN
+                return
+
+            raise NautaCircuitOpenException(
+                "El portal no responde, se volverá a intentar en {:.0f}s".format(max(wait, 0))
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def record_aborted(self):
+        """The call ended without an answer of the portal, the next one is the trial"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+class OperationStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def retries(self):
+        return self.attempts - self.calls
+
+    @property
+    def mean_latency(self):
+        return self.latency / self.calls if self.calls else None
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "mean_latency": self.mean_latency,
+            "max_latency": self.max_latency,
+        }
+
+
+class RetryStats(object):
+    def __init__(self):
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, attempts, latency, ok):
+        with self._lock:
+            stats = self.operations.setdefault(operation, OperationStats())
+            stats.calls += 1
+            stats.attempts += attempts
+            stats.failures += 0 if ok else 1
+            stats.latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+
+    def as_dict(self):
+        with self._lock:
+            return {operation: stats.as_dict() for operation, stats in self.operations.items()}
+
+
+class RetryPolicy(object):
+    def __init__(self, retries=RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY, deadline=DEADLINE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), operations=None, breaker=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """``operations`` maps operation names to ``retries`` and ``deadline`` overrides"""
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.timeout = timeout
+        self.use_breaker = True
+        self.operations = operations or {}
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = RetryStats()
+
+    def backoff(self, attempt):
+        """Delay before retry number ``attempt``, full jitter over an exponential cap"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _setting(self, operation, name):
+        return self.operations.get(operation, {}).get(name, getattr(self, name))
+
+    def _timeout(self, remaining):
+        if remaining is None or self.timeout is None:
+            return self.timeout
+
+        connect, read = self.timeout
+        return min(connect, remaining), min(read, remaining)
+
+    def call(self, operation, func, *args, idempotent=True, **kwargs):
+        """Calls ``func(*args, timeout=..., **kwargs)`` retrying network errors"""
+        retries = self._setting(operation, "retries")
+        deadline = self._setting(operation, "deadline")
+
+        if self._setting(operation, "use_breaker"):
+            self.breaker.before_call()
+        start = self.clock()
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                attempt += 1
+                remaining = None if deadline is None else max(0.1, deadline - (self.clock() - start))
+
+                try:
+                    result = func(*args, timeout=self._timeout(remaining), **kwargs)
+                except RequestException as ex:
+                    delay = self.backoff(attempt)
+                    if (attempt > retries or not is_retryable(ex, idempotent) or
+                            deadline is not None and self.clock() - start + delay >= deadline):
+                        recorded = True
+                        self.breaker.record_failure()
+                        raise
+                    self.sleep(delay)
+                else:
+                    self.breaker.record_success()
+                    self.stats.record(operation, attempt, self.clock() - start, True)
+                    return result
+        except BaseException:
+            if not recorded:
+                # Interrupted or failed outside the network, don't leave the breaker half open
+                self.breaker.record_aborted()
+            self.stats.record(operation, attempt, self.clock() - start, False)
+            raise
@@ -0,0 +1,223 @@
+"""
+Billing aware session scheduling
+
+ETECSA bills whole time units (for example 120s on Nauta Hogar), so once
+a unit has started it's free to keep the session open until it ends.
+:class:`BillingScheduler` runs queued jobs inside a single session, keeps
+it open while there's work, and logs out just before the next billing
+boundary once it's idle.
+
+Example:
+    scheduler = BillingScheduler(client, time_unit=120)
+    futures = [scheduler.submit(os.system, cmd) for cmd in commands]
+    scheduler.close()
+
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from requests import RequestException
+
+from nautapy import utils
+from nautapy.exceptions import NautaException
+
+LOGOUT_MARGIN = 5
+
+
+def billing_deadline(login_time, now, time_unit, margin=LOGOUT_MARGIN, remaining=None):
+    """Time to logout for a session opened at ``login_time`` that is idle at ``now``
+
+    Just before the end of the billed time unit, and never after the
+    account runs out of time (``remaining`` seconds at login). Without a
+    ``time_unit`` the session is closed as soon as it's idle.
+    """
+    if time_unit:
+        deadline = utils.next_billing_boundary(login_time, now, time_unit) - margin
+    else:
+        deadline = now
+    if remaining is not None:
+        deadline = min(deadline, login_time + remaining - margin)
+    return deadline
+
+
+def session_duration(session_time, time_unit, remaining_time):
+    """Seconds to keep a new session open, aligned to the billing ``time_unit`` if given
+
+    ``remaining_time`` is the time left in the account at login, as
+    reported by the portal. ``None`` means no limit.
+    """
+    if not time_unit:
+        return session_time
+
+    try:
+        remaining = utils.strtime2seconds(remaining_time)
+    except (NautaException, TypeError):
+        remaining = None
+
+    if session_time is None:
+        return remaining - LOGOUT_MARGIN if remaining is not None else None
+
+    return max(0, int(billing_deadline(0, session_time, time_unit, remaining=remaining)))
+
+
+def remaining_seconds(client):
+    try:
+        return utils.strtime2seconds(client.remaining_time)
+    except (NautaException, RequestException):
+        return None
+
+
+class SchedulerStats(object):
+    def __init__(self):
+        self.sessions = 0
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.connected_time = 0.0
+
+    def as_dict(self):
+        return {
+            "sessions": self.sessions,
+            "jobs": self.jobs,
+            "failed_jobs": self.failed_jobs,
+            "connected_time": self.connected_time,
+        }
+
+
+class BillingScheduler(object):
+    def __init__(self, client, time_unit, logout_margin=LOGOUT_MARGIN, max_workers=1, clock=time.monotonic):
+        self.client = client
+        self.time_unit = time_unit
+        self.logout_margin = logout_margin
+        self.clock = clock
+
+        self.stats = SchedulerStats()
+        self.owns_session = False
+        self.logged_in = False
+        self.login_time = None
+        self.remaining = None
+        self.logout_error = None
+
+        self._pending = deque()
+        self._running = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def deadline(self):
+        return billing_deadline(
+            self.login_time,
+            self.clock(),
+            self.time_unit,
+            margin=self.logout_margin,
+            remaining=self.remaining
+        )
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            self._pending.append((future, func, args, kwargs))
+            self._cond.notify_all()
+        return future
+
+    def close(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        if wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _login(self):
+        if self.client.is_logged_in:
+            # Someone else owns this session, just use it
+            self.owns_session = False
+        else:
+            self.client.login()
+            self.owns_session = True
+            self.stats.sessions += 1
+
+        self.logged_in = True
+        self.login_time = self.clock()
+        self.remaining = remaining_seconds(self.client)
+
+    def _logout(self):
+        self.logged_in = False
+        self.stats.connected_time += self.clock() - self.login_time
+        if self.owns_session:
+            self.owns_session = False
+            self.client.logout()
+
+    def _run_job(self, future, func, args, kwargs):
+        try:
+            if future.set_running_or_notify_cancel():
+                future.set_result(func(*args, **kwargs))
+        except BaseException as ex:
+            self.stats.failed_jobs += 1
+            future.set_exception(ex)
+        finally:
+            with self._cond:
+                self.stats.jobs += 1
+                self._running -= 1
+                self._cond.notify_all()
+
+    def _next_jobs(self):
+        """Waits for jobs; returns ``[]`` when it's time to logout, ``None`` when closed"""
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    while self._running:
+                        self._cond.wait()
+                    return None
+
+                if self.logged_in and not self._running:
+                    timeout = self.deadline() - self.clock()
+                    if timeout <= 0:
+                        return []
+                    self._cond.wait(timeout)
+                else:
+                    self._cond.wait()
+
+            jobs = list(self._pending)
+            self._pending.clear()
+            return jobs
+
+    def _dispatch(self):
+        while True:
+            jobs = self._next_jobs()
+
+            if not jobs:
+                if self.logged_in:
+                    try:
+                        self._logout()
+                    except (NautaException, RequestException) as ex:
+                        self.logout_error = ex
+                if jobs is None:
+                    return
+                continue
+
+            if not self.logged_in:
+                try:
+                    self._login()
+                except Exception as ex:
+                    for future, _, _, _ in jobs:
+                        future.set_exception(ex)
+                    continue
+
+            with self._cond:
+                self._running += len(jobs)
+            for job in jobs:
+                self._executor.submit(self._run_job, *job)
@@ -0,0 +1,150 @@
+"""
+Ranking of the accounts to log in with
+
+:class:`AccountSelector` orders the accounts by the remaining time last
+reported by the portal (see nautapy.time_cache), their recent login
+failures and their login latency, and :meth:`AccountSelector.login`
+tries them in that order. The handshake with the portal is only done
+once, when an account is rejected the next one is sent with the same
+login form, also when the first one was sent with the cached form of a
+fast login.
+
+Example:
+    selector = AccountSelector()
+    client = selector.login(CredentialStore.default().credentials())
+    print(client.user)
+
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from nautapy import appdata_path, session_store
+from nautapy.exceptions import NautaLoginException, NautaSessionExpiredException
+from nautapy.time_cache import RemainingTimeCache
+
+ACCOUNT_STATS_FILE = os.path.join(appdata_path, "account-stats")
+
+# Accounts with less seconds are tried last
+MIN_REMAINING = 60
+# Assumed for the accounts never asked
+UNKNOWN_REMAINING = 3600
+# Seconds of remaining time worth a recent failure, and a second of latency
+FAILURE_PENALTY = 7200
+LATENCY_PENALTY = 600
+FAILURE_HALF_LIFE = 3600
+LATENCY_ALPHA = 0.3
+
+# ``failures`` halves every ``FAILURE_HALF_LIFE`` seconds since ``failed_at``,
+# ``latency`` is a moving average of the successful logins
+AccountRecord = namedtuple("AccountRecord", ["failures", "failed_at", "latency"])
+Candidate = namedtuple("Candidate", ["user", "password", "score", "remaining", "failures", "latency"])
+
+# Read-modify-write of the file
+_lock = threading.Lock()
+
+
+class AccountSelector(object):
+    def __init__(self, path=None, time_cache=None, clock=time.time):
+        self.path = path or ACCOUNT_STATS_FILE
+        self.time_cache = time_cache or RemainingTimeCache()
+        self.clock = clock
+
+    def _load(self):
+        try:
+            return {user: AccountRecord(*record) for user, record in session_store.read_record(self.path).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save(self, records):
+        session_store.write_record(self.path, {user: list(record) for user, record in records.items()})
+
+    @staticmethod
+    def _failures(record, now):
+        if record is None or not record.failures:
+            return 0.0
+        return record.failures * 0.5 ** (max(0, now - record.failed_at) / FAILURE_HALF_LIFE)
+
+    def record_success(self, user, latency):
+        with _lock:
+            records = self._load()
+            record = records.get(user)
+            if record and record.latency is not None:
+                latency = record.latency + LATENCY_ALPHA * (latency - record.latency)
+            records[user] = AccountRecord(0.0, None, latency)
+            self._save(records)
+
+    def record_failure(self, user):
+        with _lock:
+            records = self._load()
+            record = records.get(user)
+            now = self.clock()
+            records[user] = AccountRecord(self._failures(record, now) + 1, now, record.latency if record else None)
+            self._save(records)
+
+    def rank(self, accounts):
+        """``accounts``, ``(user, password)`` tuples, as :class:`Candidate` best first"""
+        now = self.clock()
+        records = self._load()
+        remaining = self.time_cache.last_known()
+
+        candidates = []
+        for user, password in accounts:
+            record = records.get(user)
+            seconds = remaining.get(user)
+            failures = self._failures(record, now)
+            latency = record.latency if record else None
+
+            score = UNKNOWN_REMAINING if seconds is None else seconds
+            score -= FAILURE_PENALTY * failures + LATENCY_PENALTY * (latency or 0)
+            candidates.append(Candidate(user, password, score, seconds, failures, latency))
+
+        # Accounts out of time go last whatever their score, ties keep the stored order
+        candidates.sort(key=lambda c: (c.remaining is not None and c.remaining < MIN_REMAINING, -c.score))
+        return candidates
+
+    def login(self, accounts, on_attempt=None, **client_kwargs):
+        """Logs in with the best of ``accounts``, failing over to the next one when the portal rejects it
+
+        ``on_attempt(candidate, error)`` is called after every attempt,
+        ``error`` is ``None`` for the one that succeeds. Other errors than
+        :class:`NautaLoginException` (network, already connected, ...)
+        don't depend on the account and are raised right away.
+        """
+        from nautapy.nauta_api import NautaClient
+
+        session = None
+        error = NautaLoginException("No existe ningún usuario")
+        for candidate in self.rank(accounts):
+            client = NautaClient(candidate.user, candidate.password, **client_kwargs)
+            start = time.perf_counter()
+            try:
+                self._login(client, session)
+            except NautaLoginException as ex:
+                session = client.session
+                error = ex
+                self.record_failure(candidate.user)
+                if on_attempt:
+                    on_attempt(candidate, ex)
+                continue
+
+            self.record_success(candidate.user, time.perf_counter() - start)
+            if on_attempt:
+                on_attempt(candidate, None)
+            return client
+
+        raise error
+
+    @staticmethod
+    def _login(client, session):
+        # The form of the rejected account skips the handshake, unless it expired
+        client.session = session
+        try:
+            client.login()
+        except NautaSessionExpiredException:
+            if session is None:
+                raise
+            client.session = None
+            client.login()
@@ -0,0 +1,180 @@
+"""
+Concurrent management of many Nauta accounts
+
+Each account gets its own session file under ``SESSIONS_DIR`` so the
+sessions of different users never collide. Logins and logouts run in a
+bounded thread pool, results are yielded as they complete.
+
+Example:
+    manager = SessionManager([("pepe@nauta.com.cu", "pepepass"), ...])
+    for result in manager.login_all():
+        print(result.user, result.ok, result.latency)
+
+    print(manager.stats.as_dict())
+
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from requests import RequestException
+
+from nautapy.exceptions import NautaException
+from nautapy.nauta_api import NautaClient
+from nautapy.session_store import SessionStore, SESSIONS_DIR
+
+MAX_WORKERS = 8
+
+PoolResult = namedtuple("PoolResult", ["user", "ok", "latency", "value", "error"])
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+class PoolStats(object):
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latencies = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            if result.ok:
+                self.successes += 1
+            else:
+                self.failures += 1
+            self.latencies.append(result.latency)
+
+    @property
+    def count(self):
+        return self.successes + self.failures
+
+    @property
+    def throughput(self):
+        return self.count / self.elapsed if self.elapsed else None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "successes": self.successes,
+            "failures": self.failures,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "p50": _percentile(self.latencies, 50),
+            "p95": _percentile(self.latencies, 95),
+            "max": max(self.latencies) if self.latencies else None,
+        }
+
+
+class SessionManager(object):
+    def __init__(self, accounts, max_workers=MAX_WORKERS, sessions_dir=None):
+        self.sessions_dir = sessions_dir or SESSIONS_DIR
+        self.store = SessionStore(self.sessions_dir)
+        self.max_workers = max_workers
+        self.stats = PoolStats()
+
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+        self.clients = {
+            user: NautaClient(
+                user,
+                password,
+                fast_login=False,
+                check_connection=False,
+                session_file=self.session_file(user)
+            )
+            for user, password in accounts
+        }
+
+    def session_file(self, user):
+        return self.store.path(user)
+
+    def _select(self, users):
+        if users is None:
+            return list(self.clients.values())
+        return [self.clients[user] for user in users if user in self.clients]
+
+    def _call(self, client, operation):
+        start = time.perf_counter()
+        try:
+            value = operation(client)
+            result = PoolResult(client.user, True, time.perf_counter() - start, value, None)
+        except (NautaException, RequestException) as ex:
+            result = PoolResult(client.user, False, time.perf_counter() - start, None, ex)
+
+        self.stats.record(result)
+        return result
+
+    def run(self, operation, users=None):
+        """Runs ``operation(client)`` for every client, yielding :class:`PoolResult` as they complete"""
+        clients = self._select(users)
+        if not clients:
+            return
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._call, client, operation) for client in clients]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+                self.stats.elapsed += time.perf_counter() - start
+
+    @staticmethod
+    def _login(client):
+        try:
+            client.login()
+        except Exception:
+            # Don't leave a session file behind for a failed login
+            if client.session:
+                client.session.dispose()
+                client.session = None
+            raise
+
+    @staticmethod
+    def _logout(client):
+        client.load_last_session()
+        client.logout()
+
+    def login_all(self, users=None):
+        return self.run(self._login, [
+            client.user for client in self._select(users)
+            if not client.is_logged_in
+        ])
+
+    def logout_all(self, users=None):
+        return self.run(self._logout, [
+            client.user for client in self._select(users)
+            if client.is_logged_in
+        ])
+
+    @staticmethod
+    def _query(client, credit=False):
+        if client.is_logged_in and not client.session:
+            client.load_last_session()
+
+        info = {"remaining_time": client.remaining_time}
+        if credit:
+            info["credit"] = client.user_credit
+
+        return info
+
+    def query_all(self, users=None, credit=False):
+        """Remaining time (and credit) of every user, yielded as they arrive"""
+        return self.run(lambda client: self._query(client, credit=credit), users)
+
+    def status(self):
+        return {user: client.is_logged_in for user, client in self.clients.items()}
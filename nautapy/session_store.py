@@ -0,0 +1,126 @@
+"""
+Crash-safe storage of Nauta sessions
+
+A session is a single compact JSON record, cookies included. It is
+written to a temporary file, fsynced and renamed over the previous one,
+so readers always find either the old record or the new one, never a
+half written file or cookies that don't match the session.
+:class:`SessionStore` keeps named sessions in a directory.
+
+Example:
+    store = SessionStore()
+    store.save("pepe@nauta.com.cu", {"attribute_uuid": "...", "cookies": []})
+    record = store.load("pepe@nauta.com.cu")
+
+"""
+
+import json
+import os
+from http.cookiejar import Cookie
+
+from nautapy import appdata_path, ensure_dir
+
+SESSIONS_DIR = os.path.join(appdata_path, "sessions")
+
+_TMP_SUFFIX = ".tmp"
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_record(path, record):
+    """Atomically replaces the record at ``path``"""
+    ensure_dir(path)
+    data = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    tmp_path = "{}.{}{}".format(path, os.getpid(), _TMP_SUFFIX)
+
+    try:
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    _fsync_dir(os.path.dirname(path))
+
+
+def read_record(path):
+    with open(path, "rb") as fp:
+        return json.loads(fp.read())
+
+
+def remove_record(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def dump_cookies(jar):
+    return [
+        [cookie.name, cookie.value, cookie.domain, cookie.path, cookie.secure, cookie.expires]
+        for cookie in jar
+    ]
+
+
+def load_cookies(jar, cookies):
+    for name, value, domain, path, secure, expires in cookies:
+        jar.set_cookie(Cookie(
+            0, name, value, None, False,
+            domain, bool(domain), domain.startswith("."),
+            path, True,
+            secure, expires, expires is None,
+            None, None, {"HttpOnly": None}
+        ))
+
+
+class SessionStore(object):
+    def __init__(self, directory=None):
+        self.directory = directory or SESSIONS_DIR
+
+    def path(self, name):
+        if not name or os.sep in name or name.startswith(".") or name.endswith(_TMP_SUFFIX):
+            raise ValueError("Invalid session name: {!r}".format(name))
+        return os.path.join(self.directory, name)
+
+    def names(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        return sorted(
+            entry.name for entry in entries
+            if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(_TMP_SUFFIX)
+        )
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def save(self, name, record):
+        write_record(self.path(name), record)
+
+    def load(self, name):
+        """The record of session ``name``, ``None`` if there isn't any"""
+        try:
+            return read_record(self.path(name))
+        except FileNotFoundError:
+            return None
+
+    def remove(self, name):
+        remove_record(self.path(name))
@@ -0,0 +1,117 @@
+"""
+Cache of the remaining time of the accounts
+
+The portal is asked for the remaining time of an account once, then the
+value is counted down locally while the account has a session open.
+:class:`RemainingTimeCache` asks the portal again when the value is older
+than ``ttl`` seconds, or when the drift measured at the last refresh
+suggests that the local countdown is already ``max_drift`` seconds off.
+
+Example:
+    cache = RemainingTimeCache()
+    seconds = cache.get("pepe@nauta.com.cu", active=True)
+    if seconds is None:
+        seconds = utils.strtime2seconds(client.remaining_time)
+        cache.update("pepe@nauta.com.cu", seconds, active=True)
+
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from nautapy import appdata_path, session_store
+
+TIME_CACHE_FILE = os.path.join(appdata_path, "time-cache")
+
+TTL = 600
+MAX_DRIFT = 30
+
+# ``seconds`` remaining at ``since``, counting down if ``active``. The
+# portal was last asked at ``sampled_at``, its answer was ``drift_rate``
+# seconds off the countdown per second elapsed.
+TimeEntry = namedtuple("TimeEntry", ["seconds", "since", "active", "sampled_at", "drift_rate"])
+
+# Read-modify-write of the file by the threads of a SessionManager
+_lock = threading.Lock()
+
+
+class RemainingTimeCache(object):
+    def __init__(self, path=None, ttl=TTL, max_drift=MAX_DRIFT, clock=time.time):
+        self.path = path or TIME_CACHE_FILE
+        self.ttl = ttl
+        self.max_drift = max_drift
+        self.clock = clock
+
+    def _load(self):
+        try:
+            return {user: TimeEntry(*entry) for user, entry in session_store.read_record(self.path).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save(self, entries):
+        session_store.write_record(self.path, {user: list(entry) for user, entry in entries.items()})
+
+    @staticmethod
+    def _extrapolate(entry, now):
+        if not entry.active:
+            return entry.seconds
+        return max(0, entry.seconds - int(now - entry.since))
+
+    def get(self, user, active):
+        """Remaining seconds of ``user``, ``None`` if the portal must be asked"""
+        entry = self._load().get(user)
+        if entry is None or entry.active != active:
+            return None
+
+        now = self.clock()
+        age = now - entry.sampled_at
+        if age < 0 or age > self.ttl or entry.drift_rate * age > self.max_drift:
+            return None
+
+        return self._extrapolate(entry, now)
+
+    def last_known(self):
+        """Last known remaining seconds of every user, however old"""
+        now = self.clock()
+        return {user: self._extrapolate(entry, now) for user, entry in self._load().items()}
+
+    def update(self, user, seconds, active):
+        """Records the remaining ``seconds`` reported by the portal"""
+        with _lock:
+            entries = self._load()
+            now = self.clock()
+
+            previous = entries.get(user)
+            drift_rate = previous.drift_rate if previous else 0.0
+            if previous and now > previous.sampled_at:
+                drift_rate = abs(self._extrapolate(previous, now) - seconds) / (now - previous.sampled_at)
+
+            entries[user] = TimeEntry(seconds, now, active, now, drift_rate)
+            self._save(entries)
+
+    def _set_active(self, user, active):
+        with _lock:
+            entries = self._load()
+            entry = entries.get(user)
+            if entry is None or entry.active == active:
+                return
+
+            now = self.clock()
+            entries[user] = entry._replace(seconds=self._extrapolate(entry, now), since=now, active=active)
+            self._save(entries)
+
+    def start(self, user):
+        """The session of ``user`` was opened, start counting down"""
+        self._set_active(user, True)
+
+    def stop(self, user):
+        """The session of ``user`` was closed, stop counting down"""
+        self._set_active(user, False)
+
+    def invalidate(self, user):
+        with _lock:
+            entries = self._load()
+            if entries.pop(user, None) is not None:
+                self._save(entries)
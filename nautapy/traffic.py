@@ -0,0 +1,199 @@
+"""
+Traffic accounting of the sessions
+
+The byte counters of the network interfaces (``/proc/net/dev``) are read
+when a session is opened and again when it's closed. :class:`TrafficMeter`
+keeps the first reading in the session file, so a session opened by
+``nauta up`` and closed by ``nauta down`` from another process is still
+accounted, and records the difference in ``stats.db``. Only the last
+``MAX_SESSIONS`` sessions are kept. ``sqlite3`` is only imported when
+a session is recorded or queried, and the table only created when the
+database is behind ``MIGRATIONS`` (see nautapy.migrations).
+
+Example:
+    meter = TrafficMeter(command="git push")
+    reading = meter.start()
+    ...
+    meter.stop("pepe@nauta.com.cu", reading)
+
+    for row in TrafficStore().summary(by="user"):
+        print(row.key, row.bytes_per_minute)
+
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from nautapy import appdata_path, ensure_dir, migrations, utils
+
+logger = logging.getLogger(__name__)
+
+STATS_DB = os.path.join(appdata_path, "stats.db")
+PROC_NET_DEV = "/proc/net/dev"
+MAX_SESSIONS = 10000
+TIME_UNIT = 60
+
+
+def _create_tables(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS traffic ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "user TEXT, "
+        "command TEXT, "
+        "started REAL NOT NULL, "
+        "ended REAL NOT NULL, "
+        "received INTEGER NOT NULL, "
+        "sent INTEGER NOT NULL)"
+    )
+
+
+MIGRATIONS = [_create_tables]
+
+Traffic = namedtuple("Traffic", ["id", "user", "command", "started", "ended", "received", "sent"])
+
+
+class Summary(namedtuple("Summary", ["key", "sessions", "duration", "billed", "received", "sent"])):
+    @property
+    def total(self):
+        return self.received + self.sent
+
+    @property
+    def bytes_per_minute(self):
+        """Bytes moved per billed minute"""
+        return self.total * 60 / self.billed if self.billed else 0.0
+
+
+def read_counters(path=PROC_NET_DEV, interfaces=None):
+    """``(received, sent)`` bytes of ``interfaces`` (all but loopback), ``None`` if not available"""
+    try:
+        with open(path) as fp:
+            lines = fp.readlines()[2:]
+    except OSError:
+        return None
+
+    received = sent = 0
+    for line in lines:
+        name, _, fields = line.partition(":")
+        name = name.strip()
+        if name == "lo" or (interfaces and name not in interfaces):
+            continue
+        fields = fields.split()
+        received += int(fields[0])
+        sent += int(fields[8])
+    return received, sent
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "TB"
+    return "{:.0f} {}".format(size, unit) if unit == "B" else "{:.1f} {}".format(size, unit)
+
+
+class TrafficStore(object):
+    def __init__(self, path=None, max_sessions=MAX_SESSIONS):
+        self.path = path or STATS_DB
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        import sqlite3
+
+        ensure_dir(self.path)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        migrations.migrate(self._conn, MIGRATIONS)
+
+    def close(self):
+        self._conn.close()
+
+    def record(self, user, command, started, ended, received, sent):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO traffic (user, command, started, ended, received, sent) VALUES (?, ?, ?, ?, ?, ?)",
+                (user, command, started, ended, received, sent)
+            )
+            # Ring buffer, the oldest sessions are dropped
+            self._conn.execute("DELETE FROM traffic WHERE id <= ?", (cursor.lastrowid - self.max_sessions,))
+            return Traffic(cursor.lastrowid, user, command, started, ended, received, sent)
+
+    def sessions(self, user=None, limit=None):
+        """Recorded sessions, newest first"""
+        query, params = "SELECT * FROM traffic", ()
+        if user:
+            query, params = query + " WHERE user=?", (user,)
+        if limit:
+            query, params = query + " ORDER BY id DESC LIMIT ?", params + (limit,)
+        else:
+            query += " ORDER BY id DESC"
+
+        with self._lock:
+            return [Traffic(*row) for row in self._conn.execute(query, params)]
+
+    def summary(self, by="user", user=None, time_unit=TIME_UNIT, limit=None):
+        """Traffic grouped by ``user``, ``command`` or ``session``
+
+        Each session bills at least one ``time_unit``, and whole units.
+        """
+        groups = {}
+        for session in self.sessions(user=user, limit=limit if by == "session" else None):
+            if by == "session":
+                key = "{} {}".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(session.started)), session.user)
+            else:
+                key = getattr(session, by) or "-"
+
+            duration = max(0.0, session.ended - session.started)
+            billed = utils.next_billing_boundary(0, duration, time_unit)
+            row = groups.get(key)
+            groups[key] = Summary(key, 1, duration, billed, session.received, session.sent) if row is None else \
+                Summary(key, row.sessions + 1, row.duration + duration, row.billed + billed,
+                        row.received + session.received, row.sent + session.sent)
+
+        rows = list(groups.values())
+        if by != "session":
+            rows.sort(key=lambda row: row.total, reverse=True)
+        return rows[:limit] if limit else rows
+
+
+class TrafficMeter(object):
+    """Accounts the traffic of a session, from :meth:`start` at login to :meth:`stop` at logout"""
+    def __init__(self, command=None, interfaces=None, store=None, counters=read_counters, clock=time.time):
+        self.command = command
+        self.interfaces = interfaces
+        self.store = store
+        self.counters = counters
+        self.clock = clock
+
+    def start(self):
+        """Reading to keep with the session, ``None`` if the counters are not available"""
+        counters = self.counters(interfaces=self.interfaces)
+        if counters is None:
+            return None
+        return [self.clock(), counters[0], counters[1], self.command]
+
+    def stop(self, user, reading):
+        """Records the traffic since ``reading``, never fails the logout"""
+        counters = reading and self.counters(interfaces=self.interfaces)
+        if not counters:
+            return None
+
+        import sqlite3
+
+        started, received, sent, command = reading
+        store = self.store
+        try:
+            store = store or TrafficStore()
+            # Counters go back when an interface is recreated
+            return store.record(
+                user, command, started, self.clock(),
+                max(0, counters[0] - received), max(0, counters[1] - sent)
+            )
+        except (sqlite3.Error, OSError) as ex:
+            logger.warning("Traffic of %s not recorded: %s", user, ex)
+            return None
+        finally:
+            if store and store is not self.store:
+                store.close()
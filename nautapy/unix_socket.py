@@ -0,0 +1,79 @@
+"""
+JSON messages over UNIX stream sockets
+
+The broker (see nautapy.connection_pool) and the daemon (see nautapy.daemon)
+serve the other processes of the user on a UNIX socket in the appdata
+directory, one JSON message per line. The socket is only accessible by
+its owner and removed when the server closes. A server refuses to start
+while another one answers on the same socket.
+
+"""
+
+import json
+import os
+import socket
+import socketserver
+
+from nautapy import ensure_dir
+from nautapy.exceptions import NautaException
+
+
+def send_message(sock, message):
+    sock.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def decode_message(line):
+    return json.loads(line.decode("utf-8"))
+
+
+def recv_message(fp):
+    """Next message of ``fp``, raises :class:`ConnectionError` if the peer closed the connection"""
+    line = fp.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the peer")
+    return decode_message(line)
+
+
+def connect(socket_path, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class UnixSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, handler_class):
+        self.socket_path = socket_path
+        ensure_dir(self.socket_path)
+        if os.path.exists(self.socket_path):
+            try:
+                connect(self.socket_path, timeout=1).close()
+            except ConnectionRefusedError:
+                # Left by a server that didn't close
+                os.remove(self.socket_path)
+            else:
+                raise NautaException("Ya hay un servidor escuchando en {}".format(self.socket_path))
+
+        super().__init__(self.socket_path, handler_class)
+        os.chmod(self.socket_path, 0o600)
+        self._identity = self._stat()
+
+    def _stat(self):
+        # The inode of a removed socket may be reused for the next one
+        stat = os.stat(self.socket_path)
+        return stat.st_dev, stat.st_ino, stat.st_ctime_ns
+
+    def server_close(self):
+        super().server_close()
+        try:
+            # Unless another server took the path
+            if self._stat() == self._identity:
+                os.remove(self.socket_path)
+        except OSError:
+            pass
@@ -0,0 +1,241 @@
+"""
+Ledger of the time used by each account
+
+Every login, logout and remaining time reported by the portal is appended
+to the ``events`` table of ``usage.db``. The same transaction updates the
+aggregates: the seconds used per account and day (``daily``) and month
+(``monthly``), and the last state of the account (``accounts``). Sessions
+spanning midnight are split between both days. :meth:`UsageLedger.usage`
+reads at most ``BURN_RATE_DAYS`` daily rows, no matter how long the
+history is. The tables are only created when the database is behind
+``MIGRATIONS`` (see nautapy.migrations).
+
+Example:
+    ledger = UsageLedger.default()
+    ledger.login("pepe@nauta.com.cu")
+    ledger.remaining("pepe@nauta.com.cu", 7200)
+    ledger.logout("pepe@nauta.com.cu")
+
+    print(ledger.usage("pepe@nauta.com.cu")["depletion"])
+
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+
+from nautapy import appdata_path, ensure_dir, migrations
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB = os.path.join(appdata_path, "usage.db")
+BURN_RATE_DAYS = 30
+
+LOGIN = "login"
+LOGOUT = "logout"
+REMAINING = "remaining"
+
+
+def _create_tables(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS events ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL, kind TEXT NOT NULL, at REAL NOT NULL, "
+        "seconds INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS daily ("
+        "user TEXT NOT NULL, day TEXT NOT NULL, used REAL NOT NULL, sessions INTEGER NOT NULL, "
+        "PRIMARY KEY (user, day))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS monthly ("
+        "user TEXT NOT NULL, month TEXT NOT NULL, used REAL NOT NULL, sessions INTEGER NOT NULL, "
+        "PRIMARY KEY (user, month))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS accounts ("
+        "user TEXT PRIMARY KEY, first_seen REAL NOT NULL, login_at REAL, remaining INTEGER, remaining_at REAL, "
+        "used REAL NOT NULL DEFAULT 0)"
+    )
+
+
+MIGRATIONS = [_create_tables]
+
+_INSERT_EVENT = "INSERT INTO events (user, kind, at, seconds) VALUES (?, ?, ?, ?)"
+_INSERT_ACCOUNT = "INSERT OR IGNORE INTO accounts (user, first_seen) VALUES (?, ?)"
+_SELECT_ACCOUNT = "SELECT first_seen, login_at, remaining, remaining_at, used FROM accounts WHERE user=?"
+_SELECT_ACCOUNTS = "SELECT user FROM accounts ORDER BY user"
+_UPDATE_LOGIN = "UPDATE accounts SET login_at=? WHERE user=?"
+_UPDATE_LOGOUT = "UPDATE accounts SET login_at=NULL, used=used+? WHERE user=?"
+_UPDATE_REMAINING = "UPDATE accounts SET remaining=?, remaining_at=? WHERE user=?"
+_UPSERT_DAILY = (
+    "INSERT INTO daily VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user, day) DO UPDATE SET used=used+excluded.used, sessions=sessions+excluded.sessions"
+)
+_UPSERT_MONTHLY = (
+    "INSERT INTO monthly VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user, month) DO UPDATE SET used=used+excluded.used, sessions=sessions+excluded.sessions"
+)
+_SELECT_DAY = "SELECT used FROM daily WHERE user=? AND day=?"
+_SELECT_MONTH = "SELECT used FROM monthly WHERE user=? AND month=?"
+_SELECT_SINCE = "SELECT coalesce(sum(used), 0) FROM daily WHERE user=? AND day>=?"
+
+
+def split_by_day(start, end):
+    """Yields ``(date, seconds)`` of the interval ``start``-``end`` in each local day"""
+    while start < end:
+        day = datetime.date.fromtimestamp(start)
+        midnight = time.mktime((day + datetime.timedelta(days=1)).timetuple())
+        chunk_end = min(end, midnight)
+        yield day, chunk_end - start
+        start = chunk_end
+
+
+class UsageLedger(object):
+    _default = None
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or USAGE_DB
+        self.clock = clock
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls):
+        """The ledger at ``USAGE_DB``, shared by the whole process"""
+        if not cls._default or cls._default.path != USAGE_DB:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def connection(self):
+        if not self._conn:
+            import sqlite3
+
+            ensure_dir(self.path)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            # A crash may lose the last events but never corrupts the aggregates
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            migrations.migrate(self._conn, MIGRATIONS)
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _append(self, user, kind, seconds=None, update=None):
+        """Appends an event and applies ``update(conn, now)`` to the aggregates in the same transaction"""
+        import sqlite3
+
+        if not user:
+            return
+
+        now = self.clock()
+        try:
+            with self._lock:
+                conn = self.connection
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(_INSERT_EVENT, (user, kind, now, seconds))
+                    conn.execute(_INSERT_ACCOUNT, (user, now))
+                    if update:
+                        update(conn, now)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except (sqlite3.Error, OSError) as ex:
+            # The ledger must never fail a login or logout
+            logger.warning("Usage of %s not recorded: %s", user, ex)
+
+    def login(self, user):
+        self._append(user, LOGIN, update=lambda conn, now: conn.execute(_UPDATE_LOGIN, (now, user)))
+
+    def logout(self, user):
+        def update(conn, now):
+            _, login_at, remaining, remaining_at, _ = conn.execute(_SELECT_ACCOUNT, (user,)).fetchone()
+            if login_at is None or login_at > now:
+                # Opened before the ledger existed, nothing to account
+                return
+
+            if remaining is not None:
+                # Count down the last reported value, the portal may not be asked again
+                spent = now - max(login_at, remaining_at)
+                conn.execute(_UPDATE_REMAINING, (max(0, remaining - int(max(0, spent))), now, user))
+
+            for number, (day, seconds) in enumerate(split_by_day(login_at, now)):
+                sessions = 0 if number else 1
+                conn.execute(_UPSERT_DAILY, (user, day.isoformat(), seconds, sessions))
+                conn.execute(_UPSERT_MONTHLY, (user, day.strftime("%Y-%m"), seconds, sessions))
+            conn.execute(_UPDATE_LOGOUT, (now - login_at, user))
+
+        self._append(user, LOGOUT, update=update)
+
+    def remaining(self, user, seconds):
+        """Records the remaining ``seconds`` reported by the portal"""
+        self._append(
+            user, REMAINING, seconds,
+            update=lambda conn, now: conn.execute(_UPDATE_REMAINING, (seconds, now, user))
+        )
+
+    def users(self):
+        with self._lock:
+            return [row[0] for row in self.connection.execute(_SELECT_ACCOUNTS)]
+
+    def usage(self, user, days=BURN_RATE_DAYS):
+        """Usage of ``user`` from the aggregates, ``None`` if it was never recorded
+
+        ``burn_rate`` is the average of seconds used per day over the last
+        ``days`` (or since the account was first seen), ``remaining`` is
+        the last value reported by the portal minus the time used since,
+        and ``depletion`` the timestamp when it runs out at ``burn_rate``.
+        """
+        now = self.clock()
+        today = datetime.date.fromtimestamp(now)
+        since = today - datetime.timedelta(days=days - 1)
+
+        with self._lock:
+            conn = self.connection
+            account = conn.execute(_SELECT_ACCOUNT, (user,)).fetchone()
+            if account is None:
+                return None
+            first_seen, login_at, remaining, remaining_at, used = account
+            used_today = (conn.execute(_SELECT_DAY, (user, today.isoformat())).fetchone() or (0,))[0]
+            used_month = (conn.execute(_SELECT_MONTH, (user, today.strftime("%Y-%m"))).fetchone() or (0,))[0]
+            used_window = conn.execute(_SELECT_SINCE, (user, since.isoformat())).fetchone()[0]
+
+        # The open session counts as used until now
+        if login_at is not None and login_at <= now:
+            for day, seconds in split_by_day(max(login_at, time.mktime(since.timetuple())), now):
+                used_window += seconds
+                if day == today:
+                    used_today += seconds
+                if day.strftime("%Y-%m") == today.strftime("%Y-%m"):
+                    used_month += seconds
+
+        window = min(days, max(1.0, (now - first_seen) / 86400))
+        burn_rate = used_window / window
+
+        if remaining is not None:
+            counted_from = max(remaining_at, login_at) if login_at is not None else None
+            if counted_from is not None and counted_from < now:
+                remaining = max(0, remaining - int(now - counted_from))
+
+        depletion = None
+        if remaining is not None and burn_rate > 0:
+            depletion = now + remaining / burn_rate * 86400
+
+        return {
+            "user": user,
+            "today": used_today,
+            "month": used_month,
+            "total": used,
+            "burn_rate": burn_rate,
+            "remaining": remaining,
+            "remaining_at": remaining_at,
+            "depletion": depletion,
+            "logged_in": login_at is not None,
+        }
@@ -1,3 +1,4 @@
+import math
 import re
 
 from nautapy.exceptions import NautaFormatException
@@ -24,6 +25,15 @@ def seconds2strtime(seconds):
     )
 
 
+def next_billing_boundary(start, now, time_unit):
+    """End of the billed time unit running at ``now``, for a session opened at ``start``
+
+    At least one time unit is always billed.
+    """
+    units = max(1, math.ceil((now - start) / time_unit))
+    return start + units * time_unit
+
+
 def val_or_error(callback):
     try:
         return callback()
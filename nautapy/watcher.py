@@ -0,0 +1,155 @@
+"""
+Waits for the end of a Nauta session without polling every second
+
+:class:`SessionWatcher` wakes up as soon as the session file is removed,
+using inotify on Linux and falling back to checking the file every
+``POLL_INTERVAL`` seconds elsewhere. Processes closing the session can
+also call :func:`notify`, which sends a datagram to a socket next to the
+session file, so the watcher ends immediately even when polling.
+
+Example:
+    with SessionWatcher() as watcher:
+        while not watcher.wait(timeout=1):
+            redraw()
+
+"""
+
+import ctypes
+import os
+import select
+import socket
+import sys
+import time
+
+from nautapy import ensure_dir
+
+POLL_INTERVAL = 1
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+
+def _default_session_file():
+    from nautapy.nauta_api import NAUTA_SESSION_FILE
+
+    return NAUTA_SESSION_FILE
+
+
+def socket_path_for(session_file):
+    return session_file + ".sock"
+
+
+def notify(session_file=None):
+    """Tells the watcher of ``session_file``, if any, that the session was closed"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(b"closed", socket_path_for(session_file or _default_session_file()))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class Inotify(object):
+    """Minimal inotify binding, watches the changes in a directory"""
+    def __init__(self, directory, mask=IN_WATCH_MASK):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def fileno(self):
+        return self.fd
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+    @classmethod
+    def create(cls, directory):
+        """An :class:`Inotify` watching ``directory``, or ``None`` if not supported"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            return cls(directory)
+        except (OSError, AttributeError):
+            return None
+
+
+class SessionWatcher(object):
+    def __init__(self, session_file=None, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.session_file = session_file or _default_session_file()
+        self.poll_interval = poll_interval
+        self.closed_by_peer = False
+
+        ensure_dir(self.session_file)
+        self.inotify = Inotify.create(os.path.dirname(os.path.abspath(self.session_file))) if use_inotify else None
+
+        self.socket_path = socket_path_for(self.session_file)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+        self.socket.bind(self.socket_path)
+        self.socket.setblocking(False)
+
+    @property
+    def polling(self):
+        return self.inotify is None
+
+    def is_logged_in(self):
+        return not self.closed_by_peer and os.path.exists(self.session_file)
+
+    def wait(self, timeout=None):
+        """Waits until the session ends or ``timeout`` expires. Returns ``True`` if it ended"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        readers = [self.socket] + ([self.inotify] if self.inotify else [])
+
+        while self.is_logged_in():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.polling:
+                remaining = self.poll_interval if remaining is None else min(remaining, self.poll_interval)
+
+            ready, _, _ = select.select(readers, [], [], remaining)
+            if self.socket in ready:
+                self.closed_by_peer = True
+            if self.inotify in ready:
+                self.inotify.drain()
+
+        return True
+
+    def close(self):
+        self.socket.close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from nautapy import nauta_api, selection, time_cache, traffic, usage
+from nautapy.nauta_api import NautaProtocol
+from nautapy.probe import ProbeEngine, ContentProbe
+from nautapy.mock_portal import MockPortal
+
+
+@pytest.fixture(autouse=True)
+def fresh_time_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(time_cache, "TIME_CACHE_FILE", str(tmp_path / "time-cache"))
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(traffic, "STATS_DB", str(tmp_path / "stats.db"))
+
+
+@pytest.fixture(autouse=True)
+def fresh_usage_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(usage, "USAGE_DB", str(tmp_path / "usage.db"))
+
+
+@pytest.fixture(autouse=True)
+def fresh_account_stats(monkeypatch, tmp_path):
+    monkeypatch.setattr(selection, "ACCOUNT_STATS_FILE", str(tmp_path / "account-stats"))
+
+
+@pytest.fixture(autouse=True)
+def fresh_probe_engine(monkeypatch):
+    # Cached probe results and the circuit breaker state must not leak between tests
+    monkeypatch.setattr(NautaProtocol, "probe_engine", None)
+    monkeypatch.setattr(NautaProtocol, "retry_policy", None)
+    monkeypatch.setattr(NautaProtocol, "hedger", None)
+    monkeypatch.setattr(NautaProtocol, "hedging", False)
+
+
+@pytest.fixture()
+def mock_portal(monkeypatch, tmp_path):
+    accounts = {
+        "user{}@nauta.com.cu".format(i): "pass{}".format(i)
+        for i in range(200)
+    }
+
+    with MockPortal(accounts=accounts) as portal:
+        monkeypatch.setattr(nauta_api, "LOGIN_URL", portal.url)
+        monkeypatch.setattr(nauta_api, "CHECK_PAGE", portal.check_url)
+        monkeypatch.setattr(NautaProtocol, "probe_engine", ProbeEngine([ContentProbe(portal.check_url)]))
+        monkeypatch.setattr(nauta_api, "NAUTA_SESSION_FILE", str(tmp_path / "nauta-session"))
+        monkeypatch.setattr(nauta_api, "NAUTA_LOGIN_CACHE_FILE", str(tmp_path / "nauta-login-cache"))
+        yield portal
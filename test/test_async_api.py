@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from nautapy.async_api import AsyncNautaClient, AsyncNautaProtocol
+from nautapy.exceptions import NautaLoginException, NautaPreLoginException
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_async_protocol_is_connected(mock_portal):
+    assert run(AsyncNautaProtocol.is_connected()) is False
+
+
+def test_async_protocol_create_session_raises_when_connected(mock_portal):
+    mock_portal.sessions["someone@nauta.com.cu"] = "UUID"
+
+    with pytest.raises(NautaPreLoginException):
+        run(AsyncNautaProtocol.create_session())
+
+
+def test_async_client_login_logout(mock_portal):
+    async def scenario():
+        client = AsyncNautaClient("user0@nauta.com.cu", "pass0")
+        async with await client.login():
+            assert client.is_logged_in
+            assert "user0@nauta.com.cu" in mock_portal.sessions
+            remaining_time = await client.remaining_time
+
+        return client, remaining_time
+
+    client, remaining_time = run(scenario())
+
+    assert not client.is_logged_in
+    assert remaining_time == mock_portal.remaining_time
+    assert not mock_portal.sessions
+
+
+def test_async_client_login_bad_password(mock_portal):
+    client = AsyncNautaClient("user0@nauta.com.cu", "wrong")
+
+    with pytest.raises(NautaLoginException) as ex:
+        run(client.login())
+
+    assert "incorrectos" in ex.value.args[0]
+
+
+def test_async_client_user_credit(mock_portal):
+    client = AsyncNautaClient("user0@nauta.com.cu", "pass0")
+
+    assert run(client.user_credit) == mock_portal.credit
+
+
+def test_async_client_concurrent_logins(mock_portal):
+    clients = [
+        AsyncNautaClient("user{}@nauta.com.cu".format(i), "pass{}".format(i))
+        for i in range(100)
+    ]
+
+    async def scenario():
+        await asyncio.gather(*[client.login() for client in clients])
+        assert len(mock_portal.sessions) == len(clients)
+        await asyncio.gather(*[client.logout() for client in clients])
+
+    run(scenario())
+
+    assert not mock_portal.sessions
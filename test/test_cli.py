@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+import pytest
+
+RUN_CLI = (
+    "import sys\n"
+    "sys.argv = ['nauta'] + sys.argv[1:]\n"
+    "import nautapy.cli\n"
+    "try:\n"
+    "    nautapy.cli.main()\n"
+    "except SystemExit:\n"
+    "    pass\n"
+    "sys.stderr.write(' '.join(sys.modules))\n"
+)
+
+
+def loaded_modules(tmp_path, *args):
+    proc = subprocess.run(
+        [sys.executable, "-c", RUN_CLI] + list(args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env={"HOME": str(tmp_path), "PATH": ""},
+        check=True
+    )
+    return set(proc.stderr.split())
+
+
+@pytest.mark.parametrize("args, allowed", [
+    (["--version"], set()),
+    (["--help"], set()),
+    (["is-logged-in"], set()),
+    (["users", "list"], {"sqlite3"}),
+])
+def test_cli_fast_start(tmp_path, args, allowed):
+    modules = loaded_modules(tmp_path, *args)
+
+    for heavy in {"requests", "bs4", "sqlite3", "asyncio"} - allowed:
+        assert heavy not in modules
+
+
+def test_import_does_not_create_appdata(tmp_path):
+    loaded_modules(tmp_path, "--version")
+
+    assert not (tmp_path / ".local").exists()
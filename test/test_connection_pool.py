@@ -0,0 +1,119 @@
+import socketserver
+import threading
+
+import pytest
+import requests
+
+from nautapy import connection_pool, unix_socket
+from nautapy.connection_pool import BrokerAdapter, BrokerServer, ConnectionPool
+from nautapy.nauta_api import NautaClient, NautaProtocol, SessionObject
+
+
+@pytest.fixture()
+def broker(monkeypatch, tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+    monkeypatch.setattr(connection_pool, "BROKER_SOCKET", socket_path)
+
+    server = BrokerServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_sessions_share_the_pooled_adapter():
+    first, second = SessionObject(), SessionObject()
+
+    adapter = first.requests_session.get_adapter("https://secure.etecsa.net:8443")
+    assert adapter is ConnectionPool.get_adapter()
+    assert adapter is second.requests_session.get_adapter("http://www.cubadebate.cu/")
+
+
+def test_configure_replaces_the_adapter():
+    adapter = ConnectionPool.get_adapter()
+    try:
+        ConnectionPool.configure(pool_maxsize=2)
+        assert ConnectionPool.get_adapter() is not adapter
+        assert ConnectionPool.get_adapter()._pool_maxsize == 2
+    finally:
+        ConnectionPool.configure()
+
+
+def test_session_relays_through_broker(mock_portal, broker):
+    session = NautaProtocol.create_session()
+
+    assert isinstance(session.requests_session.get_adapter(mock_portal.url), BrokerAdapter)
+    assert broker.relayed == 2
+    cookies = requests.utils.dict_from_cookiejar(session.requests_session.cookies)
+    assert cookies["JSESSIONID"] == session.csrfhw.upper()
+
+
+def test_client_login_logout_through_broker(mock_portal, broker):
+    client = NautaClient("user0@nauta.com.cu", "pass0")
+    with client.login():
+        assert "user0@nauta.com.cu" in mock_portal.sessions
+
+    assert not mock_portal.sessions
+    # Landing GET, form POST, login POST + redirect, logout
+    assert broker.relayed == 5
+
+
+def test_broker_adapter_falls_back_when_broker_is_down(mock_portal, monkeypatch, tmp_path):
+    socket_path = tmp_path / "broker.sock"
+    socket_path.touch()
+    monkeypatch.setattr(connection_pool, "BROKER_SOCKET", str(socket_path))
+
+    session = NautaProtocol.create_session()
+    assert session.csrfhw in mock_portal.csrf_tokens
+
+
+class RecordingAdapter(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request)
+        raise AssertionError("sent again")
+
+
+def test_lost_broker_is_not_retried_directly(mock_portal, tmp_path):
+    class LostHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # Relayed, then the broker dies before answering
+            unix_socket.recv_message(self.rfile)
+
+    socket_path = str(tmp_path / "broker.sock")
+    server = unix_socket.UnixSocketServer(socket_path, LostHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        fallback = RecordingAdapter()
+        session = requests.Session()
+        session.mount("http://", BrokerAdapter(socket_path, fallback=fallback))
+
+        with pytest.raises(requests.ConnectionError):
+            session.post(mock_portal.url + "/LoginServlet", data={"username": "user0@nauta.com.cu"})
+        assert not fallback.sent
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_broker_forwards_transport_options(mock_portal, broker, monkeypatch):
+    sent = []
+    send = broker.adapter.send
+
+    def record(request, **kwargs):
+        sent.append(kwargs)
+        return send(request, **kwargs)
+
+    monkeypatch.setattr(broker.adapter, "send", record)
+    session = requests.Session()
+    session.mount("http://", BrokerAdapter(broker.socket_path))
+    session.get(mock_portal.url + "/", verify=False, proxies={"https": "http://proxy:3128"})
+
+    assert sent[0]["verify"] is False
+    assert sent[0]["proxies"] == {"https": "http://proxy:3128"}
@@ -0,0 +1,160 @@
+import io
+import sqlite3
+from base64 import b85encode
+
+import pytest
+
+from nautapy import credentials
+from nautapy.credentials import CredentialStore, SCHEMA_VERSION, read_accounts, write_accounts
+from nautapy.exceptions import NautaUserException
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CredentialStore(str(tmp_path / "users.db"))
+    yield store
+    store.close()
+
+
+def test_store_creates_schema(store):
+    conn = store.connection
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert [rec[0] for rec in conn.execute("SELECT version FROM schema_migrations")] == [1, 2, 3]
+
+    store.add("pepe@nauta.com.cu", "pepepass")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO users VALUES (?, ?)", ("pepe@nauta.com.cu", b""))
+
+
+def test_store_migrates_legacy_database(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (user TEXT, password TEXT)")
+    conn.execute("CREATE TABLE default_user (user TEXT)")
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [
+        ("pepe@nauta.com.cu", b85encode(b"first")),
+        ("juan@nauta.com.cu", b85encode(b"juanpass")),
+        ("pepe@nauta.com.cu", b85encode(b"second")),
+    ])
+    conn.commit()
+    conn.close()
+
+    store = CredentialStore(path)
+    assert store.users() == ["pepe@nauta.com.cu", "juan@nauta.com.cu"]
+    assert store.find("pepe@nauta.com.cu") == ("pepe@nauta.com.cu", "first")
+    store.close()
+
+
+def test_store_runs_no_ddl_when_up_to_date(store):
+    store.add("pepe@nauta.com.cu", "pepepass")
+    store.close()
+
+    statements = []
+    conn = store.connection
+    conn.set_trace_callback(statements.append)
+    store.find("pepe")
+    store.default_user()
+
+    assert not any("CREATE" in statement for statement in statements)
+
+
+def test_store_find(store):
+    store.add("pepe@nauta.com.cu", "pepepass")
+    store.add("pepa@nauta.com.cu", "pepapass")
+
+    assert store.find("pepe") == ("pepe@nauta.com.cu", "pepepass")
+    assert store.find("pepa@nauta.com.cu") == ("pepa@nauta.com.cu", "pepapass")
+    assert store.find("juan") is None
+
+
+def test_store_add_replaces_password(store):
+    store.add("pepe@nauta.com.cu", "old")
+    store.add("pepe@nauta.com.cu", "new")
+
+    assert store.credentials() == [("pepe@nauta.com.cu", "new")]
+    assert store.set_password("pepe@nauta.com.cu", "newer") == 1
+    assert store.set_password("juan@nauta.com.cu", "x") == 0
+    assert store.find("pepe") == ("pepe@nauta.com.cu", "newer")
+
+
+def test_store_default_user(store):
+    assert store.default_user() is None
+
+    store.add("pepe@nauta.com.cu", "pepepass")
+    store.add("juan@nauta.com.cu", "juanpass")
+    assert store.default_user() == "pepe@nauta.com.cu"
+
+    store.set_default_user("juan@nauta.com.cu")
+    store.set_default_user("juan@nauta.com.cu")
+    assert store.default_user() == "juan@nauta.com.cu"
+
+    assert store.remove("pepe@nauta.com.cu") == 1
+    assert store.users() == ["juan@nauta.com.cu"]
+
+
+def test_default_store_is_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(credentials, "USERS_DB", str(tmp_path / "users.db"))
+
+    store = CredentialStore.default()
+    assert CredentialStore.default() is store
+    assert store.connection is store.connection
+    store.close()
+
+
+def test_store_matches(store):
+    for user in ["pepe@nauta.com.cu", "Pepa@nauta.com.cu", "juan@nauta.com.cu", "pe@nauta.com.cu"]:
+        store.add(user, "x")
+
+    assert store.matches("ju") == ["juan@nauta.com.cu"]
+    assert store.matches("PEP") == ["Pepa@nauta.com.cu", "pepe@nauta.com.cu"]
+    assert store.matches("pe", limit=2) == ["pe@nauta.com.cu", "Pepa@nauta.com.cu"]
+    assert store.matches("x") == []
+
+    assert store.find("PEPE")[0] == "pepe@nauta.com.cu"
+    assert store.find("pe@nauta.com.cu")[0] == "pe@nauta.com.cu"
+    assert store.find("PE@NAUTA.COM.CU")[0] == "pe@nauta.com.cu"
+
+
+def test_store_find_uses_index(store):
+    statements = []
+    store.connection.set_trace_callback(statements.append)
+    store.find("pepe")
+
+    plan = store.connection.execute("EXPLAIN QUERY PLAN " + statements[-1]).fetchall()
+    assert "users_user_nocase" in plan[0][-1]
+
+
+def test_store_find_ambiguous(store):
+    store.add("pepe@nauta.com.cu", "pepepass")
+    store.add("pepa@nauta.com.cu", "pepapass")
+
+    with pytest.raises(NautaUserException):
+        store.find("pep")
+
+    store.remove("pepa@nauta.com.cu")
+    assert store.find("pep") == ("pepe@nauta.com.cu", "pepepass")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_store_import_export(store, fmt):
+    accounts = [("user{}@nauta.com.cu".format(i), "pass,{}\"".format(i)) for i in range(25)]
+    fp = io.StringIO()
+    write_accounts(fp, accounts, fmt)
+
+    fp.seek(0)
+    assert store.import_accounts(read_accounts(fp, fmt), batch_size=10) == 25
+    assert list(store.export_accounts()) == accounts
+    assert store.find("user7") == accounts[7]
+
+
+@pytest.mark.parametrize("data, fmt, line", [
+    ('{"user": "pepe@nauta.com.cu"}\n', "jsonl", 1),
+    ('{"user": "a@nauta.com.cu", "password": "a"}\n\n{"user": "pepe@nauta.com.cu", \n', "jsonl", 3),
+    ('["pepe@nauta.com.cu", "pepepass"]\n', "jsonl", 1),
+    ('user,password\na@nauta.com.cu,a\n,pepepass\n', "csv", 3),
+])
+def test_read_accounts_rejects_bad_rows(data, fmt, line):
+    with pytest.raises(NautaUserException, match="línea {}:".format(line)):
+        list(read_accounts(io.StringIO(data), fmt))
@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from nautapy import cli, credentials
+from nautapy.credentials import CredentialStore
+from nautapy.daemon import DaemonClient, DaemonUnavailable, serve
+from nautapy.exceptions import NautaException
+from nautapy.time_cache import RemainingTimeCache
+from test.test_cli import RUN_CLI
+
+USER = "user1@nauta.com.cu"
+
+
+@pytest.fixture()
+def home():
+    # UNIX socket paths are limited to ~100 characters, tmp_path may be longer
+    home = tempfile.mkdtemp(prefix="nauta")
+    yield home
+    shutil.rmtree(home, ignore_errors=True)
+
+
+@pytest.fixture()
+def daemon(mock_portal, monkeypatch, tmp_path, home):
+    monkeypatch.setattr(credentials, "USERS_DB", str(tmp_path / "users.db"))
+    # The daemon opens the shared store in its own thread
+    CredentialStore(credentials.USERS_DB).add(USER, "pass1")
+
+    # Where the CLI of test_cli_* looks for them
+    appdata = os.path.join(home, ".local", "share", "nautapy")
+    socket_path = os.path.join(appdata, "daemon.sock")
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=serve,
+        kwargs=dict(
+            socket_path=socket_path,
+            session_file=os.path.join(appdata, "nauta-session"),
+            ready=lambda server: ready.set()
+        ),
+        daemon=True
+    )
+    thread.start()
+    assert ready.wait(5)
+
+    client = DaemonClient(socket_path, timeout=10)
+    yield client
+
+    if os.path.exists(socket_path):
+        client.call("stop")
+    thread.join(5)
+
+
+def test_up_status_down(daemon, mock_portal):
+    result = daemon.call("up")
+    assert result["user"] == USER
+    assert result["remaining_time"] == "01:00:00"
+    assert result["deadline"] is None
+    assert mock_portal.online
+
+    status = daemon.call("status")
+    assert status["logged_in"] and status["user"] == USER
+    assert status["pid"] == os.getpid()
+
+    with pytest.raises(NautaException) as ex:
+        daemon.call("up")
+    assert "sessión abierta" in ex.value.args[0]
+
+    # Answered from the remaining time cache
+    assert daemon.call("remaining-time")["remaining_time"] in ("01:00:00", "00:59:59")
+    assert mock_portal.requests.count(("post", "/EtecsaQueryServlet")) == 1
+
+    assert daemon.call("down") == {"user": USER, "health": None}
+    assert not mock_portal.online
+    assert daemon.call("down") == {"user": None, "health": None}
+    assert not daemon.call("status")["logged_in"]
+
+
+def test_session_time(daemon, mock_portal):
+    result = daemon.call("up", session_time=0)
+    assert result["deadline"] == pytest.approx(result["login_time"])
+
+    for _ in range(50):
+        if not mock_portal.online:
+            break
+        time.sleep(0.1)
+    assert not mock_portal.online
+    assert not daemon.call("status")["logged_in"]
+    # Closed by the deadline, 'nauta up' still asks for the health report
+    assert daemon.call("down") == {"user": None, "health": None}
+
+
+def test_keepalive(daemon, mock_portal):
+    daemon.call("up", keepalive=0.05)
+    mock_portal.sessions.clear()
+
+    for _ in range(100):
+        health = daemon.call("status")["health"]
+        if health["reconnects"]:
+            break
+        time.sleep(0.02)
+    assert health["drops"] == 1 and health["reconnects"] == 1
+    assert mock_portal.online
+
+    result = daemon.call("down")
+    assert result["health"]["reconnects"] == 1
+    assert not mock_portal.online
+
+
+def test_auto(daemon, mock_portal):
+    CredentialStore(credentials.USERS_DB).add("user0@nauta.com.cu", "wrong")
+    RemainingTimeCache().update("user0@nauta.com.cu", 7200, active=False)
+
+    assert daemon.call("up", auto=True)["user"] == USER
+    assert daemon.call("down")["user"] == USER
+
+
+def test_errors(daemon):
+    with pytest.raises(NautaException) as ex:
+        daemon.call("up", user=USER + "x", password="wrong")
+    assert "Usuario o contraseña incorrectos" in ex.value.args[0]
+
+    with pytest.raises(NautaException) as ex:
+        daemon.call("reboot")
+    assert "Method not found" in ex.value.args[0]
+
+    with pytest.raises(NautaException) as ex:
+        daemon.call("down", force=True)
+    assert "Invalid params" in ex.value.args[0]
+
+
+def test_raw_json_rpc(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon.socket_path)
+        fp = sock.makefile("rb")
+
+        sock.sendall(b'not json\n{"jsonrpc": "2.0", "id": 7, "method": "status"}\n')
+        assert json.loads(fp.readline())["error"]["code"] == -32700
+        reply = json.loads(fp.readline())
+        assert reply["id"] == 7 and reply["result"]["logged_in"] is False
+
+
+def test_run_connected(daemon, mock_portal, tmp_path):
+    output = []
+    result = daemon.call(
+        "run-connected",
+        on_notification=lambda method, params: output.append(params["data"]),
+        cmd="pwd; echo $NAUTA_TEST",
+        cwd=str(tmp_path),
+        env={"NAUTA_TEST": "conectado", "PATH": os.environ.get("PATH", "")},
+    )
+
+    assert result == {"exit_code": 0}
+    assert "".join(output) == "{}\nconectado\n".format(tmp_path)
+    assert ("post", "/LoginServlet") in mock_portal.requests
+    assert not mock_portal.online
+
+
+def test_second_daemon_refused(daemon, mock_portal):
+    daemon.call("up", user=USER)
+
+    with pytest.raises(NautaException):
+        serve(socket_path=daemon.socket_path)
+
+    # The first one still owns the socket and the session
+    assert daemon.call("status")["user"] == USER
+    daemon.call("down")
+
+
+def test_unavailable(home):
+    with pytest.raises(DaemonUnavailable):
+        DaemonClient(os.path.join(home, "daemon.sock")).call("status")
+
+
+def run_cli(home, *args):
+    proc = subprocess.run(
+        [sys.executable, "-c", RUN_CLI] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env={"HOME": home, "PATH": ""},
+        timeout=30,
+        check=True
+    )
+    return proc.stdout, set(proc.stderr.split())
+
+
+def test_cli_uses_daemon(daemon, mock_portal, home):
+    daemon.call("up")
+
+    stdout, modules = run_cli(home, "info")
+    assert "Usuario Nauta: {}".format(USER) in stdout
+    assert "Tiempo restante: " in stdout
+    assert "requests" not in modules and "sqlite3" not in modules
+
+    stdout, modules = run_cli(home, "down")
+    assert "Sesión cerrada con éxito" in stdout
+    assert "requests" not in modules
+    assert not mock_portal.online
+
+
+def test_cli_timed_up(daemon, mock_portal, home):
+    # Closed by the daemon 1s after login, just before the account runs out
+    mock_portal.remaining_time = "00:00:06"
+
+    stdout, modules = run_cli(home, "up", "--time-unit", "120")
+    assert "La sesión se cerrará en 00:00:01" in stdout
+    assert "Sesión cerrada con éxito." in stdout
+    assert "requests" not in modules
+    assert not mock_portal.online
+
+
+def test_cli_up_daemon_lost(mock_portal, monkeypatch, capsys):
+    class LostDaemon(object):
+        calls = []
+
+        def call(self, method, **params):
+            self.calls.append(method)
+            if method != "up":
+                raise DaemonUnavailable("daemon.sock")
+            return {"user": USER, "time_saved": {}, "remaining_time": "01:00:00", "login_time": time.time(),
+                    "deadline": None}
+
+    monkeypatch.setattr(cli, "_daemon", lambda args: LostDaemon())
+    monkeypatch.setattr(cli, "_show_session", lambda login_time, session_time: None)
+    monkeypatch.setattr(sys, "argv", ["nauta", "up"])
+    cli.main()
+
+    assert LostDaemon.calls == ["up", "down"]
+    # Not logged in again in this process
+    assert not mock_portal.requests
+    assert "nauta down" in capsys.readouterr().err
@@ -0,0 +1,94 @@
+import os
+
+import bs4
+import pytest
+
+from nautapy import forms
+from nautapy.nauta_api import NautaProtocol
+from nautapy.mock_portal import CREDIT_TEMPLATE, LOGIN_ERROR_TEMPLATE
+
+_assets_dir = os.path.join(
+    os.path.dirname(__file__),
+    "assets"
+)
+
+
+def read_asset(asset_name):
+    with open(os.path.join(_assets_dir, asset_name)) as fp:
+        return fp.read()
+
+
+LANDING_HTML = read_asset("landing.html")
+LOGIN_HTML = read_asset("login_page.html")
+LOGGED_IN_HTML = read_asset("logged_in.html")
+
+
+def test_extract_form_landing_matches_bs4():
+    soup = bs4.BeautifulSoup(LANDING_HTML, "html.parser")
+    form = forms.extract_form(LANDING_HTML)
+
+    assert form.action == "https://secure.etecsa.net:8443"
+    assert form.inputs == NautaProtocol._get_inputs(soup)
+
+
+def test_extract_form_by_id_matches_bs4():
+    form_soup = bs4.BeautifulSoup(LOGIN_HTML, "html.parser").find("form", id="formulario")
+    form = forms.extract_form(LOGIN_HTML, form_id="formulario")
+
+    assert form.action == form_soup["action"]
+    assert form.inputs == NautaProtocol._get_inputs(form_soup)
+
+
+def test_extract_form_stops_when_names_are_found():
+    extractor = forms.FormExtractor(form_id="formulario", names=("wlanuserip",))
+    extractor.feed(LOGIN_HTML)
+
+    assert extractor.done
+    assert list(extractor.inputs) == ["wlanuserip"]
+    assert extractor.form.inputs["wlanuserip"] == "10.190.20.96"
+
+
+def test_extract_form_from_chunks():
+    chunks = [LOGIN_HTML[i:i + 100] for i in range(0, len(LOGIN_HTML), 100)]
+    form = forms.extract_form(chunks, form_id="formulario", names=("CSRFHW", "wlanuserip"))
+
+    assert form.inputs["CSRFHW"] == "1fe3ee0634195096337177a0994723fb"
+
+
+@pytest.mark.parametrize("html, form_id, names", [
+    (LOGGED_IN_HTML, "formulario", None),
+    (LOGIN_HTML, "formulario", ("CSRFHW", "missing")),
+])
+def test_extract_form_not_found(html, form_id, names):
+    assert forms.extract_form(html, form_id=form_id, names=names) is None
+
+
+def test_extract_cell():
+    html = CREDIT_TEMPLATE.format(credit="1.12 CUC")
+    assert forms.extract_cell(html, "sessioninfo", row=2, col=2) == "1.12 CUC"
+    assert forms.extract_cell(LOGIN_HTML, "sessioninfo", row=2, col=2) is None
+
+
+def test_extract_alert():
+    assert forms.extract_alert(LOGIN_ERROR_TEMPLATE.format(reason="No tiene saldo")) == "No tiene saldo"
+    assert forms.extract_alert(LANDING_HTML) is None
+
+
+@pytest.mark.parametrize("row", [
+    "<tr><th>Saldo</th><td>1.12 CUC</td></tr>",
+    "<tr><td><b>Saldo</b><br>disponible</td><td>1.12 <i>CUC</i></td></tr>",
+    "<tr><td>Saldo<table><tr><td>a</td><td>b</td></tr></table></td><td>1.12 CUC</td></tr>",
+    "<tr><th>Saldo</th><th>1.12 CUC</th></tr>",
+])
+def test_extract_cell_matches_selector(row):
+    html = '<table id="sessioninfo"><tbody><tr><td>Usuario</td></tr>{}</tbody></table>'.format(row)
+    cell = bs4.BeautifulSoup(html, "html.parser").select_one("#sessioninfo tr:nth-child(2) > td:nth-child(2)")
+    assert forms.extract_cell(html, "sessioninfo", row=2, col=2) == (cell and cell.get_text().strip())
+
+
+def test_alert_fallback():
+    # The regex takes the commented out script as the last one
+    html = LOGIN_ERROR_TEMPLATE.format(reason="No tiene saldo") + '<!-- <script src="old.js"></script> -->'
+    assert forms.extract_alert(html) is None
+    assert NautaProtocol._get_alert(html) == "No tiene saldo"
+    assert NautaProtocol._get_alert(LANDING_HTML) is None
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from nautapy.exceptions import NautaLogoutException
+from nautapy.hedging import Hedger, LatencyHistogram
+from nautapy.nauta_api import NautaClient, NautaProtocol
+
+
+class Endpoint(object):
+    """Answers with the next of ``delays``, the calls after the last one take ``delays[-1]``"""
+    def __init__(self, *delays, results=None):
+        self.delays = list(delays)
+        self.results = list(results or [])
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, value=None):
+        with self.lock:
+            index = self.calls
+            self.calls += 1
+
+        delay = self.delays[min(index, len(self.delays) - 1)]
+        if isinstance(delay, Exception):
+            raise delay
+        time.sleep(delay)
+        return self.results[index] if index < len(self.results) else index
+
+
+def test_histogram_rolling_percentiles():
+    histogram = LatencyHistogram(window=100)
+    for latency in range(1, 201):
+        histogram.add(latency / 1000)
+
+    assert len(histogram) == 100
+    # Only the last 100 samples, 0.101s to 0.200s
+    assert histogram.percentile(0) == 0.101
+    assert histogram.percentile(50) == 0.151
+    assert histogram.percentile(100) == 0.2
+
+
+def test_learns_delay_per_endpoint():
+    hedger = Hedger(percentile=90, min_samples=5, default_delay=1)
+    assert hedger.delay("logout") == 1
+
+    for _ in range(10):
+        hedger.call("logout", Endpoint(0.01))
+    assert 0.01 <= hedger.delay("logout") < 0.1
+    assert hedger.delay("get_user_time") == 1
+    assert hedger.stats["logout"].hedged == 0
+
+
+def test_slow_request_is_hedged():
+    hedger = Hedger(default_delay=0.05)
+    endpoint = Endpoint(5, 0.01)
+
+    start = time.monotonic()
+    assert hedger.call("logout", endpoint) == 1
+    assert time.monotonic() - start < 1
+
+    stats = hedger.stats["logout"].as_dict()
+    assert stats == {"calls": 1, "hedged": 1, "hedge_wins": 1}
+
+
+def test_first_response_wins():
+    hedger = Hedger(default_delay=0.05)
+    assert hedger.call("logout", Endpoint(0.1, 5)) == 0
+    assert hedger.stats["logout"].hedge_wins == 0
+
+
+def test_fast_error_is_not_hedged():
+    hedger = Hedger(default_delay=5)
+    endpoint = Endpoint(ValueError("boom"))
+    with pytest.raises(ValueError):
+        hedger.call("logout", endpoint)
+    assert endpoint.calls == 1
+
+
+def test_rejected_result_waits_for_the_other():
+    hedger = Hedger(default_delay=0.05)
+    endpoint = Endpoint(0.3, 0.01, results=["SUCCESS", "FAILURE"])
+    assert hedger.call("logout", endpoint, accept=lambda r: r == "SUCCESS") == "SUCCESS"
+
+    # Nothing better arrives, the rejected result is returned
+    endpoint = Endpoint(0.1, 0.01, results=["FAILURE", "FAILURE"])
+    assert hedger.call("logout", endpoint, accept=lambda r: r == "SUCCESS") == "FAILURE"
+
+
+def test_latencies_are_saved(tmp_path):
+    path = str(tmp_path / "latency")
+    hedger = Hedger(path=path)
+    hedger.record("logout", 0.2)
+    hedger.save()
+
+    assert Hedger(path=path).histograms["logout"].samples() == [0.2]
+
+
+def test_protocol_hedges_stuck_logout(mock_portal, monkeypatch, tmp_path):
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+
+    request = requests.Session.request
+    stuck = threading.Event()
+
+    def stuck_request(self, method, url, *args, **kwargs):
+        if "LogoutServlet" in url and not stuck.is_set():
+            stuck.set()
+            time.sleep(3)
+            raise requests.ReadTimeout()
+        return request(self, method, url, *args, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "request", stuck_request)
+    monkeypatch.setattr(NautaProtocol, "hedging", True)
+    monkeypatch.setattr(NautaProtocol, "hedger", Hedger(default_delay=0.1))
+
+    start = time.monotonic()
+    client.logout()
+    assert time.monotonic() - start < 2
+    assert not mock_portal.online
+    assert NautaProtocol.hedger.stats["logout"].hedge_wins == 1
+
+
+def test_protocol_does_not_hedge_login(mock_portal, monkeypatch):
+    monkeypatch.setattr(NautaProtocol, "hedging", True)
+    monkeypatch.setattr(NautaProtocol, "hedger", Hedger(default_delay=0))
+
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+    assert mock_portal.requests.count(("post", "/LoginServlet")) == 1
+
+    with pytest.raises(NautaLogoutException):
+        # Hedging a logout the portal rejects still reports the failure
+        client.session.attribute_uuid = "WRONG"
+        client.logout()
@@ -0,0 +1,128 @@
+import json
+import logging
+import urllib.request
+
+import pytest
+import requests
+from requests.exceptions import ConnectionError
+
+from nautapy.instrument import JsonSink, LogSink, PrometheusSink, Tracer
+from nautapy.nauta_api import NautaClient, NautaProtocol
+
+
+@pytest.fixture()
+def tracer(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(NautaProtocol, "tracer", tracer)
+    return tracer
+
+
+def test_login_phases(mock_portal, tracer):
+    client = NautaClient("user1@nauta.com.cu", "pass1", fast_login=False)
+    client.login()
+    client.logout()
+
+    summary = tracer.summary()
+    assert list(summary) == [
+        "client.login", "probe", "landing", "landing.parse", "form", "form.parse",
+        "login", "online.do", "save", "client.logout", "logout",
+    ]
+    assert summary["client.login"]["depth"] == 0
+    assert summary["landing"]["depth"] == 1
+
+    for phase in ["landing", "form", "login", "logout"]:
+        assert summary[phase]["bytes_sent"] > 0
+        assert summary[phase]["bytes_received"] > 0
+    # Probes don't go through the tracked session, their bytes are unknown
+    assert summary["probe"]["bytes_sent"] is None and summary["client.login"]["bytes_received"] is None
+    # The login POST follows the redirect to online.do
+    assert summary["login"]["bytes_received"] > summary["logout"]["bytes_received"]
+
+    login = next(span for span in tracer.spans if span.name == "client.login")
+    assert login.attrs == {"fast_login": False}
+    assert login.duration >= sum(summary[phase]["duration"] for phase in ["landing", "form", "login"])
+
+
+def test_retries_and_errors(mock_portal, tracer, monkeypatch):
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+
+    request = requests.Session.request
+    failures = [ConnectionError("Connection reset by peer")]
+
+    def flaky_request(self, *args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return request(self, *args, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "request", flaky_request)
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "base_delay", 0.01)
+
+    assert client.remaining_time
+    assert tracer.summary()["get_user_time"]["retries"] == 1
+
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "retries", 0)
+    failures.append(ConnectionError("Connection reset by peer"))
+    with pytest.raises(ConnectionError):
+        client.get_remaining_time(refresh=True)
+    assert tracer.summary()["get_user_time"]["errors"] == 1
+
+
+def test_spans_bounded():
+    tracer = Tracer(max_spans=10)
+    for i in range(25):
+        with tracer.span("landing") as span:
+            span.track(lambda: None)
+
+    assert len(tracer.spans) == 10
+    # The totals still count every span
+    assert tracer.summary()["landing"]["count"] == 25
+    assert tracer.summary()["landing"]["bytes_sent"] == 0
+
+
+def test_json_sink(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+    tracer = Tracer([JsonSink(path)])
+    with tracer.span("landing") as span:
+        span.bytes_sent = 10
+    with tracer.span("login", user="pepe"):
+        pass
+    tracer.close()
+
+    with open(path) as fp:
+        spans = [json.loads(line) for line in fp]
+    assert [span["name"] for span in spans] == ["landing", "login"]
+    assert spans[0]["bytes_sent"] == 10
+    assert spans[1]["user"] == "pepe"
+
+
+def test_log_sink(caplog):
+    tracer = Tracer([LogSink()])
+    with caplog.at_level(logging.INFO, logger="nautapy.instrument"):
+        with pytest.raises(ValueError):
+            with tracer.span("form"):
+                raise ValueError()
+
+    assert "form" in caplog.text
+    assert "error=ValueError" in caplog.text
+
+
+def test_prometheus_sink():
+    sink = PrometheusSink(0)
+    tracer = Tracer([sink])
+    try:
+        for _ in range(2):
+            with tracer.span("login") as span:
+                span.attempts = 3
+                span.bytes_received = 100
+
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(sink.port)) as response:
+            text = response.read().decode("utf-8")
+    finally:
+        tracer.close()
+
+    assert '# TYPE nauta_phase_seconds summary' in text
+    assert 'nauta_phase_seconds_count{phase="login"} 2' in text
+    assert 'nauta_phase_bytes_received_total{phase="login"} 200' in text
+    assert 'nauta_phase_retries_total{phase="login"} 4' in text
+    assert 'nauta_phase_bytes_sent_total{phase="login"}' not in text
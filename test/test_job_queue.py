@@ -0,0 +1,148 @@
+import io
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+from nautapy import job_queue
+from nautapy.exceptions import NautaLoginException
+from nautapy.job_queue import JobQueue, QueueRunner, PENDING, RUNNING, DONE, FAILED
+
+
+class FakeClient(object):
+    user = "pepe@nauta.com.cu"
+    remaining_time = "01:00:00"
+
+    def __init__(self, fail_login=False):
+        self.fail_login = fail_login
+        self.logged_in = False
+        self.logins = 0
+        self.logouts = 0
+
+    @property
+    def is_logged_in(self):
+        return self.logged_in
+
+    def login(self):
+        if self.fail_login:
+            raise NautaLoginException("Falló el inicio de sesión")
+        self.logins += 1
+        self.logged_in = True
+
+    def logout(self):
+        self.logouts += 1
+        self.logged_in = False
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+def test_queue_claims_in_order(queue):
+    ids = [queue.enqueue("echo {}".format(i)) for i in range(3)]
+
+    first, second = queue.claim(2)
+    assert [first.id, second.id] == ids[:2]
+    assert first.state == RUNNING
+    assert queue.pending() == 1
+
+    queue.finish(first.id, 0)
+    queue.finish(second.id, 2)
+    assert [job.state for job in queue.jobs()] == [DONE, FAILED, PENDING]
+
+    assert queue.clear() == 2
+    assert [job.id for job in queue.jobs()] == ids[2:]
+
+
+def dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_queue_requeues_orphaned_jobs(queue):
+    queue.enqueue("true")
+    job, = queue.claim()
+    assert job.owner == os.getpid()
+    queue._conn.execute("UPDATE jobs SET owner=?", (dead_pid(),))
+
+    assert queue.requeue_running() == 1
+    assert queue.pending() == 1
+
+
+def test_queue_keeps_jobs_of_live_runner(queue):
+    queue.enqueue("sleep 1")
+    queue.enqueue("true")
+    queue.claim()
+
+    assert queue.requeue_running() == 0
+    assert queue.pending() == 1
+    assert [job.state for job in queue.jobs()] == [RUNNING, PENDING]
+
+
+def test_queue_schema_created_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    queue.enqueue("true")
+    queue.close()
+
+    def fail(conn):
+        raise AssertionError("schema migrated again")
+
+    monkeypatch.setattr(job_queue, "MIGRATIONS", [fail])
+    queue = JobQueue(path)
+    assert queue.pending() == 1
+    queue.close()
+
+
+def test_runner_runs_all_jobs_in_one_session(queue, tmp_path):
+    for i in range(6):
+        queue.enqueue("echo job{}".format(i))
+    queue.enqueue("exit 3")
+    queue.enqueue("pwd", cwd=str(tmp_path))
+
+    client = FakeClient()
+    output = io.StringIO()
+    stats = QueueRunner(queue, client, jobs=3, output=output, poll_interval=0.01).run()
+
+    assert client.logins == client.logouts == 1
+    assert stats.done == 7 and stats.failed == 1
+    assert queue.pending() == 0
+
+    lines = output.getvalue().splitlines()
+    for i in range(6):
+        assert any(line.endswith("job{}".format(i)) for line in lines)
+    assert any(line.endswith(str(tmp_path)) for line in lines)
+
+    assert {job.cmd: job.exit_code for job in queue.jobs()}["exit 3"] == 3
+
+
+def test_runner_reuses_session_within_time_unit(queue):
+    queue.enqueue("echo first")
+    client = FakeClient()
+    runner = QueueRunner(queue, client, time_unit=0.6, logout_margin=0.1, output=io.StringIO(), poll_interval=0.01)
+
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+
+    time.sleep(0.2)
+    queue.enqueue("echo second")
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert runner.stats.done == 2
+    assert client.logins == client.logouts == 1
+
+
+def test_runner_login_failure_keeps_jobs(queue):
+    queue.enqueue("echo never")
+
+    with pytest.raises(NautaLoginException):
+        QueueRunner(queue, FakeClient(fail_login=True), output=io.StringIO()).run()
+
+    assert queue.pending() == 1
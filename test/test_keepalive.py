@@ -0,0 +1,144 @@
+import os
+import time
+
+import pytest
+
+from nautapy import nauta_api
+from nautapy.keepalive import SessionMonitor
+from nautapy.nauta_api import NautaClient, NautaProtocol, SessionObject
+
+USER = "user1@nauta.com.cu"
+PASSWORD = "pass1"
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def client(mock_portal, monkeypatch):
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "base_delay", 0.01)
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "max_delay", 0.01)
+
+    client = NautaClient(USER, PASSWORD)
+    client.login()
+    yield client
+    if client.session and mock_portal.online:
+        client.logout()
+
+
+def test_alive(client, mock_portal):
+    monitor = SessionMonitor(client, interval=30)
+
+    assert monitor.step() == 30
+    assert monitor.stats.as_dict() == {
+        "checks": 1, "drops": 0, "reconnects": 0, "failed_reconnects": 0, "downtime": 0.0, "down": False,
+    }
+    assert ("post", "/EtecsaQueryServlet") not in mock_portal.requests
+
+
+def test_dropped_session_reconnects(client, mock_portal):
+    clock = FakeClock()
+    monitor = SessionMonitor(client, interval=30, clock=clock)
+    old_uuid = client.session.attribute_uuid
+
+    mock_portal.sessions.clear()
+    del mock_portal.requests[:]
+    assert monitor.step() == 30
+
+    assert mock_portal.online
+    assert client.session.attribute_uuid == mock_portal.sessions[USER] != old_uuid
+    # Fast login, straight to the login form of the last session
+    assert ("get", "/") not in mock_portal.requests
+    assert client.time_saved
+    # The session file was replaced, not removed
+    assert os.path.exists(nauta_api.NAUTA_SESSION_FILE)
+
+    stats = monitor.stats.as_dict()
+    assert stats["drops"] == 1 and stats["reconnects"] == 1 and not stats["down"]
+
+
+def test_failed_reconnect_keeps_session_file(client, mock_portal):
+    monitor = SessionMonitor(client, interval=30)
+    old_uuid = client.session.attribute_uuid
+
+    mock_portal.sessions.clear()
+    mock_portal.csrf_tokens.clear()
+    mock_portal.accounts[USER] = "changed"
+    monitor.step()
+    assert monitor.stats.failed_reconnects == 1
+    # The cached form expired, the full handshake was tried too
+    assert ("get", "/") in mock_portal.requests
+
+    # Another process still finds the session it has to close
+    session = SessionObject.load()
+    assert (session.username, session.attribute_uuid) == (USER, old_uuid)
+    assert client.session.attribute_uuid == old_uuid
+
+
+def test_upstream_outage_is_not_a_drop(client, mock_portal, monkeypatch):
+    monkeypatch.setattr(NautaProtocol, "is_connected", classmethod(lambda cls, **kwargs: False))
+    monitor = SessionMonitor(client, interval=30)
+
+    assert monitor.step() == 30
+    assert monitor.stats.drops == 0
+    assert mock_portal.requests.count(("post", "/LoginServlet")) == 1
+
+
+def test_failed_reconnects_back_off(client, mock_portal):
+    clock = FakeClock()
+    monitor = SessionMonitor(client, interval=30, retry_delay=5, max_retry_delay=15, clock=clock)
+
+    mock_portal.sessions.clear()
+    mock_portal.accounts[USER] = "changed"
+    delays = []
+    for _ in range(4):
+        delays.append(monitor.step())
+        clock.now += delays[-1]
+    assert delays == [5, 10, 15, 15]
+
+    stats = monitor.stats.as_dict()
+    assert stats["drops"] == 1 and stats["failed_reconnects"] == 4
+    assert stats["down"] and stats["downtime"] == 45
+
+    mock_portal.accounts[USER] = PASSWORD
+    assert monitor.step() == 30
+    assert monitor.stats.as_dict()["downtime"] == 45
+    assert mock_portal.online
+
+
+def test_unreachable_portal(client, mock_portal, monkeypatch):
+    monkeypatch.setattr(NautaProtocol, "is_connected", classmethod(lambda cls, **kwargs: False))
+    monitor = SessionMonitor(client, interval=30, retry_delay=5)
+
+    mock_portal.drop_rate = 1
+    assert monitor.step() == 5
+    assert monitor.stats.drops == 0 and monitor.stats.down_since is not None
+
+    mock_portal.drop_rate = 0
+    assert monitor.step() == 30
+    assert monitor.stats.down_since is None
+
+
+def test_stops_when_closed(client):
+    monitor = SessionMonitor(client, interval=30)
+    client.logout()
+
+    assert monitor.step() is None
+    assert monitor.stats.checks == 0
+
+
+def test_background_thread(client, mock_portal):
+    with SessionMonitor(client, interval=0.05) as monitor:
+        mock_portal.sessions.clear()
+        for _ in range(100):
+            if monitor.stats.reconnects:
+                break
+            time.sleep(0.02)
+
+    assert monitor.stats.reconnects == 1
+    assert mock_portal.online
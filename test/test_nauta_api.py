@@ -1,57 +1,108 @@
-import os
+import time
 
 import pytest
-import requests
-from requests_mock import Mocker as RequestMocker, ANY
+from requests.exceptions import ConnectionError
 
-from nautapy.exceptions import NautaLoginException, NautaPreLoginException
-from nautapy.nauta_api import CHECK_PAGE, NautaProtocol
+from nautapy.exceptions import NautaLoginException, NautaLogoutException, NautaPreLoginException
+from nautapy.nauta_api import NautaProtocol, SessionObject
 
+USER = "user1@nauta.com.cu"
+PASSWORD = "pass1"
 
-_assets_dir = os.path.join(
-    os.path.dirname(__file__),
-    "assets"
-)
 
+@pytest.fixture()
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "base_delay", 0.01)
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "max_delay", 0.01)
 
-def read_asset(asset_name):
-    with open(os.path.join(_assets_dir, asset_name)) as fp:
-        return fp.read()
 
+def test_nauta_protocol_creates_valid_session(mock_portal):
+    session = NautaProtocol.create_session()
 
-LANDING_HTML = read_asset("landing.html")
-LOGIN_HTML = read_asset("login_page.html")
-LOGGED_IN_HTML = read_asset("logged_in.html")
+    assert isinstance(session, SessionObject)
+    assert session.login_action == mock_portal.url + "//LoginServlet"
+    assert session.csrfhw in mock_portal.csrf_tokens
+    assert session.wlanuserip == mock_portal.wlanuserip
+    assert mock_portal.requests == [("get", "/check"), ("get", "/"), ("post", "/")]
 
 
-def test_nauta_protocol_creates_valid_session():
-    with RequestMocker() as mock:
-        # Setup
-        mget = mock.get(ANY, status_code=200, text=LANDING_HTML)
-        mpost = mock.post(ANY, status_code=200, text=LOGIN_HTML)
+def test_nauta_protocol_create_session_raises_when_connected(mock_portal):
+    mock_portal.sessions["user0@nauta.com.cu"] = "UUID"
 
-        # Test
-        session, login_action, data = NautaProtocol.create_session()
+    with pytest.raises(NautaPreLoginException):
+        NautaProtocol.create_session()
 
-        assert mget.called and mpost.called
-        assert isinstance(session, requests.Session)
-        assert login_action and data and data["CSRFHW"] and data["wlanuserip"]
+    assert ("post", "/") not in mock_portal.requests
 
 
-def test_nauta_protocol_create_session_raises_when_connected():
-    with RequestMocker() as mock:
-        # Setup
-        mget = mock.get(ANY, status_code=200, text="FOFOFOOFOFOFOFO")
-        mpost = mock.post(ANY, status_code=200, text=LOGIN_HTML)
+def test_nauta_protocol_login_ok(mock_portal):
+    session = NautaProtocol.create_session()
+    attribute_uuid = NautaProtocol.login(session, USER, PASSWORD)
 
-        with pytest.raises(NautaPreLoginException):
-            NautaProtocol.create_session()
+    assert attribute_uuid and attribute_uuid == mock_portal.sessions[USER]
 
-        assert mget.called and not mpost.called
 
+def test_nauta_protocol_login_wrong_password(mock_portal):
+    session = NautaProtocol.create_session()
 
-def test_nauta_protocol_login_ok():
-    with RequestMocker() as mock:
-        mpost = mock.post(ANY, status_code=200, text=LOGGED_IN_HTML, url="http://secure.etecsa.net:8443/online.do?fooo")
-        NautaProtocol.login(requests.Session(), "http://test.com/some_action", {}, "pepe@nauta.com.cu", "somepass")
+    with pytest.raises(NautaLoginException) as ex:
+        NautaProtocol.login(session, USER, "wrong")
 
+    assert "Usuario o contraseña incorrectos" in ex.value.args[0]
+    assert not mock_portal.online
+
+
+def test_nauta_protocol_logout(mock_portal):
+    session = NautaProtocol.create_session()
+    session.attribute_uuid = NautaProtocol.login(session, USER, PASSWORD)
+
+    NautaProtocol.logout(session, USER)
+    assert not mock_portal.online
+
+    with pytest.raises(NautaLogoutException):
+        NautaProtocol.logout(session, USER)
+
+
+def test_nauta_protocol_queries(mock_portal):
+    session = NautaProtocol.create_session()
+    assert NautaProtocol.get_user_credit(session, USER, PASSWORD) == mock_portal.credit
+
+    session.attribute_uuid = NautaProtocol.login(session, USER, PASSWORD)
+    assert NautaProtocol.get_user_time(session, USER) == mock_portal.remaining_time
+
+
+def test_portal_errors(mock_portal):
+    mock_portal.error_rate = 1
+    mock_portal.fault_paths = {"/"}
+
+    with pytest.raises(NautaPreLoginException):
+        NautaProtocol.create_session()
+
+
+def test_dropped_connections_are_retried(mock_portal, fast_retries):
+    session = NautaProtocol.create_session()
+    session.attribute_uuid = NautaProtocol.login(session, USER, PASSWORD)
+
+    mock_portal.drop_rate = 1
+    mock_portal.fault_paths = {"/LogoutServlet"}
+    with pytest.raises(ConnectionError):
+        NautaProtocol.logout(session, USER)
+
+    assert mock_portal.faults == NautaProtocol.get_retry_policy().operations["logout"]["retries"] + 1
+    assert mock_portal.online
+
+    mock_portal.drop_rate = 0
+    NautaProtocol.logout(session, USER)
+    assert not mock_portal.online
+
+
+def test_latency_per_path(mock_portal):
+    mock_portal.latency = {"/LoginServlet": 0.3}
+
+    start = time.perf_counter()
+    session = NautaProtocol.create_session()
+    assert time.perf_counter() - start < 0.3
+
+    start = time.perf_counter()
+    NautaProtocol.login(session, USER, PASSWORD)
+    assert time.perf_counter() - start >= 0.3
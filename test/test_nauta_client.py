@@ -0,0 +1,70 @@
+import pytest
+
+from nautapy.exceptions import NautaLoginException
+from nautapy.nauta_api import NautaClient, LoginCache
+
+
+USER = "user0@nauta.com.cu"
+PASSWORD = "pass0"
+
+
+def login_logout(client):
+    with client.login():
+        pass
+
+
+def test_nauta_client_full_login_fills_cache(mock_portal):
+    login_logout(NautaClient(USER, PASSWORD))
+
+    cache = LoginCache.load()
+    assert cache.login_action.endswith("LoginServlet")
+    assert cache.csrfhw in mock_portal.csrf_tokens
+    assert set(cache.phases) == {"probe", "landing", "form"}
+    assert not mock_portal.sessions
+
+
+def test_nauta_client_fast_login_skips_handshake(mock_portal):
+    login_logout(NautaClient(USER, PASSWORD))
+    mock_portal.requests.clear()
+
+    client = NautaClient(USER, PASSWORD)
+    login_logout(client)
+
+    assert ("get", "/check") not in mock_portal.requests
+    assert ("get", "/") not in mock_portal.requests
+    assert mock_portal.requests[0] == ("post", "/LoginServlet")
+    assert set(client.time_saved) == {"probe", "landing", "form"}
+    assert LoginCache.load().hits == 1
+
+
+def test_nauta_client_fast_login_falls_back_when_rejected(mock_portal):
+    login_logout(NautaClient(USER, PASSWORD))
+    mock_portal.csrf_tokens.clear()
+    mock_portal.requests.clear()
+
+    client = NautaClient(USER, PASSWORD)
+    with client.login():
+        assert USER in mock_portal.sessions
+
+    assert ("get", "/") in mock_portal.requests
+    assert client.time_saved == {}
+    assert LoginCache.load().csrfhw in mock_portal.csrf_tokens
+
+
+def test_nauta_client_fast_login_wrong_password_sent_once(mock_portal):
+    login_logout(NautaClient(USER, PASSWORD))
+    mock_portal.requests.clear()
+
+    with pytest.raises(NautaLoginException, match="incorrectos"):
+        NautaClient(USER, "wrong").login()
+
+    assert mock_portal.requests == [("post", "/LoginServlet")]
+
+
+def test_nauta_client_fast_login_disabled(mock_portal):
+    login_logout(NautaClient(USER, PASSWORD))
+    mock_portal.requests.clear()
+
+    login_logout(NautaClient(USER, PASSWORD, fast_login=False))
+
+    assert mock_portal.requests[0] == ("get", "/check")
@@ -0,0 +1,76 @@
+from nautapy.nauta_api import NautaProtocol
+from nautapy.probe import ProbeEngine, ContentProbe, StatusProbe
+from nautapy.mock_portal import MockPortal, OFFLINE_CHECK_PAGE
+
+
+def test_content_probe_detects_portal(mock_portal):
+    probe = ContentProbe(mock_portal.check_url)
+
+    assert probe.run().connected is False
+
+    mock_portal.sessions["user0@nauta.com.cu"] = "UUID"
+    assert probe.run().connected is True
+
+
+def test_content_probe_reads_at_most_max_bytes(mock_portal):
+    full = ContentProbe(mock_portal.check_url).run()
+    probe = ContentProbe(mock_portal.check_url, max_bytes=10)
+
+    result = probe.run()
+
+    # The portal domain is past the first 10 bytes
+    assert result.connected is True
+    assert full.bytes - result.bytes == len(OFFLINE_CHECK_PAGE) - 10
+    assert probe.stats.bytes == result.bytes
+
+
+def test_status_probe(mock_portal):
+    probe = StatusProbe(mock_portal.generate_204_url)
+
+    assert probe.run().connected is False
+
+    mock_portal.sessions["user0@nauta.com.cu"] = "UUID"
+    assert probe.run().connected is True
+    assert probe.stats.count == 2
+
+
+def test_probe_engine_first_answer_wins(mock_portal):
+    with MockPortal(latency=1) as slow_portal:
+        engine = ProbeEngine([
+            ContentProbe(slow_portal.check_url),
+            StatusProbe(mock_portal.generate_204_url),
+        ])
+
+        result = engine.probe()
+
+    assert result.url == mock_portal.generate_204_url
+    assert result.latency < 1
+
+
+def test_probe_engine_caches_result(mock_portal):
+    engine = ProbeEngine([ContentProbe(mock_portal.check_url)], ttl=60)
+
+    assert engine.is_connected() is False
+    mock_portal.sessions["user0@nauta.com.cu"] = "UUID"
+    assert engine.is_connected() is False
+    assert engine.is_connected(use_cache=False) is True
+
+    assert engine.stats["checks"] == 2
+    assert engine.stats["cache_hits"] == 1
+
+
+def test_probe_engine_not_connected_when_no_probe_answers():
+    engine = ProbeEngine([ContentProbe("http://127.0.0.1:9/")])
+
+    assert engine.is_connected(timeout=1) is False
+    assert engine.stats["probes"]["http://127.0.0.1:9/"]["errors"] == 1
+
+
+def test_login_invalidates_probe_cache(mock_portal):
+    NautaProtocol.probe_engine.ttl = 60
+    session = NautaProtocol.create_session()
+    assert NautaProtocol.is_connected() is False
+
+    NautaProtocol.login(session, "user0@nauta.com.cu", "pass0")
+
+    assert NautaProtocol.is_connected() is True
@@ -14,9 +14,9 @@ Description:
     The goal of these tests are to ensure that comunication
     with Nauta Captive Portal is not broken, maybe after an update.
 
-    These tests must must not be run with the rest of the tests.
-    Methods from :class:`NautaProtocol` must be mocked in all the
-    other tests
+    These tests must must not be run with the rest of the tests,
+    they are skipped when the credentials are not set. All the
+    other tests run against :class:`nautapy.mock_portal.MockPortal`
 """
 
 import os
@@ -26,59 +26,47 @@ import pytest
 from nautapy.nauta_api import NautaProtocol
 
 
-def save_csrfhw(csrfhw):
-    temp_dir = "temp"
-    os.makedirs(temp_dir)
-    with open(os.path.join("temp", "CSRFHW"), "w") as fp:
-        fp.write(csrfhw)
-
-
-def get_env_or_raise(env_var_name):
+def get_env_or_skip(env_var_name):
     env_var_val = os.getenv(env_var_name)
     if not env_var_val:
-        raise Exception("{} is not defined in the environment".format(env_var_name))
+        pytest.skip("{} is not defined in the environment".format(env_var_name))
     return env_var_val
 
 
 @pytest.fixture()
 def username():
-    return get_env_or_raise("TEST_NAUTA_USERNAME")
+    return get_env_or_skip("TEST_NAUTA_USERNAME")
 
 
 @pytest.fixture()
 def password():
-    return get_env_or_raise("TEST_NAUTA_PASSWORD")
+    return get_env_or_skip("TEST_NAUTA_PASSWORD")
 
 
 def test_nauta_protocol_logs_in(username, password):
-    session, login_action, data = NautaProtocol.create_session()
-    assert data and data["CSRFHW"]
+    session = NautaProtocol.create_session()
+    assert session.csrfhw
 
     warnings.warn(
         "In case something went wrong, "
         "disconnect with this CSRFHW={}".format(
-            data["CSRFHW"]
+            session.csrfhw
         )
     )
 
-    attribute_uuid = None
     try:
-        attribute_uuid = NautaProtocol.login(
+        session.attribute_uuid = NautaProtocol.login(
             session=session,
-            login_action=login_action,
-            data=data,
             username=username,
-            password="AnaD!az56"
+            password=password
         )
 
-        if not attribute_uuid:
+        if not session.attribute_uuid:
             warnings.warn("attribute_uuid was not found after login")
     finally:
         NautaProtocol.logout(
-            csrfhw=data["CSRFHW"],
-            username=username,
-            wlanuserip=data["wlanuserip"],
-            attribute_uuid=attribute_uuid
+            session=session,
+            username=username
         )
 
 
@@ -0,0 +1,285 @@
+import asyncio
+import os
+
+import pytest
+
+from nautapy.proxy import NautaProxy, domain_matches
+
+
+class FakeClient(object):
+    user = "pepe@nauta.com.cu"
+
+    def __init__(self, logged_in=False):
+        self.logins = 0
+        self.logouts = 0
+        self.logged_in = logged_in
+
+    @property
+    def is_logged_in(self):
+        return self.logged_in
+
+    def login(self):
+        self.logins += 1
+        self.logged_in = True
+
+    def logout(self):
+        self.logouts += 1
+        self.logged_in = False
+
+
+async def echo(reader, writer):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def http_ok(reader, writer):
+    head = await reader.readuntil(b"\r\n\r\n")
+    body = head.split(b"\r\n")[0]
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+    await writer.drain()
+    writer.close()
+
+
+async def start(handler):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def start_proxy(client, **kwargs):
+    kwargs.setdefault("time_unit", 60)
+    proxy = NautaProxy(client, **kwargs)
+    await proxy.start(port=0)
+    return proxy
+
+
+async def tunnel(proxy, host, port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+    writer.write("CONNECT {}:{} HTTP/1.1\r\nHost: {}:{}\r\n\r\n".format(host, port, host, port).encode())
+    status = await reader.readuntil(b"\r\n\r\n")
+    return status.split(b"\r\n")[0], reader, writer
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+@pytest.mark.parametrize("host, domains, matches", [
+    ("etecsa.cu", ["etecsa.cu"], True),
+    ("www.etecsa.cu", ["etecsa.cu"], True),
+    ("WWW.Etecsa.CU.", ["etecsa.cu"], True),
+    ("notetecsa.cu", ["etecsa.cu"], False),
+    ("etecsa.cu", [], False),
+])
+def test_domain_matches(host, domains, matches):
+    assert domain_matches(host, domains) is matches
+
+
+def test_proxy_tunnels_and_logs_in_once():
+    async def scenario():
+        upstream, port = await start(echo)
+        client = FakeClient()
+        proxy = await start_proxy(client)
+
+        connections = [await tunnel(proxy, "127.0.0.1", port) for _ in range(3)]
+        for status, reader, writer in connections:
+            assert status == b"HTTP/1.1 200 Connection established"
+            writer.write(b"ping")
+            assert await reader.readexactly(4) == b"ping"
+
+        assert client.logins == 1
+        assert proxy.active == 3
+
+        for _, _, writer in connections:
+            writer.close()
+        await asyncio.sleep(0.1)
+
+        assert proxy.active == 0
+        assert proxy.stats.bytes_up == proxy.stats.bytes_down == 12
+
+        await proxy.close()
+        upstream.close()
+        return client
+
+    client = run(scenario())
+    assert client.logouts == 1
+
+
+class ClosedTransport(object):
+    """Client transport closed while the upstream connection was being opened"""
+    protocol = None
+
+    def set_protocol(self, protocol):
+        self.protocol = protocol
+
+    def is_closing(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def test_proxy_releases_closed_client_once():
+    async def scenario():
+        upstream, port = await start(echo)
+        client = FakeClient(logged_in=True)
+        proxy = await start_proxy(client)
+        active = []
+        proxy._schedule_logout = lambda: active.append(proxy.active)
+
+        transport = ClosedTransport()
+        await proxy._handle_request(transport, "CONNECT 127.0.0.1:{} HTTP/1.1\r\n\r\n".format(port).encode(), b"")
+        # The close is only now delivered to the protocol set by the proxy
+        transport.protocol.connection_lost(None)
+        await asyncio.sleep(0.1)
+
+        assert proxy.active == 0
+        assert active == [0]
+
+        await proxy.close()
+        upstream.close()
+
+    run(scenario())
+
+
+def test_proxy_defers_logout_to_billing_boundary():
+    async def scenario():
+        upstream, port = await start(echo)
+        client = FakeClient()
+        proxy = await start_proxy(client, time_unit=0.6, logout_margin=0.1)
+
+        _, _, writer = await tunnel(proxy, "127.0.0.1", port)
+        writer.close()
+        await asyncio.sleep(0.2)
+        assert client.logouts == 0
+
+        # A new connection before the boundary reuses the session
+        _, _, writer = await tunnel(proxy, "127.0.0.1", port)
+        writer.close()
+        await asyncio.sleep(0.2)
+        assert client.logins == 1 and client.logouts == 0
+
+        await asyncio.sleep(0.3)
+        assert client.logouts == 1
+
+        # Next connection opens a new session
+        _, _, writer = await tunnel(proxy, "127.0.0.1", port)
+        assert client.logins == 2
+
+        writer.close()
+        await proxy.close()
+        upstream.close()
+
+    run(scenario())
+
+
+def test_proxy_does_not_close_foreign_session():
+    async def scenario():
+        upstream, port = await start(echo)
+        client = FakeClient(logged_in=True)
+        proxy = await start_proxy(client, time_unit=0.1, logout_margin=0)
+
+        _, _, writer = await tunnel(proxy, "127.0.0.1", port)
+        writer.close()
+        await asyncio.sleep(0.3)
+        await proxy.close()
+        upstream.close()
+        return client
+
+    client = run(scenario())
+    assert client.logins == client.logouts == 0
+
+
+@pytest.mark.parametrize("kwargs, allowed", [
+    (dict(whitelist=["example.cu"]), False),
+    (dict(whitelist=["localhost"]), True),
+    (dict(blacklist=["localhost"]), False),
+    (dict(), True),
+])
+def test_proxy_domain_filter(kwargs, allowed):
+    async def scenario():
+        upstream, port = await start(echo)
+        client = FakeClient()
+        proxy = await start_proxy(client, **kwargs)
+
+        status, _, writer = await tunnel(proxy, "localhost", port)
+        writer.close()
+        await proxy.close()
+        upstream.close()
+        return status, client
+
+    status, client = run(scenario())
+    assert (status == b"HTTP/1.1 200 Connection established") is allowed
+    assert client.logins == int(allowed)
+
+
+def test_proxy_max_conn():
+    async def scenario():
+        upstream, port = await start(echo)
+        proxy = await start_proxy(FakeClient(), max_conn=1)
+
+        first, _, first_writer = await tunnel(proxy, "127.0.0.1", port)
+        second, _, second_writer = await tunnel(proxy, "127.0.0.1", port)
+
+        first_writer.close()
+        second_writer.close()
+        await proxy.close()
+        upstream.close()
+        return first, second, proxy.stats
+
+    first, second, stats = run(scenario())
+    assert first == b"HTTP/1.1 200 Connection established"
+    assert second == b"HTTP/1.1 503 Service Unavailable"
+    assert stats.rejected == 1
+
+
+def test_proxy_plain_http():
+    async def scenario():
+        upstream, port = await start(http_ok)
+        proxy = await start_proxy(FakeClient())
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+        writer.write(
+            "GET http://127.0.0.1:{}/some/path?x=1 HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            "Proxy-Connection: keep-alive\r\n\r\n".format(port).encode()
+        )
+        response = await reader.read()
+
+        writer.close()
+        await proxy.close()
+        upstream.close()
+        return response
+
+    response = run(scenario())
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b"GET /some/path?x=1 HTTP/1.1")
+
+
+def test_proxy_relays_large_transfer():
+    payload = os.urandom(8 * 1024 * 1024)
+
+    async def scenario():
+        upstream, port = await start(echo)
+        proxy = await start_proxy(FakeClient())
+        _, reader, writer = await tunnel(proxy, "127.0.0.1", port)
+
+        async def send():
+            writer.write(payload)
+            await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        received = await reader.readexactly(len(payload))
+        await sender
+
+        writer.close()
+        await proxy.close()
+        upstream.close()
+        return received, proxy.stats
+
+    received, stats = run(scenario())
+    assert received == payload
+    assert stats.bytes_up == stats.bytes_down == len(payload)
@@ -0,0 +1,196 @@
+import pytest
+import requests
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from nautapy.exceptions import NautaCircuitOpenException, NautaLogoutException
+from nautapy.nauta_api import NautaClient, NautaProtocol
+from nautapy.retry import CircuitBreaker, RetryPolicy, is_retryable
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class Flaky(object):
+    """Raises the given errors, then returns ``"ok"``"""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def make_policy(clock, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(threshold=100, clock=clock))
+    return RetryPolicy(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def refused():
+    return ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "refused")))
+
+
+def test_retries_with_backoff():
+    clock = FakeClock()
+    policy = make_policy(clock, retries=3, base_delay=1, max_delay=3)
+    func = Flaky(ReadTimeout(), ConnectionError(), ReadTimeout())
+
+    assert policy.call("get_user_time", func) == "ok"
+    assert len(func.calls) == 4
+    assert [delay <= cap for delay, cap in zip(clock.sleeps, [1, 2, 3])] == [True] * 3
+
+    stats = policy.stats.as_dict()["get_user_time"]
+    assert stats["calls"] == 1 and stats["attempts"] == 4 and stats["retries"] == 3
+    assert stats["failures"] == 0
+
+
+def test_gives_up_after_retries():
+    clock = FakeClock()
+    policy = make_policy(clock, retries=2)
+    func = Flaky(*[ReadTimeout()] * 5)
+
+    with pytest.raises(ReadTimeout):
+        policy.call("logout", func)
+
+    assert len(func.calls) == 3
+    assert policy.stats.as_dict()["logout"]["failures"] == 1
+
+
+def test_respects_deadline():
+    clock = FakeClock()
+    policy = make_policy(clock, retries=100, base_delay=1, max_delay=1, deadline=5, timeout=(10, 30))
+    func = Flaky(*[ReadTimeout()] * 100)
+
+    with pytest.raises(ReadTimeout):
+        policy.call("landing", func)
+
+    assert clock.now < 5
+    # The timeout of every attempt is bounded by what is left of the deadline
+    assert all(connect <= 5 and read <= 5 for connect, read in (call["timeout"] for call in func.calls))
+
+
+def test_operation_overrides():
+    clock = FakeClock()
+    policy = make_policy(clock, retries=0, operations={"logout": {"retries": 2}})
+
+    assert policy.call("logout", Flaky(ReadTimeout(), ReadTimeout())) == "ok"
+    with pytest.raises(ReadTimeout):
+        policy.call("landing", Flaky(ReadTimeout()))
+
+
+@pytest.mark.parametrize("error, idempotent, retryable", [
+    (ReadTimeout(), True, True),
+    (ReadTimeout(), False, False),
+    (ConnectTimeout(), False, True),
+    (refused(), False, True),
+    (ConnectionError("Connection reset by peer"), False, False),
+    (ConnectionError("Connection reset by peer"), True, True),
+])
+def test_is_retryable(error, idempotent, retryable):
+    assert is_retryable(error, idempotent) is retryable
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+    policy = make_policy(clock, retries=0, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(ReadTimeout):
+            policy.call("get_user_time", Flaky(ReadTimeout()))
+
+    assert breaker.state == CircuitBreaker.OPEN
+    func = Flaky()
+    with pytest.raises(NautaCircuitOpenException):
+        policy.call("get_user_time", func)
+    assert not func.calls
+
+    # After the reset timeout a single request goes through
+    clock.now += 10
+    with pytest.raises(ReadTimeout):
+        policy.call("get_user_time", Flaky(ReadTimeout()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    assert policy.call("get_user_time", Flaky()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_bypassed():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+    policy = make_policy(clock, retries=0, breaker=breaker, operations={"logout": {"use_breaker": False}})
+
+    with pytest.raises(ReadTimeout):
+        policy.call("get_user_time", Flaky(ReadTimeout()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert policy.call("logout", Flaky()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_logout_while_breaker_open(mock_portal):
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+
+    breaker = NautaProtocol.get_retry_policy().breaker
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    with pytest.raises(NautaCircuitOpenException):
+        client.get_remaining_time(refresh=True)
+
+    client.logout()
+    assert not mock_portal.sessions
+
+
+def test_interrupted_trial_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+    policy = make_policy(clock, retries=0, breaker=breaker)
+
+    with pytest.raises(ReadTimeout):
+        policy.call("get_user_time", Flaky(ReadTimeout()))
+    clock.now += 10
+    with pytest.raises(KeyboardInterrupt):
+        policy.call("get_user_time", Flaky(KeyboardInterrupt()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Not stuck half open, the next call is the trial
+    assert policy.call("get_user_time", Flaky()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_protocol_retries_requests(mock_portal, monkeypatch):
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+
+    request = requests.Session.request
+    failures = [ConnectionError("Connection reset by peer")]
+
+    def flaky_request(self, method, url, *args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return request(self, method, url, *args, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "request", flaky_request)
+    monkeypatch.setattr(NautaProtocol.get_retry_policy(), "base_delay", 0.01)
+
+    assert client.remaining_time
+    assert NautaProtocol.retry_policy.stats.as_dict()["get_user_time"]["retries"] == 1
+
+    failures.extend([ConnectionError("Connection reset by peer")] * 10)
+    with pytest.raises(NautaLogoutException):
+        client.logout()
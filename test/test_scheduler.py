@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from nautapy.exceptions import NautaLoginException
+from nautapy.scheduler import BillingScheduler, billing_deadline
+
+
+class FakeClient(object):
+    user = "pepe@nauta.com.cu"
+
+    def __init__(self, remaining_time="01:00:00", logged_in=False, fail_login=False):
+        self.remaining_time = remaining_time
+        self.logged_in = logged_in
+        self.fail_login = fail_login
+        self.logins = 0
+        self.logouts = 0
+
+    @property
+    def is_logged_in(self):
+        return self.logged_in
+
+    def login(self):
+        if self.fail_login:
+            raise NautaLoginException("Falló el inicio de sesión")
+        self.logins += 1
+        self.logged_in = True
+
+    def logout(self):
+        self.logouts += 1
+        self.logged_in = False
+
+
+@pytest.mark.parametrize("now, remaining, deadline", [
+    (0, None, 115),
+    (100, None, 115),
+    (116, None, 115),
+    (130, None, 235),
+    (100, 60, 55),
+    (100, 1000, 115),
+])
+def test_billing_deadline(now, remaining, deadline):
+    assert billing_deadline(0, now, 120, margin=5, remaining=remaining) == deadline
+
+
+def test_scheduler_batches_jobs_in_one_session():
+    client = FakeClient()
+    scheduler = BillingScheduler(client, time_unit=0.5, logout_margin=0.1)
+
+    futures = [scheduler.submit(lambda i=i: i * 2) for i in range(5)]
+    assert [future.result(timeout=1) for future in futures] == [0, 2, 4, 6, 8]
+
+    # Jobs submitted inside the same billed window reuse the session
+    time.sleep(0.1)
+    assert scheduler.submit(lambda: "late").result(timeout=1) == "late"
+    assert client.logins == 1 and client.logouts == 0
+
+    time.sleep(0.5)
+    assert client.logouts == 1
+    assert scheduler.stats.sessions == 1
+    assert scheduler.stats.jobs == 6
+
+    scheduler.close()
+
+
+def test_scheduler_keeps_session_while_jobs_run():
+    client = FakeClient()
+    release = threading.Event()
+
+    with BillingScheduler(client, time_unit=0.2, logout_margin=0.05) as scheduler:
+        future = scheduler.submit(release.wait)
+        time.sleep(0.5)
+        assert client.logouts == 0
+
+        release.set()
+        future.result(timeout=1)
+
+    assert client.logouts == 1
+
+
+def test_scheduler_caps_session_to_remaining_time():
+    client = FakeClient(remaining_time="00:00:01")
+    scheduler = BillingScheduler(client, time_unit=60, logout_margin=0.5)
+
+    scheduler.submit(lambda: None).result(timeout=1)
+    assert scheduler.remaining == 1
+
+    time.sleep(0.8)
+    assert client.logouts == 1
+    scheduler.close()
+
+
+def test_scheduler_does_not_close_foreign_session():
+    client = FakeClient(logged_in=True)
+
+    with BillingScheduler(client, time_unit=0.1, logout_margin=0) as scheduler:
+        scheduler.submit(lambda: None).result(timeout=1)
+        time.sleep(0.2)
+
+    assert client.logins == client.logouts == 0
+
+
+def test_scheduler_login_failure_fails_jobs():
+    client = FakeClient(fail_login=True)
+
+    with BillingScheduler(client, time_unit=60) as scheduler:
+        future = scheduler.submit(lambda: None)
+
+        with pytest.raises(NautaLoginException):
+            future.result(timeout=1)
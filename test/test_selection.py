@@ -0,0 +1,135 @@
+import pytest
+
+from nautapy.exceptions import NautaLoginException
+from nautapy.selection import AccountSelector, FAILURE_HALF_LIFE
+from nautapy.time_cache import RemainingTimeCache
+
+ACCOUNTS = [("user{}@nauta.com.cu".format(i), "pass{}".format(i)) for i in range(4)]
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def selector(tmp_path):
+    clock = FakeClock()
+    time_cache = RemainingTimeCache(str(tmp_path / "time-cache"), clock=clock)
+    return AccountSelector(str(tmp_path / "account-stats"), time_cache=time_cache, clock=clock), clock
+
+
+def users(candidates):
+    return [candidate.user[:5] for candidate in candidates]
+
+
+def test_rank_by_remaining_time(selector):
+    selector, clock = selector
+    selector.time_cache.update("user1@nauta.com.cu", 7200, active=False)
+    selector.time_cache.update("user2@nauta.com.cu", 1800, active=False)
+    selector.time_cache.update("user3@nauta.com.cu", 30, active=False)
+
+    # Never asked accounts are assumed to have an hour, ties keep the stored order
+    assert users(selector.rank(ACCOUNTS)) == ["user1", "user0", "user2", "user3"]
+
+    # Stale values still count
+    clock.now += 86400
+    assert users(selector.rank(ACCOUNTS)) == ["user1", "user0", "user2", "user3"]
+
+
+def test_failures_decay(selector):
+    selector, clock = selector
+    selector.record_failure("user0@nauta.com.cu")
+
+    ranking = selector.rank(ACCOUNTS)
+    assert users(ranking)[-1] == "user0"
+    assert ranking[-1].failures == 1
+
+    clock.now += 4 * FAILURE_HALF_LIFE
+    ranking = selector.rank(ACCOUNTS)
+    assert ranking[-1].failures == pytest.approx(1 / 16)
+
+    selector.record_success("user0@nauta.com.cu", 0.1)
+    assert all(candidate.failures == 0 for candidate in selector.rank(ACCOUNTS))
+
+
+def test_out_of_time_goes_last(selector):
+    selector, clock = selector
+    selector.time_cache.update("user0@nauta.com.cu", 0, active=False)
+    for _ in range(3):
+        selector.record_failure("user1@nauta.com.cu")
+
+    assert users(selector.rank(ACCOUNTS))[-2:] == ["user1", "user0"]
+
+
+def test_latency_moving_average(selector):
+    selector, clock = selector
+    selector.record_success("user0@nauta.com.cu", 1.0)
+    selector.record_success("user0@nauta.com.cu", 2.0)
+    selector.record_success("user1@nauta.com.cu", 0.2)
+
+    ranking = {candidate.user: candidate for candidate in selector.rank(ACCOUNTS)}
+    assert ranking["user0@nauta.com.cu"].latency == pytest.approx(1.3)
+    assert users(selector.rank(ACCOUNTS)) == ["user2", "user3", "user1", "user0"]
+
+
+def test_login_fails_over(selector, mock_portal):
+    selector, clock = selector
+    accounts = [("user0@nauta.com.cu", "wrong"), ("user1@nauta.com.cu", "pass1")]
+    attempts = []
+
+    client = selector.login(accounts, on_attempt=lambda candidate, error: attempts.append((candidate.user, error)))
+
+    assert client.user == "user1@nauta.com.cu"
+    assert mock_portal.sessions.keys() == {"user1@nauta.com.cu"}
+    assert [user for user, error in attempts] == ["user0@nauta.com.cu", "user1@nauta.com.cu"]
+    assert isinstance(attempts[0][1], NautaLoginException) and attempts[1][1] is None
+    # A single handshake for both accounts
+    assert mock_portal.requests.count(("post", "/")) == 1
+    assert mock_portal.requests.count(("post", "/LoginServlet")) == 2
+
+    client.logout()
+    assert users(selector.rank(accounts)) == ["user1", "user0"]
+
+
+def test_fails_over_from_fast_login(selector, mock_portal):
+    selector, clock = selector
+    selector.login([("user2@nauta.com.cu", "pass2")]).logout()
+    mock_portal.requests.clear()
+
+    accounts = [("user0@nauta.com.cu", "wrong"), ("user1@nauta.com.cu", "pass1")]
+    client = selector.login(accounts)
+    assert client.user == "user1@nauta.com.cu"
+    # One request per account, the cached form is used for both
+    assert [request for request in mock_portal.requests if request[0] == "post"] == [("post", "/LoginServlet")] * 2
+    client.logout()
+
+
+def test_expired_form_is_renewed(selector, mock_portal):
+    selector, clock = selector
+    accounts = [("user0@nauta.com.cu", "wrong"), ("user1@nauta.com.cu", "pass1")]
+
+    def expire(candidate, error):
+        if error:
+            mock_portal.csrf_tokens.clear()
+
+    client = selector.login(accounts, on_attempt=expire)
+    assert client.user == "user1@nauta.com.cu"
+    assert mock_portal.requests.count(("post", "/")) == 2
+    client.logout()
+
+
+def test_every_account_rejected(selector, mock_portal):
+    selector, clock = selector
+
+    with pytest.raises(NautaLoginException) as ex:
+        selector.login([("user0@nauta.com.cu", "wrong"), ("user1@nauta.com.cu", "wrong")])
+    assert "Usuario o contraseña incorrectos" in ex.value.args[0]
+    assert not mock_portal.online
+
+    with pytest.raises(NautaLoginException) as ex:
+        selector.login([])
+    assert "No existe ningún usuario" in ex.value.args[0]
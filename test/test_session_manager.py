@@ -0,0 +1,80 @@
+import pytest
+
+from nautapy.exceptions import NautaLoginException
+from nautapy.session_manager import SessionManager
+
+ACCOUNTS = [
+    ("user{}@nauta.com.cu".format(i), "pass{}".format(i))
+    for i in range(20)
+]
+
+
+@pytest.fixture()
+def manager(mock_portal, tmp_path):
+    return SessionManager(ACCOUNTS, max_workers=4, sessions_dir=str(tmp_path / "sessions"))
+
+
+def test_session_manager_login_logout_all(mock_portal, manager):
+    results = list(manager.login_all())
+
+    assert len(results) == len(ACCOUNTS)
+    assert all(result.ok for result in results)
+    assert set(mock_portal.sessions) == {user for user, _ in ACCOUNTS}
+    assert all(manager.status().values())
+
+    results = list(manager.logout_all())
+
+    assert all(result.ok for result in results)
+    assert not mock_portal.sessions
+    assert not any(manager.status().values())
+
+    stats = manager.stats.as_dict()
+    assert stats["count"] == stats["successes"] == 2 * len(ACCOUNTS)
+    assert stats["throughput"] > 0
+    assert stats["p50"] <= stats["p95"] <= stats["max"]
+
+
+def test_session_manager_sessions_do_not_collide(mock_portal, manager):
+    users = [user for user, _ in ACCOUNTS[:2]]
+    list(manager.login_all(users))
+
+    first, second = (manager.clients[user] for user in users)
+    assert first.session_file != second.session_file
+    assert first.session.attribute_uuid == mock_portal.sessions[users[0]]
+    assert second.session.attribute_uuid == mock_portal.sessions[users[1]]
+
+    list(manager.logout_all(users[:1]))
+
+    assert list(mock_portal.sessions) == users[1:]
+
+
+def test_session_manager_reports_failures(mock_portal, tmp_path):
+    manager = SessionManager([("user0@nauta.com.cu", "wrong")], sessions_dir=str(tmp_path))
+
+    result, = manager.login_all()
+
+    assert not result.ok
+    assert isinstance(result.error, NautaLoginException)
+    assert manager.stats.failures == 1
+    assert not manager.status()["user0@nauta.com.cu"]
+
+
+def test_session_manager_query_all(mock_portal, manager):
+    mock_portal.remaining_time = "02:14:24"
+
+    results = list(manager.query_all(credit=True))
+
+    assert len(results) == len(ACCOUNTS)
+    assert all(result.ok for result in results)
+    assert {result.value["remaining_time"] for result in results} == {"02:14:24"}
+    assert {result.value["credit"] for result in results} == {mock_portal.credit}
+
+
+def test_session_manager_query_all_keeps_active_sessions(mock_portal, manager):
+    user = ACCOUNTS[0][0]
+    list(manager.login_all([user]))
+
+    result, = manager.query_all([user])
+
+    assert result.ok
+    assert manager.status()[user]
@@ -0,0 +1,113 @@
+import json
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+from nautapy import session_store
+from nautapy.nauta_api import SessionObject
+from nautapy.session_store import SessionStore, read_record, write_record
+
+WRITER = (
+    "import sys\n"
+    "from nautapy.session_store import write_record\n"
+    "i = 0\n"
+    "while True:\n"
+    "    write_record(sys.argv[1], {'i': i, 'cookies': [['JSESSIONID', 'x' * 4096, '', '/', False, None]]})\n"
+    "    i += 1\n"
+)
+
+
+def test_write_record(tmp_path):
+    path = str(tmp_path / "sessions" / "pepe")
+    write_record(path, {"attribute_uuid": "ABC", "cookies": []})
+
+    with open(path) as fp:
+        assert fp.read() == '{"attribute_uuid":"ABC","cookies":[]}'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert read_record(path) == {"attribute_uuid": "ABC", "cookies": []}
+
+
+def test_session_object_round_trip(tmp_path):
+    path = str(tmp_path / "nauta-session")
+    session = SessionObject("https://portal/login", "csrf", "10.0.0.1", "UUID", session_file=path)
+    session.requests_session.cookies.set("JSESSIONID", "CSRF", domain="secure.etecsa.net", path="/")
+    session.save("pepe@nauta.com.cu")
+
+    loaded = SessionObject.load(path)
+    assert loaded.attribute_uuid == "UUID"
+    assert loaded.username == "pepe@nauta.com.cu"
+    assert loaded.requests_session.cookies.get("JSESSIONID", domain="secure.etecsa.net") == "CSRF"
+
+    loaded.dispose()
+    assert not SessionObject.is_logged_in(path)
+
+
+def test_session_object_loads_legacy_file(tmp_path):
+    path = str(tmp_path / "nauta-session")
+    with open(path, "w") as fp:
+        json.dump({"login_action": "a", "csrfhw": "b", "wlanuserip": "c", "attribute_uuid": "d", "username": "e"}, fp)
+
+    loaded = SessionObject.load(path)
+    assert loaded.attribute_uuid == "d"
+    assert not loaded.requests_session.cookies
+
+
+def test_failed_write_keeps_previous_record(tmp_path, monkeypatch):
+    path = str(tmp_path / "nauta-session")
+    write_record(path, {"attribute_uuid": "OLD"})
+
+    def crash(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(session_store.os, "fsync", crash)
+    with pytest.raises(OSError):
+        write_record(path, {"attribute_uuid": "NEW"})
+
+    assert read_record(path) == {"attribute_uuid": "OLD"}
+    assert os.listdir(str(tmp_path)) == ["nauta-session"]
+
+
+def test_killed_writer_never_leaves_a_broken_record(tmp_path):
+    path = str(tmp_path / "nauta-session")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+    for delay in [0.05, 0.1, 0.15, 0.2, 0.3]:
+        proc = subprocess.Popen([sys.executable, "-c", WRITER, path], env=env)
+        time.sleep(delay)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+
+        if os.path.exists(path):
+            record = read_record(path)
+            assert len(record["cookies"][0][1]) == 4096
+
+
+def test_store_named_sessions(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.save("pepe@nauta.com.cu", {"attribute_uuid": "A"})
+    store.save("juan@nauta.com.cu", {"attribute_uuid": "B"})
+
+    # Leftovers of a crashed writer and watcher sockets are not sessions
+    open(str(tmp_path / "pepe@nauta.com.cu.123.tmp"), "w").close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(str(tmp_path / "juan@nauta.com.cu.sock"))
+
+    assert store.names() == ["juan@nauta.com.cu", "pepe@nauta.com.cu"]
+    assert store.load("pepe@nauta.com.cu") == {"attribute_uuid": "A"}
+    assert store.load("pedro@nauta.com.cu") is None
+
+    store.remove("pepe@nauta.com.cu")
+    assert not store.exists("pepe@nauta.com.cu")
+    sock.close()
+
+
+@pytest.mark.parametrize("name", ["", "../users.db", ".hidden", "pepe.tmp"])
+def test_store_rejects_invalid_names(tmp_path, name):
+    with pytest.raises(ValueError):
+        SessionStore(str(tmp_path)).path(name)
@@ -0,0 +1,103 @@
+from nautapy.nauta_api import NautaClient
+from nautapy.time_cache import RemainingTimeCache
+
+USER = "pepe@nauta.com.cu"
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmp_path, **kwargs):
+    clock = FakeClock()
+    return RemainingTimeCache(str(tmp_path / "time-cache"), clock=clock, **kwargs), clock
+
+
+def test_counts_down_while_active(tmp_path):
+    cache, clock = make_cache(tmp_path)
+    assert cache.get(USER, active=True) is None
+
+    cache.update(USER, 3600, active=True)
+    clock.now += 90
+    assert cache.get(USER, active=True) == 3510
+
+    cache.stop(USER)
+    clock.now += 90
+    assert cache.get(USER, active=False) == 3510
+    # The session state changed behind our back
+    assert cache.get(USER, active=True) is None
+
+    cache.start(USER)
+    clock.now += 10
+    assert cache.get(USER, active=True) == 3500
+
+
+def test_never_below_zero(tmp_path):
+    cache, clock = make_cache(tmp_path)
+    cache.update(USER, 30, active=True)
+    clock.now += 60
+    assert cache.get(USER, active=True) == 0
+
+
+def test_expires_after_ttl(tmp_path):
+    cache, clock = make_cache(tmp_path, ttl=60)
+    cache.update(USER, 3600, active=False)
+
+    clock.now += 60
+    assert cache.get(USER, active=False) == 3600
+    clock.now += 1
+    assert cache.get(USER, active=False) is None
+
+
+def test_refreshes_on_drift(tmp_path):
+    cache, clock = make_cache(tmp_path, max_drift=30)
+    cache.update(USER, 3600, active=True)
+
+    # The portal billed 100s more than the countdown in 100s
+    clock.now += 100
+    cache.update(USER, 3400, active=True)
+
+    clock.now += 30
+    assert cache.get(USER, active=True) == 3370
+    clock.now += 1
+    assert cache.get(USER, active=True) is None
+
+
+def test_shared_between_instances(tmp_path):
+    cache, clock = make_cache(tmp_path)
+    cache.update(USER, 3600, active=False)
+    assert RemainingTimeCache(cache.path, clock=clock).get(USER, active=False) == 3600
+
+    cache.invalidate(USER)
+    assert cache.get(USER, active=False) is None
+
+
+def test_client_reuses_remaining_time(mock_portal):
+    queries = lambda: mock_portal.requests.count(("post", "/EtecsaQueryServlet"))
+
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    client.login()
+    assert client.remaining_time == "01:00:00"
+    assert client.remaining_time in ("01:00:00", "00:59:59")
+    assert queries() == 1
+
+    client.logout()
+    assert client.remaining_time in ("01:00:00", "00:59:59")
+    assert queries() == 1
+
+    mock_portal.remaining_time = "00:30:00"
+    assert client.get_remaining_time(refresh=True) == "00:30:00"
+    assert queries() == 2
+
+
+def test_client_does_not_cache_errors(mock_portal):
+    mock_portal.remaining_time = "errorop"
+
+    client = NautaClient("user1@nauta.com.cu", "pass1", check_connection=False)
+    assert client.remaining_time == "errorop"
+    assert client.remaining_time == "errorop"
+    assert mock_portal.requests.count(("post", "/EtecsaQueryServlet")) == 2
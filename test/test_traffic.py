@@ -0,0 +1,175 @@
+import subprocess
+import sys
+
+import pytest
+
+from nautapy import traffic
+from nautapy.nauta_api import NautaClient, SessionObject
+from nautapy.traffic import TrafficMeter, TrafficStore, format_bytes, read_counters
+
+USER = "user1@nauta.com.cu"
+
+PROC_NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 5000  10    0    0    0     0          0         0 5000  10    0    0    0     0       0          0
+  eth0: 1000  10    0    0    0     0          0         0  200  10    0    0    0     0       0          0
+ wlan0:   30   1    0    0    0     0          0         0    4   1    0    0    0     0       0          0
+"""
+
+
+class FakeCounters(object):
+    def __init__(self):
+        self.received = 1000
+        self.sent = 100
+
+    def __call__(self, interfaces=None):
+        return self.received, self.sent
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def store(tmp_path):
+    store = TrafficStore(str(tmp_path / "stats.db"))
+    yield store
+    store.close()
+
+
+def test_read_counters(tmp_path):
+    path = tmp_path / "dev"
+    path.write_text(PROC_NET_DEV)
+
+    assert read_counters(str(path)) == (1030, 204)
+    assert read_counters(str(path), interfaces=["wlan0"]) == (30, 4)
+    assert read_counters(str(tmp_path / "missing")) is None
+
+
+def test_format_bytes():
+    assert format_bytes(512) == "512 B"
+    assert format_bytes(1536) == "1.5 KB"
+    assert format_bytes(3 * 1024 ** 3) == "3.0 GB"
+    assert format_bytes(2 * 1024 ** 4) == "2.0 TB"
+
+
+def test_meter(store):
+    counters, clock = FakeCounters(), FakeClock()
+    meter = TrafficMeter(command="git push", store=store, counters=counters, clock=clock)
+
+    reading = meter.start()
+    counters.received += 6000
+    counters.sent += 600
+    clock.now += 90
+
+    session = meter.stop(USER, reading)
+    assert (session.user, session.command, session.received, session.sent) == (USER, "git push", 6000, 600)
+    assert session.ended - session.started == 90
+    assert store.sessions() == [session]
+
+    # Counters reset when the interface went down
+    reading = meter.start()
+    counters.received = counters.sent = 0
+    assert meter.stop(USER, reading).received == 0
+
+    assert meter.stop(USER, None) is None
+    assert TrafficMeter(counters=lambda interfaces=None: None).start() is None
+
+
+def test_ring_buffer(tmp_path):
+    store = TrafficStore(str(tmp_path / "stats.db"), max_sessions=3)
+    for i in range(5):
+        store.record(USER, None, i, i + 1, i, i)
+
+    assert [session.received for session in store.sessions()] == [4, 3, 2]
+    assert [session.received for session in store.sessions(limit=1)] == [4]
+    store.close()
+
+
+def test_schema_created_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "stats.db")
+    store = TrafficStore(path)
+    store.record("pepe", "git push", 0, 60, 100, 10)
+    store.close()
+
+    def fail(conn):
+        raise AssertionError("schema migrated again")
+
+    monkeypatch.setattr(traffic, "MIGRATIONS", [fail])
+    store = TrafficStore(path)
+    assert [session.command for session in store.sessions()] == ["git push"]
+    store.close()
+
+
+def test_summary(store):
+    store.record(USER, "git push", 0, 61, 1000, 200)
+    store.record(USER, None, 100, 110, 100, 20)
+    store.record("user2@nauta.com.cu", None, 200, 230, 10, 5)
+
+    by_user = store.summary(by="user")
+    assert [row.key for row in by_user] == [USER, "user2@nauta.com.cu"]
+    assert by_user[0].sessions == 2
+    assert by_user[0].duration == 71
+    # 61s bill two minutes, 10s a whole one
+    assert by_user[0].billed == 180
+    assert by_user[0].bytes_per_minute == pytest.approx(1320 / 3)
+
+    by_command = store.summary(by="command", user=USER)
+    assert [(row.key, row.sessions) for row in by_command] == [("git push", 1), ("-", 1)]
+
+    assert store.summary(by="user", time_unit=120)[0].billed == 240
+    assert len(store.summary(by="session", limit=2)) == 2
+
+
+def test_session_lifecycle(mock_portal):
+    counters = FakeCounters()
+    client = NautaClient(USER, "pass1", traffic=TrafficMeter(command="apt upgrade", counters=counters))
+    client.login()
+    assert SessionObject.load().traffic[1:] == [1000, 100, "apt upgrade"]
+
+    counters.received += 5000
+    # Closed by another process, like 'nauta down'
+    other = NautaClient(None, None, traffic=TrafficMeter(counters=counters))
+    other.load_last_session()
+    other.user = other.session.username
+    other.logout()
+
+    store = TrafficStore()
+    [session] = store.sessions()
+    store.close()
+    assert (session.user, session.command, session.received, session.sent) == (USER, "apt upgrade", 5000, 0)
+
+
+def test_reconnect_keeps_reading(mock_portal):
+    counters = FakeCounters()
+    client = NautaClient(USER, "pass1", traffic=TrafficMeter(counters=counters))
+    client.login()
+    reading = client.session.traffic
+
+    mock_portal.sessions.clear()
+    counters.received += 10
+    client.login(reconnect=True)
+    assert client.session.traffic == reading
+    client.logout()
+
+
+def test_cli_stats(tmp_path):
+    store = TrafficStore(str(tmp_path / ".local" / "share" / "nautapy" / "stats.db"))
+    store.record(USER, "git push", 0, 30, 3 * 1024 ** 2, 1024)
+    store.close()
+
+    proc = subprocess.run(
+        [sys.executable, "-m", "nautapy", "stats", "--by", "command"],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        env={"HOME": str(tmp_path), "PATH": ""},
+        check=True
+    )
+    lines = proc.stdout.splitlines()
+    assert lines[0].startswith("Comando")
+    assert lines[1].split() == ["git", "push", "1", "00:00:30", "00:01:00", "3.0", "MB", "1.0", "KB", "3.0", "MB"]
@@ -0,0 +1,70 @@
+import os
+import socketserver
+import stat
+import threading
+
+import pytest
+
+from nautapy import unix_socket
+from nautapy.exceptions import NautaException
+
+
+class EchoHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        unix_socket.send_message(self.connection, unix_socket.recv_message(self.rfile))
+
+
+def test_server_socket(tmp_path):
+    socket_path = str(tmp_path / "run" / "echo.sock")
+    os.makedirs(os.path.dirname(socket_path))
+    # Left by a server that crashed
+    open(socket_path, "w").close()
+
+    server = unix_socket.UnixSocketServer(socket_path, EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+        with unix_socket.connect(socket_path, timeout=5) as sock, sock.makefile("rb") as fp:
+            unix_socket.send_message(sock, {"user": "pepé"})
+            assert unix_socket.recv_message(fp) == {"user": "pepé"}
+            with pytest.raises(ConnectionError):
+                unix_socket.recv_message(fp)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert not os.path.exists(socket_path)
+    with pytest.raises(OSError):
+        unix_socket.connect(socket_path)
+
+
+def test_server_refuses_live_socket(tmp_path):
+    socket_path = str(tmp_path / "echo.sock")
+    server = unix_socket.UnixSocketServer(socket_path, EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with pytest.raises(NautaException):
+            unix_socket.UnixSocketServer(socket_path, EchoHandler)
+
+        with unix_socket.connect(socket_path, timeout=5) as sock, sock.makefile("rb") as fp:
+            unix_socket.send_message(sock, "ping")
+            assert unix_socket.recv_message(fp) == "ping"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_server_close_keeps_socket_of_another_server(tmp_path):
+    socket_path = str(tmp_path / "echo.sock")
+    old = unix_socket.UnixSocketServer(socket_path, EchoHandler)
+    # The old server stopped answering and a new one replaced its socket
+    old.socket.close()
+    new = unix_socket.UnixSocketServer(socket_path, EchoHandler)
+
+    old.server_close()
+    assert os.path.exists(socket_path)
+    new.server_close()
+    assert not os.path.exists(socket_path)
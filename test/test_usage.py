@@ -0,0 +1,174 @@
+import datetime
+import subprocess
+import sys
+import time
+
+import pytest
+
+from nautapy import usage
+from nautapy.nauta_api import NautaClient
+from nautapy.usage import UsageLedger, split_by_day
+
+USER = "user1@nauta.com.cu"
+DAY = 86400
+
+
+def local_time(*args):
+    return time.mktime(datetime.datetime(*args).timetuple())
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def ledger(tmp_path):
+    clock = FakeClock(local_time(2026, 3, 10, 12, 0))
+    ledger = UsageLedger(str(tmp_path / "usage.db"), clock=clock)
+    yield ledger, clock
+    ledger.close()
+
+
+def session(ledger, clock, seconds):
+    ledger.login(USER)
+    clock.now += seconds
+    ledger.logout(USER)
+
+
+def test_split_by_day():
+    start = local_time(2026, 3, 10, 23, 50)
+    assert list(split_by_day(start, start + 1800)) == [
+        (datetime.date(2026, 3, 10), 600), (datetime.date(2026, 3, 11), 1200)
+    ]
+    assert list(split_by_day(start, start)) == []
+
+
+def test_session(ledger):
+    ledger, clock = ledger
+    ledger.login(USER)
+    ledger.remaining(USER, 7200)
+    clock.now += 1800
+
+    # The open session counts until now
+    usage = ledger.usage(USER)
+    assert usage["today"] == usage["month"] == 1800
+    assert usage["remaining"] == 5400 and usage["logged_in"]
+
+    ledger.logout(USER)
+    clock.now += 600
+    usage = ledger.usage(USER)
+    assert usage["today"] == usage["month"] == usage["total"] == 1800
+    assert usage["remaining"] == 5400 and not usage["logged_in"]
+
+    kinds = [row[0] for row in ledger.connection.execute("SELECT kind FROM events ORDER BY id")]
+    assert kinds == ["login", "remaining", "logout"]
+
+
+def test_burn_rate_and_depletion(ledger):
+    ledger, clock = ledger
+    ledger.remaining(USER, 36000)
+    session(ledger, clock, 3600)
+    clock.now += 2 * DAY - 3600
+
+    usage = ledger.usage(USER)
+    assert usage["today"] == 0
+    # One hour in the two days since the account was first seen
+    assert usage["burn_rate"] == pytest.approx(1800)
+    assert usage["remaining"] == 32400
+    assert usage["depletion"] == pytest.approx(clock.now + 18 * DAY)
+
+
+def test_burn_rate_window(ledger):
+    ledger, clock = ledger
+    session(ledger, clock, 3600)
+    clock.now += 40 * DAY
+    session(ledger, clock, 600)
+
+    assert ledger.usage(USER)["burn_rate"] == pytest.approx(20)
+    assert ledger.usage(USER, days=60)["burn_rate"] == pytest.approx(4200 / 40, rel=0.01)
+    assert ledger.usage(USER)["depletion"] is None
+
+
+def test_session_across_midnight(ledger):
+    ledger, clock = ledger
+    clock.now = local_time(2026, 3, 31, 23, 30)
+    session(ledger, clock, 3600)
+
+    rows = ledger.connection.execute("SELECT day, used, sessions FROM daily ORDER BY day").fetchall()
+    assert rows == [("2026-03-31", 1800, 1), ("2026-04-01", 1800, 0)]
+    rows = ledger.connection.execute("SELECT month, used, sessions FROM monthly ORDER BY month").fetchall()
+    assert rows == [("2026-03", 1800, 1), ("2026-04", 1800, 0)]
+
+    usage = ledger.usage(USER)
+    assert usage["today"] == usage["month"] == 1800
+
+
+def test_answers_from_aggregates(ledger):
+    ledger, clock = ledger
+    for _ in range(5):
+        session(ledger, clock, 600)
+        clock.now += DAY
+    before = ledger.usage(USER)
+
+    ledger.connection.execute("DELETE FROM events")
+    assert ledger.usage(USER) == before
+    assert ledger.usage("unknown@nauta.com.cu") is None
+
+
+def test_schema_created_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "usage.db")
+    ledger = UsageLedger(path)
+    ledger.login(USER)
+    assert ledger.connection.execute("PRAGMA user_version").fetchone()[0] == len(usage.MIGRATIONS)
+    ledger.close()
+
+    def fail(conn):
+        raise AssertionError("schema migrated again")
+
+    monkeypatch.setattr(usage, "MIGRATIONS", [fail])
+    ledger = UsageLedger(path)
+    ledger.logout(USER)
+    assert ledger.users() == [USER]
+    ledger.close()
+
+
+def test_never_fails(tmp_path):
+    (tmp_path / "usage.db").mkdir()
+    ledger = UsageLedger(str(tmp_path / "usage.db"))
+
+    ledger.login(USER)
+    ledger.logout(None)
+
+
+def test_client_records_events(mock_portal):
+    client = NautaClient(USER, "pass1")
+    client.login()
+    client.get_remaining_time(refresh=True)
+    client.logout()
+
+    ledger = UsageLedger.default()
+    kinds = [row[0] for row in ledger.connection.execute("SELECT kind FROM events ORDER BY id")]
+    assert kinds == ["login", "remaining", "logout"]
+    usage = ledger.usage(USER)
+    assert usage["remaining"] <= 3600 and usage["total"] > 0
+
+
+def test_cli_usage(tmp_path):
+    ledger = UsageLedger(str(tmp_path / ".local" / "share" / "nautapy" / "usage.db"))
+    ledger.login(USER)
+    ledger.remaining(USER, 3600)
+    ledger.close()
+
+    proc = subprocess.run(
+        [sys.executable, "-m", "nautapy", "usage", "--all"],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        env={"HOME": str(tmp_path), "PATH": ""},
+        check=True
+    )
+    assert "Usuario Nauta: {}".format(USER) in proc.stdout
+    assert "Tiempo restante: " in proc.stdout
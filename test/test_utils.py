@@ -1,5 +1,5 @@
 from nautapy.exceptions import NautaFormatException
-from nautapy.utils import strtime2seconds, seconds2strtime
+from nautapy.utils import strtime2seconds, seconds2strtime, next_billing_boundary
 import pytest
 
 
@@ -33,3 +33,13 @@ def test_strtime2seconds_raises_format_exception(bad_formated):
 def test_seconds2strtime(strtime, seconds):
     assert seconds2strtime(seconds) == strtime
 
+
+@pytest.mark.parametrize("start, now, time_unit, boundary", [
+    (100, 100, 120, 220),
+    (100, 150, 120, 220),
+    (100, 220, 120, 220),
+    (100, 221, 120, 340),
+    (0, 0.5, 1, 1),
+])
+def test_next_billing_boundary(start, now, time_unit, boundary):
+    assert next_billing_boundary(start, now, time_unit) == boundary
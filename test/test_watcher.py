@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+import pytest
+
+from nautapy.watcher import SessionWatcher, notify
+
+
+@pytest.fixture
+def session_file(tmp_path):
+    path = str(tmp_path / "nauta-session")
+    with open(path, "w") as fp:
+        fp.write("{}")
+    return path
+
+
+def later(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.start()
+    return timer
+
+
+def test_watcher_times_out_while_logged_in(session_file):
+    with SessionWatcher(session_file) as watcher:
+        start = time.monotonic()
+        assert watcher.wait(0.1) is False
+        assert time.monotonic() - start < 0.5
+
+
+def test_watcher_ends_without_session(tmp_path):
+    with SessionWatcher(str(tmp_path / "nauta-session")) as watcher:
+        assert watcher.wait(5) is True
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_detects_removed_session(session_file, use_inotify):
+    with SessionWatcher(session_file, poll_interval=0.05, use_inotify=use_inotify) as watcher:
+        later(0.1, os.remove, session_file)
+
+        start = time.monotonic()
+        assert watcher.wait(5) is True
+        assert time.monotonic() - start < 1
+
+
+def test_watcher_uses_inotify_on_linux(session_file):
+    if not os.uname().sysname == "Linux":
+        pytest.skip("inotify is only available on Linux")
+
+    with SessionWatcher(session_file, poll_interval=60) as watcher:
+        assert not watcher.polling
+        later(0.1, os.remove, session_file)
+
+        start = time.monotonic()
+        assert watcher.wait(5) is True
+        assert time.monotonic() - start < 1
+
+
+def test_watcher_is_notified(session_file):
+    with SessionWatcher(session_file, poll_interval=60, use_inotify=False) as watcher:
+        later(0.1, notify, session_file)
+
+        start = time.monotonic()
+        assert watcher.wait(5) is True
+        assert time.monotonic() - start < 1
+
+    assert not os.path.exists(watcher.socket_path)
+
+
+def test_notify_without_watcher(session_file):
+    assert notify(session_file) is False